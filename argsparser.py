@@ -7,6 +7,9 @@ import re
 import argparse
 import sys
 from gitmanager import check_git_dir
+from lib.profiles import profiles
+from lib.profiles import load_profiles
+from lib.profiles import Profile
 
 # TODO: add --dry-run opt to not write to statefile 
 # TODO  argcomplete --> https://github.com/kislyuk/argcomplete
@@ -55,6 +58,84 @@ class CustomArgsCheck:
             self.parser.error(f'Interval \'{interval}\' too small: minimum is 24 hours / 1 day !')
         return converted
         
+    def _check_args_probe(self, probe):
+        """
+        Checking probe interval ('0' or same form as interval plus 'm' for minutes) 
+        and converting to seconds
+        """
+        if probe == '0':
+            return 0
+        pattern = re.compile(r'^(?:\d+(?:m|h|d|w){1})+$')
+        if not pattern.match(probe):
+            self.parser.error(f'\'{probe}\' is not an valid probe interval !')
+        units = { 'm' : 60, 'h' : 3600, 'd' : 86400, 'w' : 604800 }
+        converted = 0
+        for match in re.finditer(r'(\d+)(\w{1})', probe):
+            converted += int(match.group(1)) * units[match.group(2)]
+        if converted < 60:
+            self.parser.error(f'Probe interval \'{probe}\' too small: minimum is 1 minute !')
+        return converted
+        
+    def _check_args_delay(self, delay):
+        """
+        Checking delay is a positive integer (seconds)
+        """
+        try:
+            delay = int(delay)
+        except ValueError:
+            self.parser.error(f'\'{delay}\' is not an valid delay !')
+        if delay < 0:
+            self.parser.error(f'Delay \'{delay}\' should be positive !')
+        return delay
+        
+    def _check_args_debounce(self, debounce):
+        """
+        Checking debounce 'quiet[:max]' (seconds, float) and return tuple (quiet, max)
+        """
+        pattern = re.compile(r'^(\d+(?:\.\d+)?)(?:\:(\d+(?:\.\d+)?))?$')
+        match = pattern.match(debounce)
+        if not match:
+            self.parser.error(f'\'{debounce}\' is not an valid debounce !')
+        quiet = float(match.group(1))
+        maxdelay = float(match.group(2)) if match.group(2) else max(quiet, 5.0)
+        if maxdelay < quiet:
+            self.parser.error(f'Debounce \'{debounce}\': max delay should be greater or equal to quiet period !')
+        return (quiet, maxdelay)
+        
+    def _check_args_repo(self, repo):
+        """
+        Checking repo '[name=]dir' and return tuple (name, dir), name is '' if not specified
+        """
+        name = ''
+        match = re.match(r'^(\w+)=(.+)$', repo)
+        if match:
+            name, repo = match.group(1), match.group(2)
+        elif '=' in repo.split('/')[0]:
+            self.parser.error(f'\'{repo}\': repository name should only contain letters, digits and \'_\' !')
+        return (name, self._check_args_git(repo))
+        
+    def _check_args_profile(self, profile):
+        """
+        Checking profile '[name=]profile' and return tuple (repository name, profile),
+        profile name is checked in parsing() (profiles file could declare it)
+        """
+        match = re.match(r'^(?:(\w+)=)?([\w-]+)$', profile)
+        if not match:
+            self.parser.error(f'\'{profile}\' is not an valid profile !')
+        return (match.group(1) or '', match.group(2))
+        
+    def _check_args_jobs(self, jobs):
+        """
+        Checking jobs is an integer greater or equal to 1
+        """
+        try:
+            jobs = int(jobs)
+        except ValueError:
+            self.parser.error(f'\'{jobs}\' is not an valid number of jobs !')
+        if jobs < 1:
+            self.parser.error(f'Number of jobs \'{jobs}\' should be at least 1 !')
+        return jobs
+        
     def _check_args_git(self, repo):
         """
         Checking if repo is a valid git repo 
@@ -106,16 +187,90 @@ class DaemonParserHandler(CustomArgsCheck):
         git_arg = self.parser.add_argument_group('<git options>')
         git_arg.add_argument('-r', 
                         '--repo', 
-                        help = 'specify git kernel \'dir\' (default=\'/usr/src/linux\').',
-                        default = '/usr/src/linux',
-                        type=self._check_args_git,
-                        metavar = 'dir')
+                        help = 'specify git kernel \'dir\' (default=\'/usr/src/linux\'). Repeat it with'
+                                + ' \'name=dir\' to manage several repositories: each one get its own state'
+                                + ' file, git log and dbus object path (/net/gikeud/Manager/Git/name).',
+                        action = 'append',
+                        type=self._check_args_repo,
+                        metavar = '[name=]dir')
         git_arg.add_argument('-p', 
                         '--pull', 
                         help = 'pull interval. Where \'int\' should be this form: 1w = 1 week, 1d = 1 day and 1h = 1 hour. Can be add together, for exemple: 2w1d12h, 2d1h... Minimum and default are 1d (1 day).',
                         default = 86400,
                         type=self._check_args_interval,
                         metavar = 'int')
+        git_arg.add_argument('-P',
+                        '--probe',
+                        help = 'check remote every \'int\' for new tag(s) or branch(es) (only refs are'
+                                + ' compared, nothing is downloaded) and pull as soon as something changed.'
+                                + ' Same form as pull interval plus \'m\' for minutes, for exemple: 15m, 1h30m.'
+                                + ' 0 = disable (default).',
+                        default = 0,
+                        type = self._check_args_probe,
+                        metavar = 'int')
+        git_arg.add_argument('-k',
+                        '--profile',
+                        help = 'version source profile: \'zen\' (default), \'zen-strict\' (only -zen'
+                                + ' installed kernel(s)), \'mainline\', \'stable\' or one declared with --profiles. It define tag and branch patterns,'
+                                + ' fetched refs and installed kernel (/lib/modules/) mapping.'
+                                + ' Use \'name=profile\' for one repository only.',
+                        action = 'append',
+                        type = self._check_args_profile,
+                        metavar = '[name=]profile')
+        git_arg.add_argument('--profiles',
+                        help = 'JSON file declaring custom profile(s): { "name" : { "tag" : regex,'
+                                + ' "branch" : regex or null, "installed" : regex, "normalize" : [ regex, repl ] } }.'
+                                + ' Each regex must have exactly one group (the version).',
+                        metavar = 'file')
+        git_arg.add_argument('-j',
+                        '--pull-jobs',
+                        help = 'maximum number of git pull running at the same time across'
+                                + ' repositories (default=1).',
+                        default = 1,
+                        type = self._check_args_jobs,
+                        metavar = 'int')
+        git_arg.add_argument('-t',
+                        '--pull-timeout',
+                        help = 'kill git pull after \'sec\' seconds, then retry like a network error'
+                                + ' (0 = no timeout, default=1800).',
+                        default = 1800,
+                        type = self._check_args_delay,
+                        metavar = 'sec')
+        git_arg.add_argument('-F',
+                        '--fetch-only',
+                        help = 'only run \'git fetch\' instead of \'git pull\': the working tree is never'
+                                + ' touched and merging is left to the user.',
+                        action = 'store_true')
+        git_arg.add_argument('-w',
+                        '--debounce',
+                        help = 'coalesce git repository events: refresh once nothing happened for \'quiet\''
+                                + ' seconds, or at most \'max\' seconds after the first event'
+                                + ' (default=0.5:5).',
+                        default = (0.5, 5.0),
+                        type = self._check_args_debounce,
+                        metavar = 'quiet[:max]')
+        # State file options
+        state_arg = self.parser.add_argument_group('<state file options>')
+        state_arg.add_argument('-s',
+                        '--state-delay',
+                        help = 'coalesce state file writes and flush them after \'sec\' seconds'
+                                + ' (0 = write immediately, default=5). Pending writes are always'
+                                + ' flushed on exit.',
+                        default = 5,
+                        type = self._check_args_delay,
+                        metavar = 'sec')
+        state_arg.add_argument('-b',
+                        '--state-backend',
+                        help = 'state file storage backend: \'text\' (default), \'json\' or \'sqlite\'.'
+                                + ' Existing \'text\' state file is migrated on first start.',
+                        default = 'text',
+                        choices = ['text', 'json', 'sqlite'])
+        # Event loop options
+        loop_arg = self.parser.add_argument_group('<event loop options>')
+        loop_arg.add_argument('--single-loop',
+                        help = 'run git watcher and scheduler inside the dbus main loop'
+                                + ' (one thread, git work in a worker) instead of separate threads.',
+                        action = 'store_true')
         # Advanced debug options
         advanced_debug = self.parser.add_argument_group('<advanced debug options>')
         advanced_debug.add_argument('-f',
@@ -125,6 +280,37 @@ class DaemonParserHandler(CustomArgsCheck):
                                     action = 'store_true')
     def parsing(self):
         self.args = self.parser.parse_args()
+        if not self.args.repo:
+            self.args.repo = [ ('', self._check_args_git('/usr/src/linux')) ]
+        names = [ name for name, repo in self.args.repo ]
+        if len(names) > 1 and '' in names:
+            self.parser.error('Repository name is required when managing several repositories (\'name=dir\') !')
+        if not len(set(names)) == len(names):
+            self.parser.error('Repository names should be unique !')
+        # Resolve profile for each repository
+        available = profiles
+        if self.args.profiles:
+            try:
+                available = load_profiles(self.args.profiles)
+            except (OSError, ValueError) as error:
+                self.parser.error(f'Failed to load profiles file \'{self.args.profiles}\': {error} !')
+        default = 'zen'
+        selected = { }
+        for name, profile in self.args.profile or [ ]:
+            if not profile in available:
+                self.parser.error('Unknown profile \'{0}\' (available: {1}) !'.format(profile, 
+                                                                                  ', '.join(available)))
+            if not name:
+                default = profile
+            elif not name in names:
+                self.parser.error(f'Profile \'{name}={profile}\': unknown repository \'{name}\' !')
+            else:
+                selected[name] = profile
+        try:
+            self.args.profile = { name : Profile.from_name(selected.get(name, default), available)
+                                  for name in names }
+        except ValueError as error:
+            self.parser.error(f'{error} !')
         return self.args
 
 # TODO : Interactive shell  : https://code-maven.com/interactive-shell-with-cmd-in-python
@@ -162,6 +348,10 @@ class ClientParserHandler(CustomArgsCheck):
         git_args.add_argument('--reset',
                               action = 'store_true',
                               help = 'Reset pull error so daemon can resume is operation and forced pull.')
+        git_args.add_argument('-r',
+                              '--repo',
+                              metavar = 'name',
+                              help = 'Repository name (when daemon manage several repositories).')
         
         
     def parsing(self):
@@ -169,6 +359,8 @@ class ClientParserHandler(CustomArgsCheck):
         # Print usage if no arg has been given
         noarg = True
         for arg in vars(args):
+            if arg == 'repo':
+                continue
             if getattr(args, arg):
                 noarg = False
                 break
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+import os
+import re
+import sys
+import time
+import signal
+import threading
+import selectors
+import subprocess
+import logging
+
+from collections import deque
+
+try:
+    import git
+except Exception as exc:
+    # Print to stderr
+    print(f'Error: unexcept error while loading module: {exc}', file=sys.stderr)
+    print('Error: exiting with status \'1\'.', file=sys.stderr)
+    sys.exit(1)
+
+
+class GitTimeoutError(git.GitCommandError):
+    """Git command killed after timeout (see GitBackend.run())"""
+    pass
+
+
+# Line end(s) in git output: progress update(s) end with '\r'
+_eol_re = re.compile(rb'\r\n|\n|\r')
+
+
+# One backend per repository, shared across the whole process
+_pool = { }
+_pool_lock = threading.Lock()
+
+
+def get_backend(directory):
+    """Return the shared GitBackend for repository 'directory' (create it if needed)"""
+    key = os.path.realpath(directory)
+    with _pool_lock:
+        if not key in _pool:
+            _pool[key] = GitBackend(key)
+        return _pool[key]
+
+
+class GitBackend:
+    """
+    Long-lived git repository backend: reuse the same git.Repo object and keep
+    a persistent 'git cat-file --batch-check' process, restarted if it dies.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        # Init logger
+        self.logger_name = f'::{__name__}::GitBackend::'
+        self.lock = threading.Lock()
+        self.__repo = None
+        self.__batch = None
+        # Spawned git process(es) counter
+        self.stats = {
+            'spawned'   :   0,  # all process(es) spawned (one shot + persistent)
+            'commands'  :   0,  # one shot command(s)
+            'restarted' :   0   # persistent process restarted because it died
+            }
+
+
+    @property
+    def repo(self):
+        """
+        Return the git.Repo object, discover the repository only once.
+        Raise git.InvalidGitRepositoryError or git.NoSuchPathError.
+        """
+        if self.__repo is None:
+            self.__repo = git.Repo(self.directory)
+        return self.__repo
+
+
+    def run(self, *args, timeout=None, on_start=None, input=None):
+        """
+        Run one git command (ex: run('pull')) in its own process group and return its output.
+        The whole group is killed after 'timeout' seconds (None = no timeout).
+        on_start(process) is called once started (so it could be killed, see kill()).
+        input: str written to git stdin (ex: 'update-ref --stdin').
+        Raise git.GitCommandError on failure, GitTimeoutError on timeout.
+        """
+        logger = logging.getLogger(f'{self.logger_name}run::')
+        
+        command = ['git', *args]
+        with self.lock:
+            self.stats['spawned'] += 1
+            self.stats['commands'] += 1
+        # New session: git spawn children (fetch, ssh...) which have to be killed too
+        process = subprocess.Popen(command, cwd=self.directory,
+                                   stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   universal_newlines=True, start_new_session=True)
+        logger.debug('Running: \'{0}\' (pid: {1}, timeout: {2}).'.format(' '.join(command), process.pid, timeout))
+        if on_start:
+            on_start(process)
+        try:
+            stdout, stderr = process.communicate(input=input, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            logger.error('Killing \'{0}\' (pid: {1}) after {2}s.'.format(' '.join(command), process.pid, timeout))
+            self.kill(process)
+            stdout, stderr = process.communicate()
+            raise GitTimeoutError(command, 'timeout', f'timed out after {timeout}s', stdout)
+        if process.returncode:
+            raise git.GitCommandError(command, process.returncode, stderr.rstrip('\n'), stdout)
+        return stdout.rstrip('\n')
+
+
+    def stream(self, *args, timeout=None, on_start=None, on_line=None, tail=20, maxline=4096):
+        """
+        Like run() but output is never accumulated: stdout and stderr are read as they
+        arrive and each line is passed to on_line(line, progress) (progress: True if
+        line ended with '\\r', ex: git --progress update). Line(s) longer than 'maxline'
+        are split. Only the last 'tail' stderr line(s) are kept (for the error message).
+        Raise git.GitCommandError on failure, GitTimeoutError on timeout.
+        """
+        logger = logging.getLogger(f'{self.logger_name}stream::')
+        
+        command = ['git', *args]
+        with self.lock:
+            self.stats['spawned'] += 1
+            self.stats['commands'] += 1
+        process = subprocess.Popen(command, cwd=self.directory, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   start_new_session=True)
+        logger.debug('Streaming: \'{0}\' (pid: {1}, timeout: {2}).'.format(' '.join(command), process.pid, timeout))
+        if on_start:
+            on_start(process)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        errors = deque(maxlen=tail)
+        # key: pipe, value: pending partial line (at most 'maxline' bytes)
+        pending = { process.stdout : b'', process.stderr : b'' }
+        with selectors.DefaultSelector() as selector:
+            for pipe in pending:
+                selector.register(pipe, selectors.EVENT_READ)
+            while selector.get_map():
+                remain = None if deadline is None else deadline - time.monotonic()
+                if remain is not None and remain <= 0:
+                    logger.error('Killing \'{0}\' (pid: {1}) after {2}s.'.format(' '.join(command), 
+                                                                             process.pid, timeout))
+                    self.kill(process)
+                    process.wait()
+                    for pipe in pending:
+                        pipe.close()
+                    raise GitTimeoutError(command, 'timeout', f'timed out after {timeout}s', 
+                                          '\n'.join(errors))
+                for key, mask in selector.select(remain):
+                    pipe = key.fileobj
+                    chunk = os.read(pipe.fileno(), 65536)
+                    if not chunk:
+                        selector.unregister(pipe)
+                        lines = [ (pending[pipe], b'') ] if pending[pipe] else [ ]
+                        pending[pipe] = b''
+                    else:
+                        lines, pending[pipe] = self.__split(pending[pipe] + chunk, maxline)
+                    for line, end in lines:
+                        line = line.decode(errors='replace')
+                        if pipe is process.stderr and not end == b'\r':
+                            errors.append(line)
+                        if on_line:
+                            on_line(line, end == b'\r')
+        for pipe in pending:
+            pipe.close()
+        if process.wait():
+            raise git.GitCommandError(command, process.returncode, '\n'.join(errors))
+    
+    
+    @staticmethod
+    def __split(data, maxline):
+        """Split data into complete (line, end) and return them with the remaining partial line"""
+        lines = [ ]
+        start = 0
+        for match in _eol_re.finditer(data):
+            lines.append((data[start:match.start()], match.group()))
+            start = match.end()
+        rest = data[start:]
+        while len(rest) > maxline:
+            lines.append((rest[:maxline], b''))
+            rest = rest[maxline:]
+        return lines, rest
+
+
+    @staticmethod
+    def kill(process):
+        """Kill process group started by run()"""
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+    def resolve(self, *names):
+        """
+        Resolve object name(s) (sha, ref...) using the persistent process
+        and return a dict with key: name and value: (sha, type, size) or None if missing.
+        """
+        logger = logging.getLogger(f'{self.logger_name}resolve::')
+
+        resolved = { }
+        with self.lock:
+            for name in names:
+                # Retry once if the process died in between
+                for attempt in 1, 2:
+                    batch = self.__get_batch()
+                    try:
+                        batch.stdin.write(f'{name}\n')
+                        batch.stdin.flush()
+                        line = batch.stdout.readline()
+                    except (OSError, ValueError) as error:
+                        logger.debug(f'Persistent process failed: {error}.')
+                        line = ''
+                    if line:
+                        break
+                    # EOF: it died, so reap it and restart on next attempt
+                    self.__stop_batch()
+                else:
+                    logger.error(f'Failed to resolve \'{name}\' using persistent git process.')
+                    resolved[name] = None
+                    continue
+                fields = line.split()
+                if len(fields) == 3 and not fields[1] == 'missing':
+                    resolved[name] = (fields[0], fields[1], int(fields[2]))
+                else:
+                    resolved[name] = None
+        return resolved
+
+
+    def close(self):
+        """Stop persistent process and release repository"""
+        with self.lock:
+            self.__stop_batch()
+            if self.__repo is not None:
+                self.__repo.close()
+                self.__repo = None
+
+
+    def __get_batch(self):
+        """Return the persistent process, (re)start it if needed"""
+        logger = logging.getLogger(f'{self.logger_name}__get_batch::')
+
+        if self.__batch is not None and self.__batch.poll() is not None:
+            logger.warning('Persistent git process died (exit status: {0}),'.format(self.__batch.returncode)
+                           + ' restarting.')
+            self.stats['restarted'] += 1
+            self.__stop_batch()
+        if self.__batch is None:
+            self.__batch = subprocess.Popen(['git', 'cat-file', '--batch-check'], cwd=self.directory,
+                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                            stderr=subprocess.DEVNULL, universal_newlines=True, bufsize=1)
+            self.stats['spawned'] += 1
+            logger.debug('Started persistent git process (pid: {0}, spawned: {1}).'.format(self.__batch.pid,
+                                                                                         self.stats['spawned']))
+        return self.__batch
+
+
+    def __stop_batch(self):
+        """Terminate and reap persistent process"""
+        if self.__batch is None:
+            return
+        try:
+            self.__batch.stdin.close()
+        except (OSError, ValueError):
+            pass
+        try:
+            self.__batch.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.__batch.kill()
+            self.__batch.wait()
+        self.__batch = None
@@ -7,6 +7,13 @@ import sys
 from gitmanager import GitHandler
 import logging
 
+try:
+    from pydbus.generic import signal
+except Exception as exc:
+    print(f'Error: unexcept error while loading dbus bindings: {exc}', file=sys.stderr)
+    print('Error: exiting with status \'1\'.', file=sys.stderr)
+    sys.exit(1)
+
 # TODO try to return list / dict over str ?? 
 
 class GitDbus(GitHandler):
@@ -23,22 +30,57 @@ class GitDbus(GitHandler):
                     <arg type='s' name='branch_subkey' direction='in'/>
                     <arg type='s' name='response' direction='out'/>
                 </method>
+                <method name='get_latest_version'>
+                    <arg type='s' name='target' direction='in'/>
+                    <arg type='s' name='response' direction='out'/>
+                </method>
+                <method name='count_available_update'>
+                    <arg type='s' name='target' direction='in'/>
+                    <arg type='i' name='response' direction='out'/>
+                </method>
+                <method name='get_last_changes'>
+                    <arg type='s' name='option' direction='in'/>
+                    <arg type='(asasi)' name='response' direction='out'/>
+                </method>
+                <method name='get_watcher_stats'>
+                    <arg type='a{sd}' name='response' direction='out'/>
+                </method>
+                <method name='request_pull'>
+                    <arg type='s' name='response' direction='out'/>
+                </method>
+                <method name='get_pull_job'>
+                    <arg type='s' name='job_id' direction='in'/>
+                    <arg type='a{ss}' name='response' direction='out'/>
+                </method>
+                <method name='cancel_pull_job'>
+                    <arg type='s' name='job_id' direction='in'/>
+                    <arg type='b' name='response' direction='out'/>
+                </method>
                 <method name='reset_pull_error'>
                     <arg type='s' name='response' direction='out'/>
                 </method>
+                <property name='pull_progress' type='a{ss}' access='read'>
+                    <annotation name='org.freedesktop.DBus.Property.EmitsChangedSignal' value='true'/>
+                </property>
             </interface>
         </node>
     """
+    # Emitted when pull_progress change
+    PropertiesChanged = signal()
+    
     def __init__(self, **kwargs):
         # Delegate kwargs arguments checking in GitHandler (gitmanager module)
         super().__init__(**kwargs)
         # check if we have pull_state (from gitmanager -> GitWatcher object)
         # This intend to detect external (but also internal) git pull running
         self.pull_state = False #kwargs.get('pull_state', 'disabled')
+        # GitWatcher object (for statistics)
+        self.watcher = kwargs.get('watcher')
         # Init logger (even if there is already a logger in GitHandler)
         # better to have a separate logger
         # Don't override self.logger_name from GitHandler
-        self.named_logger = f'::{__name__}::GitDbus::'
+        self.named_logger = f'::{__name__}::GitDbus::' + (f"{self.pathdir['name']}::" 
+                                                          if self.pathdir.get('name') else '')
         logger = logging.getLogger(f'{self.named_logger}init::')
     
 
@@ -49,6 +91,8 @@ class GitDbus(GitHandler):
         logger = logging.getLogger(f'{self.named_logger}get_kernel_attributes::')
         logger.debug(f'Requesting: {key} | {subkey}')
         
+        if key == 'available' and subkey == 'None':
+            return self.__get_available('kernel')
         if subkey == 'None':
             logger.debug('Returning: {0} (as string).'.format(' '.join(self.kernel[key])))
             return str(' '.join(self.kernel[key]))
@@ -63,6 +107,8 @@ class GitDbus(GitHandler):
         logger = logging.getLogger(f'{self.named_logger}get_branch_attributes::')
         logger.debug(f'Requesting: {key} | {subkey}')
         
+        if key == 'available' and subkey == 'None':
+            return self.__get_available('branch')
         if subkey == 'None':
             logger.debug('Returning: {0} (as string).'.format(' '.join(self.branch[key])))
             return str(' '.join(self.branch[key]))
@@ -70,6 +116,138 @@ class GitDbus(GitHandler):
         return str(' '.join(self.branch[key][subkey]))
     
 
+    def get_latest_version(self, target):
+        """
+        Retrieve greatest known version for target ('kernel' or 'branch') and return through dbus
+        """
+        logger = logging.getLogger(f'{self.named_logger}get_latest_version::')
+        logger.debug(f'Requesting: {target}')
+        
+        latest = self._get_versions(target).latest() or '0.0.0'
+        logger.debug(f'Returning: {latest}.')
+        return latest
+    
+
+    def count_available_update(self, target):
+        """
+        Retrieve how many update are available for target ('kernel' or 'branch') and return through dbus
+        """
+        logger = logging.getLogger(f'{self.named_logger}count_available_update::')
+        logger.debug(f'Requesting: {target}')
+        
+        count = self._get_versions(target).count_newer(self._get_origin(target))
+        logger.debug(f'Returning: {count}.')
+        return count
+    
+
+    def __get_available(self, target):
+        """
+        Return available update for target from the sorted index (as string)
+        """
+        logger = logging.getLogger(f'{self.named_logger}get_available::')
+        
+        available = str(self._get_versions(target).greater_than(self._get_origin(target)))
+        # Keep factory value so client know there is nothing
+        if not available:
+            available = '0.0.0'
+        logger.debug(f'Returning: {available} (as string).')
+        return available
+    
+
+    def get_last_changes(self, option):
+        """
+        Retrieve last change of a version list (option is the state file option,
+        ex: 'kernel all') and return (added, removed, unchanged count) through dbus
+        """
+        logger = logging.getLogger(f'{self.named_logger}get_last_changes::')
+        logger.debug(f'Requesting: {option}')
+        
+        delta = self.changes.get(option)
+        if not delta:
+            logger.debug('Returning: nothing changed since start up.')
+            return ([ ], [ ], 0)
+        logger.debug(f'Returning: {delta}.')
+        return (delta.added, delta.removed, delta.unchanged)
+    
+
+    def get_watcher_stats(self):
+        """
+        Retrieve git watcher debounce statistics (events, bursts, refreshes, ratio)
+        and return through dbus
+        """
+        logger = logging.getLogger(f'{self.named_logger}get_watcher_stats::')
+        logger.debug('Got request.')
+        
+        if self.watcher is None:
+            logger.debug('Returning: nothing (no watcher).')
+            return { }
+        stats = { key : float(value) for key, value in self.watcher.get_stats().items() }
+        logger.debug(f'Returning: {stats}.')
+        return stats
+    
+
+    def request_pull(self):
+        """
+        Force git pull now (whatever the interval) and return the job id through dbus,
+        or 'running' if pull is running outside the daemon, 'failed' if pull error should be reset first
+        """
+        logger = logging.getLogger(f'{self.named_logger}request_pull::')
+        logger.debug('Got request.')
+        
+        if self.pull_state and not self.pull['status']:
+            logger.debug('Failed: already running (external).')
+            return 'running'
+        if self.pull['state'] == 'Failed' and not self.pull['network_error']:
+            logger.debug('Failed: pull error should be reset first.')
+            return 'failed'
+        # Already queued / running job is returned
+        job = self.jobs.submit('dbus')
+        logger.debug(f'Returning: {job.id}.')
+        return job.id
+    
+
+    def get_pull_job(self, job_id):
+        """
+        Retrieve pull job informations (id, trigger, state, triggers, created, started, finished)
+        and return through dbus (empty if unknown)
+        """
+        logger = logging.getLogger(f'{self.named_logger}get_pull_job::')
+        logger.debug(f'Requesting: {job_id}')
+        
+        job = self.jobs.get(job_id)
+        if job is None:
+            logger.debug('Returning: nothing (unknown job).')
+            return { }
+        logger.debug(f'Returning: {job.to_dict()}.')
+        return job.to_dict()
+    
+
+    def cancel_pull_job(self, job_id):
+        """
+        Cancel queued pull job or kill running one and return True on success through dbus
+        """
+        logger = logging.getLogger(f'{self.named_logger}cancel_pull_job::')
+        logger.debug(f'Requesting: {job_id}')
+        
+        cancelled = self.jobs.cancel(job_id)
+        logger.debug(f'Returning: {cancelled}.')
+        return cancelled
+    
+
+    @property
+    def pull_progress(self):
+        """
+        Git pull progress (phase, percent, objects, total, bytes, throughput, done, updated),
+        empty when not pulling
+        """
+        return self.progress
+    
+    
+    def _publish_progress(self, progress):
+        """Emit PropertiesChanged for pull_progress (called from the owner thread)"""
+        self.PropertiesChanged('net.gikeud.Manager.Git', { 'pull_progress' : progress }, [ ])
+    
+
     def reset_pull_error(self):
         """
         Reset pull error and forced pull
@@ -101,5 +279,7 @@ class GitDbus(GitHandler):
         logger.debug('Succeed: error reseted.')
         logger.warning('Resetting pull error as requested by dbus client.')
         self.pull['state'] = 'Success'
-        self.stateinfo.save('pull state', 'pull state: Success')
+        self.stateinfo.save(['pull state', 'Success'])
+        # Pull was postponed while Failed: recompute remain now (see MainDaemon.handle())
+        self.scheduler.schedule('pull', 0)
         return 'done'
@@ -9,18 +9,35 @@ import os
 import sys
 import pathlib
 import shutil
+import fnmatch
 import errno
 import platform
 import time
 import threading
-import uuid
+import selectors
 import logging
 
 from collections import OrderedDict 
-from distutils.version import StrictVersion
+from collections import namedtuple
+from collections import deque
+from lib.version import parse_version
+from lib.version import diff_versions
+from lib.version import VersionSet
+from lib.version import VersionDelta
 from lib.utils import StateInfo
 from lib.utils import FormatTimestamp
+from lib.gitrefs import RefStore
+from lib.gitrefs import refspecs
+from lib.scheduler import Scheduler
+from lib.gitevents import classify
+from lib.gitprogress import parse_progress
+from lib.profiles import Profile
+from lib.gitevents import targets
+from lib.gitevents import watched_refs
 from lib.logger import ProcessLoggingHandler
+from gitbackend import get_backend
+from gitbackend import GitTimeoutError
+from pulljob import PullJobManager
 
 try:
     import inotify_simple
@@ -50,10 +67,10 @@ class GitHandler:
                 sys.exit(1)
                 
         self.pathdir = kwargs.get('pathdir')
-        self.repo = kwargs.get('repo')
         
-        # Init logger
-        self.logger_name = f'::{__name__}::GitHandler::'
+        # Init logger (with repository name when managing several repositories)
+        self.logger_name = f'::{__name__}::GitHandler::' + (f"{self.pathdir['name']}::" 
+                                                            if self.pathdir.get('name') else '')
         logger = logging.getLogger(f'{self.logger_name}init::')
         
         # compatibility for python < 3.7 (dict is not ordered)
@@ -103,7 +120,13 @@ class GitHandler:
         
         
         # Init save/load info file 
-        self.stateinfo = StateInfo(pathdir=self.pathdir, stateopts=default_stateopts)
+        # Write-behind delay (0 = write immediately)
+        # Backend: 'text', 'json' or 'sqlite', listopts are stored as list (json / sqlite)
+        self.stateinfo = StateInfo(pathdir=self.pathdir, stateopts=default_stateopts, 
+                                   delay=kwargs.get('state_delay', 0),
+                                   backend=kwargs.get('state_backend', 'text'),
+                                   listopts=('branch all local', 'branch all remote', 'branch available',
+                                             'kernel all', 'kernel installed all', 'kernel available'))
         if self.stateinfo.newfile:
             # Don't need to load from StateInfo as it just create file and
             # add default_stateopts from here
@@ -114,12 +137,26 @@ class GitHandler:
             # it's done auto by class StateInfo
             loaded_stateopts = self.stateinfo.load()
         
-        # Check git config file
-        self.__check_config()
-        
         # Init FormatTimestamp
         self.format_timestamp = FormatTimestamp()
         
+        # Long-lived git backend (shared with check_git_dir())
+        self.backend = get_backend(self.pathdir['repo'])
+        
+        # Version source profile (see lib/profiles.py): tag / branch patterns,
+        # fetched ref(s) and installed kernel mapping
+        self.profile = kwargs.get('profile') or Profile.from_name('zen')
+        logger.debug(f'Using profile: \'{self.profile.name}\'.')
+        # Read tags and branches directly from the repository (one pass)
+        # key: kind and value: regex relative to 'refs/' with one group (the version)
+        self.refs = RefStore(self.pathdir['repo'] + '.git/', self.profile.patterns)
+        # Fetch only the remote ref(s) consumed by the patterns above (see __check_config())
+        self.remote = 'origin'
+        self.refspecs = refspecs(self.profile.globs, self.remote)
+        
+        # Check git config file
+        self.__check_config()
+        
         # Pull attributes
         self.pull = {
             'status'        :   False, # False when not running / True otherwise
@@ -130,17 +167,33 @@ class GitHandler:
                                                                           #  not int' or  vice versa
             'current_count' :   0,   
             'last'          :   loaded_stateopts.get('pull last'),   # last pull timestamp
-            'remain'        :   0,
-            'elapsed'       :   0,
             'interval'      :   kwargs.get('interval'),
+            # Only 'git fetch': working tree is never touched, merging is left to the user
+            'fetch_only'    :   kwargs.get('fetch_only', False),
+            # Probe remote every 'probe' seconds and pull only if something changed (0 = disable)
+            'probe'         :   kwargs.get('probe', 0),
             #'update_all'    :   False,   # True after pull or if detected pull's outside run
             'recompute'     :   False   # True if remain as to be recompute
             }
+        # Pull deadlines ('pull' and 'retry' jobs): remain / elapsed are read from here
+        self.scheduler = kwargs.get('scheduler', Scheduler())
+        # Function(s) queued by the pull worker for the owner thread (see dispatch())
+        self.pending = deque()
+        # Run pull_job() in a dedicated worker, git is killed after timeout (0 = no timeout)
+        self.jobs = PullJobManager(self.pull_job, timeout=kwargs.get('pull_timeout', 0) or None,
+                                   notify=self.scheduler.notify, probe=self.probe,
+                                   executor=kwargs.get('executor'))
+        if self.pull['probe']:
+            self.scheduler.schedule('probe', self.pull['probe'])
+        # Latest parsed git progress while pulling (empty otherwise, see _publish_progress())
+        self.progress = { }
         
-        # 'Main remain' 
-        self.remain = 30
-        # Authorized update or not 
-        self.update = True
+        # Last change (VersionDelta) for each version list
+        # key is the state file option (ex: 'kernel all')
+        self.changes = { }
+        # Matching ref(s) known by the last refresh_from_fetch() (key: name, value: sha),
+        # None until the first one (full refresh)
+        self.snapshot = None
         
         # Git branch attributes
         self.branch = {
@@ -148,20 +201,20 @@ class GitHandler:
             # all means from state file
             'all'   :   {
                 # 'local' is branch locally checkout (git checkout)
-                'local'     :   sorted(loaded_stateopts.get('branch all local').split(), key=StrictVersion),
+                'local'     :   VersionSet.from_string(loaded_stateopts.get('branch all local')),
                 # 'remote' is all available branch from remote repo (so including 'local' as well).
-                'remote'    :   sorted(loaded_stateopts.get('branch all remote').split(), key=StrictVersion)
+                'remote'    :   VersionSet.from_string(loaded_stateopts.get('branch all remote'))
                 },
-            'available'   :  sorted(loaded_stateopts.get('branch available').split(), key=StrictVersion) # {
+            'available'   :  VersionSet.from_string(loaded_stateopts.get('branch available'))
             }
         
         # Git kernel attributes
         self.kernel = {
             'logflow'       :   True, # Flow control over logger.info
             # 'all' means all kernel version from git tag command
-            'all'           :   sorted(loaded_stateopts.get('kernel all').split(), key=StrictVersion),
+            'all'           :   VersionSet.from_string(loaded_stateopts.get('kernel all')),
             # 'available' means update available
-            'available'     :   sorted(loaded_stateopts.get('kernel available').split(), key=StrictVersion),
+            'available'     :   VersionSet.from_string(loaded_stateopts.get('kernel available')),
             # 'installed' means compiled and installed into the system
             'installed'     :   {
                 # 'running' is from `uname -r' command
@@ -170,10 +223,13 @@ class GitHandler:
                 # /lib/modules should be clean up when removing old kernel...
                 # TODO: get mtime for each folder in /lib/modules and print an warning if folder is older than ???
                 # with mtime we can know when 
-                'all'       :   sorted(loaded_stateopts.get('kernel installed all').split(), key=StrictVersion)
+                'all'       :   VersionSet.from_string(loaded_stateopts.get('kernel installed all'))
                 }
             # TODO : add 'compiled' key : to get last compiled kernel (time)
             }
+        # '/lib/modules/' folder name -> installed version (several folder(s) could
+        # map to the same version), filled by get_installed_kernel()
+        self.installed_folders = None
     
     
     def get_running_kernel(self):
@@ -184,11 +240,11 @@ class GitHandler:
         try:
             running = re.search(r'([\d\.]+)', platform.release()).group(1)
             # Check if we get valid version
-            StrictVersion(running)
+            parse_version(running)
         except ValueError as err:
             logger.error(f'Got invalid version number while getting current running kernel:')
             logger.error(f'\'{err}\'.')
-            if StrictVersion(self.kernel['installed']['running']) == StrictVersion('0.0'):
+            if parse_version(self.kernel['installed']['running']) == parse_version('0.0'):
                 logger.error(f'Previously know running kernel version is set to factory.')
                 logger.error(f'The list of available update kernel version should be false.')
             else:
@@ -196,7 +252,7 @@ class GitHandler:
         except Exception as exc:
             logger.error(f'Got unexcept error while getting current running kernel version:')
             logger.error(f'\'{exc}\'')
-            if StrictVersion(self.kernel['installed']['running']) == StrictVersion('0.0'):
+            if parse_version(self.kernel['installed']['running']) == parse_version('0.0'):
                 logger.error(f'Previously know running kernel version is set to factory.')
                 logger.error(f'The list of available update kernel version should be false.')
             else:
@@ -206,7 +262,7 @@ class GitHandler:
             logger.debug(f'Got base version: \'{running}\'.')
             
             # Don't write every time to state file 
-            if not StrictVersion(self.kernel['installed']['running']) == StrictVersion(running):
+            if not parse_version(self.kernel['installed']['running']) == parse_version(running):
                 # Be a little more verbose for logger.info
                 logger.info('Running kernel have changed (from {0} '.format(self.kernel['installed']['running'])
                               + f'to {running}).')
@@ -224,14 +280,16 @@ class GitHandler:
         logger.debug('Extracting from /lib/modules/.')
         try:
             subfolders = [ ]
+            folders = { }
             # WARNING be carfull this was added in 3.6 !!
             with os.scandir('/lib/modules/') as listdir:
                 for folder in listdir:
                     if folder.is_dir():
-                        if re.search(r'([\d\.]+)', folder.name):
+                        # Only kernel(s) from this profile (ex: '5.6.1-zen1' for zen)
+                        version = self.profile.installed(folder.name)
+                        if version:
                             try:
-                                version = re.search(r'([\d\.]+)', folder.name).group(1)
-                                StrictVersion(version)
+                                parse_version(version)
                             except Exception as err:
                                 logger.error(f'While inspecting {folder.path} (version: {version})'
                                             + f', got: {err} ...skipping.')
@@ -243,6 +301,7 @@ class GitHandler:
                             else:
                                 logger.debug(f'Found version: {version}.')
                                 subfolders.append(version)
+                                folders[folder.name] = version
         except OSError as error:
             if error.errno == errno.EPERM or error.errno == errno.EACCES:
                 logger.critical(f'Error while reading directory: {error.strerror}: {error.filename}.')
@@ -255,8 +314,8 @@ class GitHandler:
         except Exception as exc:
             logger.error('Got unexcept error while getting installed kernel version list.')
             logger.error(f'{exc}.')
-            if StrictVersion(self.kernel['installed']['all'][0]) == StrictVersion('0.0') \
-                or StrictVersion(self.kernel['installed']['all'][0]) == StrictVersion('0.0.0'):
+            if (not self.kernel['installed']['all'] 
+                or parse_version(self.kernel['installed']['all'][0]) == parse_version('0.0')):
                 logger.error('Previously list is empty.')
             else:
                 logger.error('Keeping previously list.')
@@ -264,84 +323,79 @@ class GitHandler:
             return
             
         
-        # sort
-        subfolders.sort(key=StrictVersion)
+        self.installed_folders = folders
+        if not subfolders:
+            # Normal with a narrowing profile (ex: 'zen-strict'): keep factory version
+            logger.warning(f'No \'{self.profile.name}\' installed kernel found in /lib/modules/.')
+            subfolders = [ '0.0' ]
+        # Sorted and without duplicate
+        subfolders = VersionSet(subfolders)
         
-        if self._compare_multidirect(self.kernel['installed']['all'], subfolders, 'installed kernel'):
+        if self._track_change('kernel installed all', self.kernel['installed']['all'], subfolders, 
+                              'installed kernel'):
             # Adding list to self.kernel
-            logger.debug('Adding to the list: {0}.'.format(' '.join(subfolders)))
+            logger.debug(f'Adding to the list: {subfolders}.')
             self.kernel['installed']['all'] = subfolders
             
             # Update state file
-            self.stateinfo.save(['kernel installed all', ' '.join(self.kernel['installed']['all'])])
+            self.stateinfo.save(['kernel installed all', str(self.kernel['installed']['all'])])
         # Else keep previously list 
   
   
     def update_installed_kernel(self, deleted=[], added=[]):
-        """Remove or add new installed kernel while running"""
+        """
+        Remove or add new installed kernel while running, a version is removed
+        only when the last folder providing it is deleted.
+        """
         
         logger = logging.getLogger(f'{self.logger_name}update_installed_kernel::')
         
-        kernel_list = self.kernel['installed']['all'].copy()
-        
         if not deleted and not added:
             logger.debug('There is nothing to do...')
             return
-        if deleted:
-            for folder in deleted:
-                try:
-                    version = re.search(r'([\d\.]+)', folder).group(1)
-                    StrictVersion(version)
-                except ValueError as err:
-                    logger.error(f'While inspecting {folder} (version: {version}), got: {err} ...skipping.')
-                    continue
-                except Exception as exc:
-                    logger.error(f'While inspecting {folder} (version: {version})' 
-                                   + f', got unexcept: {err} ...skipping.')
-                    continue
-                else:
-                    logger.debug(f'Removing version: {version} (folder: {folder}).')
-                    try:
-                        kernel_list.remove(version)
-                    except ValueError as err:
-                        logger.error(f'Got ValueError when removing version {version}' +
-                                       'from kernel installed list.')
-                        continue
-                    else:
-                        logger.debug('Version: {0} removed (list: {1})'.format(version, 
-                                                                 ', '.join(kernel_list)))
-        if added:
-            for folder in added:
-                try:
-                    version = re.search(r'([\d\.]+)', folder).group(1)
-                    StrictVersion(version)
-                except ValueError as err:
-                    logger.error(f'While inspecting {folder} (version: {version}), got: {err} ...skipping.')
-                    continue
-                except Exception as exc:
-                    logger.error(f'While inspecting {folder} (version: {version})' 
-                                   + f', got unexcept: {err} ...skipping.')
-                    continue
-                else:
-                    logger.debug(f'Adding version: {version} (folder: {folder}).')
-                    kernel_list.append(version)
-                    logger.debug('Version: {0} added (list: {1})'.format(version, 
-                                                           ', '.join(kernel_list)))
+        if self.installed_folders is None:
+            # Never scanned: folder(s) providing each version are unknown
+            logger.debug('Installed folder(s) unknown, rescanning.')
+            self.get_installed_kernel()
+            return
+        
+        kernel_list = self.kernel['installed']['all'].copy()
+        # Factory version is replaced by the first installed one
+        kernel_list.discard('0.0')
+        for folder in deleted:
+            version = self.installed_folders.pop(folder, None)
+            if version is None:
+                logger.debug(f'Skipping {folder}: not a known \'{self.profile.name}\' kernel folder.')
+                continue
+            if any(parse_version(other) == parse_version(version) for other in self.installed_folders.values()):
+                logger.debug(f'Keeping version: {version} (folder: {folder} removed,'
+                             + ' still provided by another folder).')
+                continue
+            logger.debug(f'Removing version: {version} (folder: {folder}).')
+            kernel_list.discard(version)
+        for folder in added:
+            version = self.profile.installed(folder)
+            if version is None:
+                logger.debug(f'Skipping {folder}: not a \'{self.profile.name}\' kernel.')
+                continue
+            try:
+                parse_version(version)
+            except ValueError as err:
+                logger.error(f'While inspecting {folder} (version: {version}), got: {err} ...skipping.')
+                continue
+            logger.debug(f'Adding version: {version} (folder: {folder}).')
+            self.installed_folders[folder] = version
+            # Sorted insert
+            kernel_list.add(version)
         # Make sure we have something 
-        if kernel_list:
-            # Remove duplicate
-            kernel_list = list(dict.fromkeys(kernel_list))
-            kernel_list.sort(key=StrictVersion)
-            
-            if self._compare_multidirect(self.kernel['installed']['all'], kernel_list, 'installed kernel'):
-                logger.debug('Kernel installed list have been updated.')
-                self.kernel['installed']['all'] = kernel_list
-                self.stateinfo.save(['kernel installed all', ' '.join(self.kernel['installed']['all'])])
-            else:
-                # This is not fatal but this shouldn't arrived
-                logger.debug('Both list are equal !!' 
-                            + ' (Old: {0} '.format(', '.join(self.kernel['installed']['all']))
-                            + '| new: {0}).'.format(', '.join(kernel_list)))
+        if not kernel_list:
+            logger.debug('No installed kernel left, using factory version.')
+            kernel_list.add('0.0')
+        if self._track_change('kernel installed all', self.kernel['installed']['all'], kernel_list, 
+                              'installed kernel'):
+            logger.debug('Kernel installed list have been updated.')
+            self.kernel['installed']['all'] = kernel_list
+            self.stateinfo.save(['kernel installed all', str(self.kernel['installed']['all'])])
         else:
             logger.debug('Nothing more to do...')
                     
@@ -351,43 +405,33 @@ class GitHandler:
         
         logger = logging.getLogger(f'{self.logger_name}get_all_kernel::')
         
-        # First get all tags from git (tags = versions)
+        # First get all tags (tags = versions)
         try:
-            myprocess = git.Repo(self.pathdir['repo']).git.tag('-l').splitlines()
-        except Exception as exc:
-            err = exc.stderr
-            # Try to strip off the formatting GitCommandError puts on stderr
-            match = re.search(r"stderr: '(.*)'", err)
-            if match:
-                err = match.group(1)
+            versions = [ self.profile.normalize(version) for version in self.refs.scan()['kernel'] ]
+        except OSError as error:
             logger.error(f'Got unexcept error while getting available git kernel version.')
-            logger.error(f'{err}.')
+            logger.error(f'{error}.')
             # Don't exit just keep previously list
-            if StrictVersion(self.kernel['available']['all'][0]) == StrictVersion('0.0') \
-                or StrictVersion(self.kernel['available']['all'][0]) == StrictVersion('0.0.0'):
+            if parse_version(self.kernel['all'][0]) == parse_version('0.0'):
                 logger.error('Previously list is empty, available git kernel update list should be wrong.')
             else:
                 logger.error('Keeping previously list.')
             return
 
         versionlist = [ ]
-        for line in myprocess:
-            # TODO make 'zen' independent ??
-            if re.match(r'^v([\d\.]+)-zen.*$', line):
-                version = re.match(r'^v([\d\.]+)-zen.*$', line).group(1)
-                try:
-                    StrictVersion(version)
-                except ValueError as err:
-                    logger.error('While searching for available git kernel version.')
-                    logger.error(f'Got: {err}. Skipping...')
-                else:
-                    # List is really too looong ...
-                    logger.debug(f'Found version : {version}')
-                    versionlist.append(version)
+        for version in versions:
+            try:
+                parse_version(version)
+            except ValueError as err:
+                logger.error('While searching for available git kernel version.')
+                logger.error(f'Got: {err}. Skipping...')
+            else:
+                # List is really too looong ...
+                logger.debug(f'Found version : {version}')
+                versionlist.append(version)
         
         if not versionlist:
-            if StrictVersion(self.kernel['available']['all'][0]) == StrictVersion('0.0') \
-                or StrictVersion(self.kernel['available']['all'][0]) == StrictVersion('0.0.0'):
+            if parse_version(self.kernel['all'][0]) == parse_version('0.0'):
                 logger.error('Current and previously git kernel list version are empty.')
                 logger.error('Available git kernel update list should be wrong.')
             else:
@@ -397,19 +441,17 @@ class GitHandler:
         
         # Ok so list is good, keep it
         
-        # Remove duplicate
-        logger.debug('Removing duplicate entry from all kernel list.')
-        versionlist = list(dict.fromkeys(versionlist))
+        # Duplicate are already removed by RefStore.scan()
         # Sorted
-        versionlist.sort(key=StrictVersion)
+        versionlist = VersionSet(versionlist)
         
         # Do we need to update kernel['all'] list or is the same ?
-        if self._compare_multidirect(self.kernel['all'], versionlist, 'git kernel'):
-            logger.debug('Adding to list all: {0}.'.format(' '.join(self.kernel['all'])))
+        if self._track_change('kernel all', self.kernel['all'], versionlist, 'git kernel'):
+            logger.debug(f'Adding to list all: {versionlist}.')
             self.kernel['all'] = versionlist
             
             # Update state file
-            self.stateinfo.save(['kernel all', ' '.join(self.kernel['all'])])
+            self.stateinfo.save(['kernel all', str(self.kernel['all'])])
         # Else keep previously list and don't write anything
   
   
@@ -419,66 +461,41 @@ class GitHandler:
         logger = logging.getLogger(f'{self.logger_name}get_branch::')
         
         switch = { 
-            # Main loop - check only local (faster) 
-            'local'     :   {
-                    'local'     :   '-l'
-                    },
+            # Main loop - check only local
+            'local'     :   [ 'local' ],
             # After dopull()
-            'remote'    :   {   
-                    'remote'    :   '-r'
-                    },
+            'remote'    :   [ 'remote' ],
             # Init program
-            'all'      :   {
-                    'local'     :   '-l',
-                    'remote'    :   '-r'
-                    }
+            'all'       :   [ 'local', 'remote' ]
             }
-        tosave = [ ]
-        for origin, opt in switch[key].items():
-            try:
-                logger.debug(f'Extracting from {origin} branch.')
-                myprocess = git.Repo(self.pathdir['repo']).git.branch(opt).splitlines()
-            except Exception as exc:
-                err = exc.stderr
-                # Try to strip off the formatting GitCommandError puts on stderr
-                match = re.search(r"stderr: '(.*)'", err)
-                if match:
-                    err = match.group(1)
-                logger.error(f'Got unexcept error while getting {origin} branch info.')
-                logger.error(f'{err} ...skipping.')
-                # Don't exit just keep previously list 
-                continue
+        if not self.profile.branch:
+            logger.debug(f'Profile \'{self.profile.name}\' has no version branch, skipping.')
+            return
+        # Local and remote branches are both extracted by the same scan
+        try:
+            logger.debug('Extracting from {0} branch.'.format(' and '.join(switch[key])))
+            refs = self.refs.scan()
+        except OSError as error:
+            logger.error('Got unexcept error while getting {0} branch info.'.format(' and '.join(switch[key])))
+            logger.error(f'{error} ...skipping.')
+            # Don't exit just keep previously list 
+            return
         
+        tosave = [ ]
+        for origin in switch[key]:
             versionlist = []
-            for line in myprocess:
-                # Get only 'master' branch's version list
-                # For remote
-                if re.match(r'^\s+\w+\/(\d+\.\d+)\/master', line):
-                    version = re.match(r'^\s+\w+\/(\d+\.\d+)\/master', line).group(1)
-                    try:
-                        StrictVersion(version)
-                    except ValueError as err:
-                        logger.error(f'While searching for available {origin} branch list.')
-                        logger.error(f'Got: {err} ...skipping.')
-                        continue
-                    else:
-                        # Add to the list
-                        logger.debug(f'Found version: {version}')
-                        versionlist.append(version)
-                # For local
-                elif re.match(r'^..(\d+\.\d+)\/master', line):
-                    version = re.match(r'^..(\d+\.\d+)\/master', line).group(1)
-                    try:
-                        StrictVersion(version)
-                    except ValueError as err:
-                        logger.error(f'While searching for available {origin} branch list.')
-                        logger.error(f'Got: {err} ...skipping.')
-                        continue
-                    else:
-                        # Add to the list
-                        logger.debug(f'Found version: {version}')
-                        versionlist.append(version)
-                
+            for version in refs[origin]:
+                version = self.profile.normalize(version)
+                try:
+                    parse_version(version)
+                except ValueError as err:
+                    logger.error(f'While searching for available {origin} branch list.')
+                    logger.error(f'Got: {err} ...skipping.')
+                    continue
+                else:
+                    # Add to the list
+                    logger.debug(f'Found version: {version}')
+                    versionlist.append(version)
             
             if not versionlist:
                 logger.error(f'Couldn\'t find any valid {origin} branch version.')
@@ -487,80 +504,178 @@ class GitHandler:
                 # Don't update the list - so keep the last know or maybe the factory '0.0'
                 break 
             
-            versionlist.sort(key=StrictVersion)
+            versionlist = VersionSet(versionlist)
                                                                     # origin: local or remote
-            if self._compare_multidirect(self.branch['all'][origin], versionlist, f'{origin} branch'):
-                logger.debug('Adding to the list: {0}.'.format(' '.join(versionlist)))
+            if self._track_change(f'branch all {origin}', self.branch['all'][origin], versionlist, 
+                                  f'{origin} branch'):
+                logger.debug(f'Adding to the list: {versionlist}.')
                 self.branch['all'][origin] = versionlist
             
                 # Add tosave
-                tosave.append([f'branch all {origin}', ' '.join(self.branch['all'][origin])])
+                tosave.append([f'branch all {origin}', str(self.branch['all'][origin])])
             # Else keep data, save ressource, enjoy :)
         # Write saved
         if tosave:
             self.stateinfo.save(*tosave)
             
             
+    def refresh_from_fetch(self):
+        """
+        Incremental refresh after a pull: diff matching ref(s) (name -> sha) with the previous
+        snapshot, then add version(s) of ref(s) which appeared and remove version(s) of ref(s)
+        which disappeared (ex: pruned branch, deleted tag).
+        Return set of refreshed list(s) ('kernel', 'remote'), None if a full refresh is needed.
+        """
+        
+        logger = logging.getLogger(f'{self.logger_name}refresh_from_fetch::')
+        
+        # key: kind, value: (state file option, dict holding the list, key, message)
+        lists = {
+            'kernel'    :   ('kernel all', self.kernel, 'all', 'git kernel'),
+            'remote'    :   ('branch all remote', self.branch['all'], 'remote', 'remote branch')
+            }
+        # Profile without version branch
+        if not self.profile.branch:
+            del lists['remote']
+        
+        try:
+            current = self.refs.snapshot()
+        except OSError as error:
+            logger.error(f'Got unexcept error while reading ref(s): {error}, full refresh needed.')
+            self.snapshot = None
+            return None
+        previous, self.snapshot = self.snapshot, current
+        if previous is None:
+            logger.debug('No previous snapshot, full refresh needed.')
+            return None
+        for option, target, key, msg in lists.values():
+            if parse_version(target[key][0]) == parse_version('0.0'):
+                logger.debug(f'{msg.capitalize()} list is empty, full refresh needed.')
+                return None
+        
+        added = [ name for name in current if not name in previous ]
+        removed = [ name for name in previous if not name in current ]
+        logger.debug(f'Ref(s): {len(current)}, {len(added)} added, {len(removed)} removed, '
+                     + '{0} updated.'.format(sum(1 for name in current if previous.get(name, current[name])
+                                                                           != current[name])))
+        if not added and not removed:
+            return set()
+        
+        def versions(names):
+            """Return dict with key: kind, value: dict of version(s) matched by names"""
+            found = { kind : { } for kind in lists }
+            for name in names:
+                matched = self.refs.match(name)
+                if matched and matched[0] in found:
+                    found[matched[0]][self.profile.normalize(matched[1])] = None
+            return found
+        
+        appeared = versions(added)
+        disappeared = versions(removed)
+        if any(disappeared.values()):
+            # Version still provided by another ref (ex: same branch from another remote) is kept
+            remaining = versions(current)
+            for kind in disappeared:
+                disappeared[kind] = { version : None for version in disappeared[kind]
+                                      if not version in remaining[kind] }
+        
+        refreshed = set()
+        tosave = [ ]
+        for kind, (option, target, key, msg) in lists.items():
+            new = [ ]
+            for version in appeared[kind]:
+                try:
+                    parse_version(version)
+                except ValueError as err:
+                    logger.error(f'While searching for {msg} version, got: {err} ...skipping.')
+                    continue
+                if not version in target[key]:
+                    new.append(version)
+            gone = [ version for version in disappeared[kind] if version in target[key] ]
+            if not new and not gone:
+                continue
+            versionlist = target[key].copy()
+            for version in new:
+                logger.info(f'Found new {msg} version: {version}')
+                versionlist.add(version)
+            for version in gone:
+                logger.info(f'{msg.capitalize()} version \'{version}\' have been removed.')
+                versionlist.discard(version)
+            if not versionlist:
+                # Same as full refresh: never keep an empty list
+                logger.error(f'Every {msg} version have been removed, keeping previously list.')
+                continue
+            # Same as _track_change() without diffing whole lists
+            self.changes[option] = VersionDelta(added=new, removed=gone,
+                                                unchanged=len(target[key]) - len(gone), changed=True)
+            target[key] = versionlist
+            tosave.append([option, str(versionlist)])
+            refreshed.add(kind)
+        if tosave:
+            self.stateinfo.save(*tosave)
+        return refreshed
+    
+    
     def get_available_update(self, target_attr):
         """Compare lists and return all available branch or kernel update."""
         
         logger = logging.getLogger(f'{self.logger_name}get_available_update::')
         
         target = getattr(self, target_attr)
-        if target_attr == 'branch':
-            origin = self.branch['all']['local'][-1]
-            versionlist = target['all']['remote']
-        elif target_attr == 'kernel':
-            origin = self.kernel['installed']['all'][-1]
-            versionlist = target['all']
+        origin = self._get_origin(target_attr)
         
         logger.debug(f'Checking available {target_attr} update.')
-        current_available = [ ]
         tosave = [ ]
-        for version in versionlist:
-            try:
-                # for branch -> branch['all']['local'][-1])
-                if StrictVersion(version) > StrictVersion(origin):
-                    current_available.append(version)
-            except ValueError as err:
-                # This shouldn't append
-                # lists are checked in get_branch() and get_installed_kernel()
-                # So print an error and continue with next item
-                logger.error(f'Got unexcept error while checking available {target_attr} update.')
-                logger.error(f'Got: {err} skipping...')
-                continue
+        try:
+            # Already sorted: binary search then slice
+            current_available = self._get_versions(target_attr).greater_than(origin)
+        except ValueError as err:
+            # This shouldn't append
+            # lists are checked in get_branch() and get_installed_kernel()
+            logger.error(f'Got unexcept error while checking available {target_attr} update.')
+            logger.error(f'Got: {err} skipping...')
+            return
         if current_available:
-            # Sorting 
-            current_available.sort(key=StrictVersion)
-            logger.debug('Found version(s): {0}.'.format(' '.join(current_available)))
+            logger.debug(f'Found version(s): {current_available}.')
             
             # Any way we will replace the whole list
             # Now compare new available list with old available list 
-            if self._compare_multidirect(target['available'], current_available, 
-                                                      f'available {target_attr}'):
+            if self._track_change(f'{target_attr} available', target['available'], current_available, 
+                                  f'available {target_attr}'):
                 # So this mean rewrite it 
-                logger.debug('Adding to the list: {0}.'.format(' '.join(current_available)))
+                logger.debug(f'Adding to the list: {current_available}.')
                 target['available'] = current_available
                 # Add tosave list
-                tosave.append([f'{target_attr} available', ' '.join(target['available'])])
+                tosave.append([f'{target_attr} available', str(target['available'])])
             # else keep previously list
         # Nothing available so reset to '0.0.0' if necessary
         else:
             logger.debug(f'No available {target_attr} update.')
-            if not StrictVersion(target['available'][0]) == StrictVersion('0.0.0') \
-               or not StrictVersion(target['available'][0]) == StrictVersion('0.0'):
+            if self._track_change(f'{target_attr} available', target['available'], VersionSet([ '0.0.0' ]),
+                                  f'available {target_attr}'):
                 logger.debug(f'Clearing list.')
-                target['available'].clear()
-                target['available'].append('0.0.0')
+                target['available'] = VersionSet([ '0.0.0' ])
                 # add tosave list
-                tosave.append([f'{target_attr} available', ' '.join(target['available'])])
-                #self.stateinfo.save(target_attr + ' available', target_attr + ' available: ' 
-                                    #+ ' '.join(target['available']))
+                tosave.append([f'{target_attr} available', str(target['available'])])
         # Call save
         if tosave:
             self.stateinfo.save(*tosave)
             
 
+    def _get_versions(self, target_attr):
+        """Return the sorted VersionSet where update are searched (branch or kernel)"""
+        if target_attr == 'branch':
+            return self.branch['all']['remote']
+        return self.kernel['all']
+    
+
+    def _get_origin(self, target_attr):
+        """Return the version from which update are available (branch or kernel)"""
+        versions = self.branch['all']['local'] if target_attr == 'branch' else self.kernel['installed']['all']
+        # Empty list: everything is an update (same as factory)
+        return versions[-1] if versions else '0.0'
+    
+
     def get_last_pull(self, timestamp_only=False):
         """Get last git pull timestamp"""
                 
@@ -609,8 +724,15 @@ class GitHandler:
                 self.stateinfo.save(['pull last', self.pull['last']])
             return True
         
-        path = pathlib.Path(self.pathdir['repo'] + '.git/refs/remotes/origin/HEAD')
-        if path.is_file():
+        # No FETCH_HEAD: fresh clone if there is any fetched ref ('origin/HEAD'
+        # could be packed, dangling or missing, see __prune_refs())
+        try:
+            tracked = self.backend.run('for-each-ref', '--count=1', '--format=%(refname)',
+                                       f'refs/remotes/{self.remote}/', 'refs/tags/')
+        except git.GitCommandError as error:
+            logger.error(f'Failed to read remote-tracking ref(s): {error}.')
+            tracked = ''
+        if tracked:
             logger.debug('Repository: {0},'.format(self.pathdir['repo'])
                               + ' have never been updated (pull).')
             return True
@@ -619,145 +741,293 @@ class GitHandler:
         return False
    
 
-    def check_pull(self, init_run=False):
-        """Check git pull status depending on specified interval"""
+    def check_pull(self, init_run=False, retry=False):
+        """
+        Check git pull status depending on specified interval,
+        retry: 'retry' job is due so remain is bypassed if last pull got a network error.
+        """
         
         logger = logging.getLogger(f'{self.logger_name}check_pull::')
         
         # Call get_last_pull()
         if self.get_last_pull():
-            if self.pull['recompute']:
+            # Never scheduled: recompute as well
+            if self.pull['recompute'] or self.scheduler.remain('pull') is None:
                 logger.debug('Recompute is enable.')
                 self.pull['recompute'] = False
-                current_timestamp = time.time()
-                logger.debug('Current pull elapsed timestamp: {0}'.format(self.pull['elapsed']))
-                self.pull['elapsed'] = round(current_timestamp - self.pull['last'])
-                logger.debug('Recalculate pull elapsed timestamp: {0}'.format(self.pull['elapsed']))
-                logger.debug('Current pull remain timestamp: {0}'.format(self.pull['remain']))
-                self.pull['remain'] = self.pull['interval'] - self.pull['elapsed']
-                logger.debug('Recalculate pull remain timestamp: {0}'.format(self.pull['remain']))
+                # Last pull timestamp is wall clock: convert to a scheduler deadline
+                elapsed = round(time.time() - self.pull['last'])
+                self.scheduler.schedule('pull', self.pull['interval'] - elapsed, elapsed=elapsed)
+                logger.debug(f'Recalculate pull elapsed timestamp: {elapsed}')
             
+            elapsed = round(self.scheduler.elapsed('pull'))
+            remain = round(self.scheduler.remain('pull'))
             logger.debug('Git pull elapsed time: ' 
-                + '{0}'.format(self.format_timestamp.convert(self.pull['elapsed']))) 
+                + '{0}'.format(self.format_timestamp.convert(elapsed))) 
             logger.debug('Git pull remain time: ' 
-                + '{0}'.format(self.format_timestamp.convert(self.pull['remain'])))
+                + '{0}'.format(self.format_timestamp.convert(remain)))
             logger.debug('Git pull interval: ' 
                 + '{0}.'.format(self.format_timestamp.convert(self.pull['interval'])))
             
             if init_run:
                 logger.info('Git pull elapsed time: ' 
-                    + '{0}'.format(self.format_timestamp.convert(self.pull['elapsed']))) 
+                    + '{0}'.format(self.format_timestamp.convert(elapsed))) 
                 logger.info('Git pull remain time: '
-                    + '{0}'.format(self.format_timestamp.convert(self.pull['remain'])))
+                    + '{0}'.format(self.format_timestamp.convert(remain)))
                 logger.info('Git pull interval: ' 
                     + '{0}.'.format(self.format_timestamp.convert(self.pull['interval'])))
             
             
-            if self.pull['remain'] <= 0:
+            if remain <= 0:
                 return True
             # TEST Bypass remain as it's a network_error
             # This should be good but keep more testing
-            if self.pull['network_error']:
-                logger.debug('Bypassing remain timestamp ({0}) '.format(self.pull['remain'])
+            if retry and self.pull['network_error']:
+                logger.debug(f'Bypassing remain timestamp ({remain}) '
                                + 'as network error found.')
                 return True
         return False
     
 
-    def dopull(self):
-        """Pulling git repository"""
+    def probe(self, timeout=None, on_start=None):
+        """
+        Compare remote ref(s) advertisement (only ref(s) matching self.refspecs) with
+        local ref(s), nothing is downloaded (see PullJobManager).
+        Return 'changed', 'unchanged' or 'failed' (remote unreachable).
+        """
+        
+        logger = logging.getLogger(f'{self.logger_name}probe::')
+        
+        # key: remote glob, value: local glob
+        mapping = { }
+        for refspec in self.refspecs:
+            source, sep, destination = refspec.lstrip('+').partition(':')
+            mapping[source] = destination
+        try:
+            advertised = self.backend.run('ls-remote', '--refs', self.remote, *mapping,
+                                          timeout=timeout, on_start=on_start)
+        except Exception as exc:
+            err = getattr(exc, 'stderr', None) or f'{exc}'
+            logger.warning(f'Failed to probe remote \'{self.remote}\': {err}')
+            return 'failed'
+        # key: remote ref name, value: (sha, local ref name)
+        tracked = { }
+        for line in advertised.splitlines():
+            sha, sep, name = line.partition('\t')
+            for source, destination in mapping.items():
+                prefix, star, suffix = source.partition('*')
+                if name.startswith(prefix) and name.endswith(suffix) and len(name) >= len(prefix + suffix):
+                    matched = name[len(prefix):len(name) - len(suffix)]
+                    tracked[name] = (sha, destination.replace('*', matched, 1))
+                    break
+        # Local ref(s) are resolved by the persistent git process (no fork per probe)
+        local = self.backend.resolve(*(destination for sha, destination in tracked.values()))
+        changed = [ ]
+        for name, (sha, destination) in tracked.items():
+            if local.get(destination) is None or not local[destination][0] == sha:
+                changed.append(name)
+        logger.debug(f'Remote \'{self.remote}\' advertised {len(tracked)} tracked ref(s), {len(changed)} changed.')
+        if not changed:
+            # Nothing to pull: same as a finished pull (probe run in the worker)
+            self.dispatch(self.scheduler.schedule, 'pull', self.pull['interval'])
+            return 'unchanged'
+        logger.info('Remote \'{0}\' changed: {1}.'.format(self.remote, ', '.join(changed[:5])
+                                                           + (f' (and {len(changed) - 5} more)' 
+                                                              if len(changed) > 5 else '')))
+        return 'changed'
+    
+    
+    def dopull(self, timeout=None, on_start=None, cancelled=None):
+        """
+        Pulling git repository in the calling thread, git is killed after 'timeout' seconds.
+        cancelled: callable returning True if git have been killed on purpose (job cancelled).
+        Return 'success', 'network', 'timeout', 'failed', 'cancelled' or 'skipped'.
+        """
         
         logger = logging.getLogger(f'{self.logger_name}dopull::')
         
         if self.pull['status']:
             logger.error('We are about to update git repository and found status to True,')
             logger.error('which mean it is already in progress, please check and report if False.')
-            return
-        # Skip pull if state is Failed and it's not an network error
+            self.scheduler.schedule('pull', self.pull['interval'])
+            return 'skipped'
+        if self.__pull_failed():
+            return 'skipped'
+        self.__pull_started()
+        result, err = self.__run_pull(timeout, on_start, cancelled, self.__set_progress)
+        return self.__pull_finished(result, err)
+    
+    
+    def pull_job(self, timeout=None, on_start=None, cancelled=None):
+        """
+        Same as dopull() but called from PullJobManager worker: only git is run here,
+        pull state change(s) are applied by the thread owning them (see dispatch()).
+        """
+        
+        # Read only: state is changed by the owner thread
+        if self.pull['state'] == 'Failed' and not self.pull['network_error']:
+            self.dispatch(self.__pull_failed)
+            return 'skipped'
+        self.dispatch(self.__pull_started)
+        result, err = self.__run_pull(timeout, on_start, cancelled,
+                                      lambda progress: self.dispatch(self.__set_progress, progress))
+        self.dispatch(self.__pull_finished, result, err)
+        return result
+    
+    
+    def dispatch(self, function, *args):
+        """
+        Queue function(*args) for the thread owning pull state (thread safe): run by
+        run_pending() from MainDaemon.handle() (woken up by the scheduler), so from
+        the GLib loop in single loop mode (see SingleLoop).
+        """
+        self.pending.append((function, args))
+        self.scheduler.notify()
+    
+    
+    def run_pending(self):
+        """Run function(s) queued by dispatch() (owner thread only)"""
+        while self.pending:
+            function, args = self.pending.popleft()
+            function(*args)
+    
+    
+    def __pull_failed(self):
+        """Return True (and postpone pull) if state is Failed and it's not an network error"""
+        
+        logger = logging.getLogger(f'{self.logger_name}dopull::')
+        
         if self.pull['state'] == 'Failed' and not self.pull['network_error']:
             logger.error('Skipping git repository update due to previously error.')
             logger.error('Fix the error and reset using syuppod\'s dbus client.')
-            return
+            self.scheduler.schedule('pull', self.pull['interval'])
+            return True
+        return False
+    
+    
+    def __pull_started(self):
+        self.pull['status'] = True
+    
+    
+    def __set_progress(self, progress):
+        self.progress = progress
+        self._publish_progress(progress)
+    
+    
+    def __run_pull(self, timeout, on_start, cancelled, publish):
+        """
+        Run git pull (or fetch) only: output is streamed to git.log and parsed progress
+        passed to publish(progress). Nothing else is changed (safe from the worker).
+        Return (result, error message) (see dopull() for result).
+        """
         
-        self.pull['status'] = True 
-        tosave = [ ]
-        # ALERT Be really carfull with this kind of thing because python will NOT trow Exception
-        # in the else block (so make sure it's well written (not like me ;) )
+        logger = logging.getLogger(f'{self.logger_name}dopull::')
+        
+        command = 'fetch' if self.pull['fetch_only'] else 'pull'
+        # git output is streamed to git.log as it arrive (nothing is kept in memory)
+        # One logger per repository
+        processlog = ProcessLoggingHandler(name='gitlog' + (f"-{self.pathdir['name']}" 
+                                                            if self.pathdir.get('name') else ''))
+        mylogfile = processlog.dolog(self.pathdir['gitlog'])
+        mylogfile.setLevel(processlog.logging.INFO)
+        mylogfile.info('##################################')
+        # Latest parsed progress for this run (rate limit, see __pull_output())
+        last = { 'progress' : { }, 'published' : 0 }
         try:
-            myprocess = git.Repo(self.pathdir['repo']).git.pull()
+            self.backend.stream(command, '--progress', timeout=timeout, on_start=on_start,
+                                on_line=lambda line, progress: self.__pull_output(mylogfile, line, progress, 
+                                                                                  last, publish))
         except Exception as exc:
-            err = exc.stderr
+            err = getattr(exc, 'stderr', None) or f'{exc}'
             # Try to strip off the formatting GitCommandError puts on stderr
-            match = re.search("stderr: '(.*)'$", err)
+            match = re.search("stderr: '(.*)'$", err, re.DOTALL)
             if match:
                 err = match.group(1)
-            network_error = re.search('.*Couldn.t.resolve.host.*', err)
-            
-            if network_error:
-                # TEST TEST
-                # 10 times @ 600s (10min)
-                # after 10 times @ 3600s (1h)
-                # then reset to interval (so mini is 24H)
-                msg_on_retry = ''
-                self.pull['remain'] = 600
-                if self.pull['retry'] == 1:
-                    msg_on_retry = ' (1 time already)'
-                elif 2 <= self.pull['retry'] <= 10:
-                    msg_on_retry = ' ({0} times already)'.format(self.pull['retry'])
-                elif 11 <= self.pull['retry'] <= 20:
-                    msg_on_retry = ' ({0} times already)'.format(self.pull['retry'])
-                    self.pull['remain'] = 3600
-                elif self.pull['retry'] > 20:
-                    msg_on_retry = ' ({0} times already)'.format(self.pull['retry'])
-                    self.pull['remain'] = self.pull['interval']
-                logger.error('Got network error while pulling git repository.')
-                logger.error(err)
-                # This is normal 'retry{0}' see --> _set_remain_on_network_error()
-                logger.error('Will retry{0} pulling in {1}.'.format(msg_on_retry,
-                                                                     self.format_timestamp.convert(self.pull['remain'])))
-                
-                old_count = self.pull['retry']
-                self.pull['retry'] += 1
-                logger.debug('Incrementing pull retry from {0} to {1}.'.format(old_count, self.pull['retry']))
-                # add tosave
-                tosave.append(['pull retry', self.pull['retry']])
-                #self.stateinfo.save('pull retry', 'pull retry: ' + str(self.pull['retry']))
-                                
-                if not self.pull['network_error']:
-                    # Set network_error
-                    # TODO clean up ? str() ? or int() ,???
-                    self.pull['network_error'] = '1'
-                    tosave.append(['pull network_error', self.pull['network_error']])
-                    #self.stateinfo.save('pull network_error', 'pull network_error: 1')
+            if cancelled is not None and cancelled():
+                return 'cancelled', err
+            # Hung remote (timeout) or killed: retry like network error
+            if isinstance(exc, GitTimeoutError) or (isinstance(exc, git.GitCommandError) 
+                                                    and isinstance(exc.status, int) and exc.status < 0):
+                return 'timeout', err
+            if re.search('.*Couldn.t.resolve.host.*', err):
+                return 'network', err
+            return 'failed', err
+        logger.debug('Successfully wrote git {0} log to {1}.'.format(command, self.pathdir['gitlog']))
+        return 'success', ''
+    
+    
+    def __pull_finished(self, result, err):
+        """Apply __run_pull() result to pull state (retry, state file, scheduling), return result"""
+        
+        logger = logging.getLogger(f'{self.logger_name}dopull::')
+        
+        tosave = [ ]
+        if result == 'cancelled':
+            # Killed on user request: not an error, keep pull state as is
+            logger.warning('Git pull have been cancelled.')
+            if not self.scheduler.scheduled('pull'):
+                self.scheduler.schedule('pull', self.pull['interval'])
+        elif result in ('network', 'timeout'):
+            # TEST TEST
+            # 10 times @ 600s (10min)
+            # after 10 times @ 3600s (1h)
+            # then reset to interval (so mini is 24H)
+            msg_on_retry = ''
+            retry = 600
+            if self.pull['retry'] == 1:
+                msg_on_retry = ' (1 time already)'
+            elif 2 <= self.pull['retry'] <= 10:
+                msg_on_retry = ' ({0} times already)'.format(self.pull['retry'])
+            elif 11 <= self.pull['retry'] <= 20:
+                msg_on_retry = ' ({0} times already)'.format(self.pull['retry'])
+                retry = 3600
+            elif self.pull['retry'] > 20:
+                msg_on_retry = ' ({0} times already)'.format(self.pull['retry'])
+                retry = self.pull['interval']
+            if result == 'timeout':
+                logger.error('Git pull have been killed (timeout).')
             else:
-                logger.error('Got unexcept error while pulling git repository.')
-                logger.error(err)
-                # Reset retry and network_error
-                if not self.pull['retry']:
-                    self.pull['retry'] = 0
-                    tosave.append(['pull retry', self.pull['retry']])
-                    #self.stateinfo.save('pull retry', 'pull retry: 0')
-                if not self.pull['network_error']:
-                    self.pull['network_error'] = 0
-                    tosave.append(['pull network_error', self.pull['network_error']])
-                    #self.stateinfo.save('pull network_error', 'pull network_error: 0')
-                                
-                # Reset remain to interval 
-                # But if no action then pull will be skipped
-                self.pull['remain'] = self.pull['interval']
-                
-            if not self.pull['state'] == 'Failed':
-                self.pull['state'] = 'Failed'
-                tosave.append(['pull state', self.pull['state']])
-                #self.stateinfo.save('pull state', 'pull state: Failed')
+                logger.error('Got network error while pulling git repository.')
+            logger.error(err)
+            # This is normal 'retry{0}' see --> _set_remain_on_network_error()
+            logger.error('Will retry{0} pulling in {1}.'.format(msg_on_retry,
+                                                                 self.format_timestamp.convert(retry)))
+            self.scheduler.schedule('retry', retry)
             
+            old_count = self.pull['retry']
+            self.pull['retry'] += 1
+            logger.debug('Incrementing pull retry from {0} to {1}.'.format(old_count, self.pull['retry']))
+            # add tosave
+            tosave.append(['pull retry', self.pull['retry']])
+                            
+            if not self.pull['network_error']:
+                # Set network_error
+                # TODO clean up ? str() ? or int() ,???
+                self.pull['network_error'] = '1'
+                tosave.append(['pull network_error', self.pull['network_error']])
+        elif result == 'failed':
+            logger.error('Got unexcept error while pulling git repository.')
+            logger.error(err)
+            # Reset retry and network_error
+            if not self.pull['retry']:
+                self.pull['retry'] = 0
+                tosave.append(['pull retry', self.pull['retry']])
+            if not self.pull['network_error']:
+                self.pull['network_error'] = 0
+                tosave.append(['pull network_error', self.pull['network_error']])
+                            
+            # Reset remain to interval 
+            # But if no action then pull will be skipped
+            self.scheduler.schedule('pull', self.pull['interval'])
         else:
-            logger.info('Successfully update git kernel repository.')
+            if self.pull['fetch_only']:
+                logger.info('Successfully fetch git kernel repository (merging is left to the user).')
+            else:
+                logger.info('Successfully update git kernel repository.')
             # Update 'state' status to state file
             if not self.pull['state'] == 'Success':
                 self.pull['state'] = 'Success'
                 tosave.append(['pull state', self.pull['state']])
-                #self.stateinfo.save('pull state', 'pull state: Success')
             
             # Reset retry and network_error
             if self.pull['retry']:
@@ -779,322 +1049,538 @@ class GitHandler:
             logger.debug('Incrementing current pull count from \'{0}\' to \'{1}\''.format(old_count,
                                                                                     self.pull['current_count']))
             tosave.append(['pull count', self.pull['count']])
-            #self.stateinfo.save('pull count', 'pull count: ' + str(self.pull['count'])) # Same here str() or 'TypeError: 
-                                                                                        # must be str, not int'
-            
-            # Append log to git.log file 
-            processlog = ProcessLoggingHandler(name='gitlog')
-            mylogfile = processlog.dolog(self.pathdir['gitlog'])
-            mylogfile.setLevel(processlog.logging.INFO)
-            mylogfile.info('##################################')
-            for line in myprocess.splitlines():
-                mylogfile.info(line)
-            logger.debug('Successfully wrote git pull log to {0}.'.format(self.pathdir['gitlog']))
+            logger.debug('Git process(es) spawned: {0}.'.format(', '.join(f'{key}={value}' 
+                                                    for key, value in self.backend.stats.items())))
                         
-            self.pull['remain'] = self.pull['interval']
-            # Force update all 
-            #self.pull['update_all'] = True
-            #logger.debug('Setting update_all to True')
-        finally:
-            # Get last timestamp 
-            # Any way even if git pull failed it will write to .git/FETCH_HEAD 
-            # So get the timestamp any way
-            self.pull['last'] = self.get_last_pull(timestamp_only=True)
-            logger.debug('Saving \'pull last: {0}\' to \'{1}\'.'.format(self.pull['last'], 
-                                                                                 self.pathdir['statelog']))
-            tosave.append(['pull last', self.pull['last']])
-            #self.stateinfo.save('pull last', 'pull last: ' + str(self.pull['last']))
-            # Reset status
-            self.pull['status'] = False
+            self.scheduler.cancel('retry')
+            self.scheduler.schedule('pull', self.pull['interval'])
+        if result in ('network', 'timeout', 'failed') and not self.pull['state'] == 'Failed':
+            self.pull['state'] = 'Failed'
+            tosave.append(['pull state', self.pull['state']])
+        # Get last timestamp 
+        # Any way even if git pull failed it will write to .git/FETCH_HEAD 
+        # So get the timestamp any way
+        self.pull['last'] = self.get_last_pull(timestamp_only=True)
+        logger.debug('Saving \'pull last: {0}\' to \'{1}\'.'.format(self.pull['last'], 
+                                                                             self.pathdir['statelog']))
+        tosave.append(['pull last', self.pull['last']])
+        # Reset status
+        self.pull['status'] = False
+        self.__set_progress({ })
         # save
         if tosave:
             self.stateinfo.save(*tosave)
+        return result
         
     
-    def __open_git_config(self, request_mode):
+    def __pull_output(self, gitlog, line, progress, last, publish):
         """
-        Open git config file, this intend to be used as context manager
+        Called (from the worker) for each git pull / fetch output line: write it to git.log
+        and pass parsed progress to publish() ('last' is the rate limit state of this run)
         """
-        
-        logger = logging.getLogger(f'{self.logger_name}__open_git_config::') 
-        
-        git_config_file = self.pathdir['repo'] + '.git/config'
-        msg = 'write to' if request_mode == 'r+' else 'read'
-        
+        # 'remote: ' line(s) are padded
+        line = line.rstrip()
+        if not line:
+            return
+        # Progress update(s) ('\r') would flood git.log: only final one is written
+        if not progress:
+            gitlog.info(line)
+        parsed = parse_progress(line)
+        if parsed is None:
+            return
+        parsed['updated'] = str(round(time.time()))
+        # Rate limit: git update progress many times per second
+        now = time.monotonic()
+        publish_now = not parsed['phase'] == last['progress'].get('phase') or parsed['done'] == 'yes' \
+                      or now - last['published'] >= 1
+        last['progress'] = parsed
+        if publish_now:
+            last['published'] = now
+            publish(parsed)
+    
+    
+    def _publish_progress(self, progress):
+        """Called (from the owner thread) when progress changed, empty dict when finished (see GitDbus)"""
+        pass
+    
+    
+    def __git_config(self, *args):
+        """Run 'git config' with args, return output ('' if key is not found)"""
         try:
-            return pathlib.Path(git_config_file).open(mode=request_mode)
-        except (OSError, IOError) as error:
-            logger.critical(f'Failed to {msg} git config file: \'{git_config_file}\'.')
-            logger.critical(f'{error}.')
-            logger.critical('Exiting with status \'1\'.')
-            sys.exit(1)
+            return self.backend.run('config', *args)
+        except git.GitCommandError as error:
+            # Status 1: key not found
+            if error.status == 1:
+                return ''
+            raise
     
     
     def __check_config(self):
-        """Check git config file options"""
+        """
+        Make remote fetch only the managed refspec(s) (see self.refspecs) without
+        auto following tags, then prune ref(s) no longer tracked (once per refspec(s) set,
+        recorded in git config).
+        """
         
         logger = logging.getLogger(f'{self.logger_name}check_config::')
         
-        # Check / add git config to get all tags from remote origin repository
-                              # fetch = +refs/heads/*:refs/remotes/origin/*
-        regex = re.compile(r'\s+fetch.=.\+refs/heads/\*:refs/remotes/origin/\*')
-        to_write = '        fetch = +refs/tags/*:refs/tags/*'
-        re_tag = re.compile(r'\s+fetch.=.\+refs/tags/\*:refs/tags/\*')
-        
-        # If modified line already exists don't touch any thing
-        with self.__open_git_config(request_mode='r') as gitconfig:
-            for line in gitconfig:
-                if re_tag.match(line):
-                    logger.debug('Git config file already contain option' 
-                                      + ' to fetch all tags from remote repository.')
-                    return
-        # Otherwise
-        # First make a backup
-        backupfile = f"{self.pathdir['repo']}.git/config.backup_{self.pathdir['prog_name']}"
+        remote = f'remote.{self.remote}'
+        # Where pruned refspec(s) set is recorded
+        pruned_key = '{0}.prunedFetch'.format(self.pathdir['prog_name'])
         git_config_file = f"{self.pathdir['repo']}.git/config"
         try:
-            if not pathlib.Path(backupfile).is_file(): 
-                shutil.copy2(git_config_file, backupfile)
-            else:
-                # This shouldn't be the case, if there already a backup and 
-                # there is not the line modified ...
-                logger.warning(f'Skipping backup file (\'{backupfile}\'), file already exists' 
-                               + f' while expected modified line not found in file: \'{git_config_file}\'' 
-                               + ' (please report this).')
-        except (OSError, IOError) as error:
-            logger.critical(f'Failed to backup file \'{git_config_file}\'' 
-                            + f' to \'{backupfile}\': {error}')
+            if not self.__git_config('--get', f'{remote}.url'):
+                logger.warning(f'No remote \'{self.remote}\' found in git config file: \'{git_config_file}\','
+                               + ' skipping refspec configuration.')
+                return
+            current = self.__git_config('--get-all', f'{remote}.fetch').splitlines()
+            tagopt = self.__git_config('--get', f'{remote}.tagOpt')
+            pruned = self.__git_config('--get-all', pruned_key).splitlines()
+        except git.GitCommandError as error:
+            logger.critical(f'Failed to read git config file: \'{git_config_file}\'.')
+            logger.critical(f'{error}.')
             logger.critical('Exiting with status \'1\'.')
             sys.exit(1)
-        # Then modify
-        with self.__open_git_config(request_mode='r+') as gitconfig:
-            old_file = gitconfig.readlines()   # Pull the file contents to a list
-            gitconfig.seek(0)                  # Jump to start, so we overwrite instead of appending
-            gitconfig.truncate                 # Erase file 
-            for line in old_file:
-                if regex.match(line):
-                    gitconfig.write(line)
-                    git_config_file.write(to_write + '\n')
+        
+        if current == self.refspecs and tagopt == '--no-tags':
+            logger.debug('Git config file already contain managed refspec(s): '
+                         + '{0}.'.format(', '.join(self.refspecs)))
+        else:
+            # First make a backup (only the original one)
+            backupfile = f"{self.pathdir['repo']}.git/config.backup_{self.pathdir['prog_name']}"
+            try:
+                if not pathlib.Path(backupfile).is_file(): 
+                    shutil.copy2(git_config_file, backupfile)
                 else:
-                    git_config_file.write(line)
-        logger.debug('Successfully added option to git config file:' 
-                          + ' fetch all tags from remote repository.')
+                    logger.debug(f'Skipping backup file (\'{backupfile}\'), file already exists.')
+            except (OSError, IOError) as error:
+                logger.critical(f'Failed to backup file \'{git_config_file}\'' 
+                                + f' to \'{backupfile}\': {error}')
+                logger.critical('Exiting with status \'1\'.')
+                sys.exit(1)
+            # Then modify
+            try:
+                # Replace all existing fetch line(s) with the first one
+                self.backend.run('config', '--replace-all', f'{remote}.fetch', self.refspecs[0])
+                for refspec in self.refspecs[1:]:
+                    self.backend.run('config', '--add', f'{remote}.fetch', refspec)
+                # Tags are fetched only through refspec (no auto following)
+                self.backend.run('config', f'{remote}.tagOpt', '--no-tags')
+            except git.GitCommandError as error:
+                logger.critical(f'Failed to write to git config file: \'{git_config_file}\'.')
+                logger.critical(f'{error}.')
+                logger.critical('Exiting with status \'1\'.')
+                sys.exit(1)
+            logger.info('Git config file: remote \'{0}\' now fetch only: {1}'.format(self.remote,
+                                                                                    ', '.join(self.refspecs))
+                        + ' (previously: {0}).'.format(', '.join(current) if current else 'nothing'))
+        
+        if pruned == self.refspecs:
+            return
+        # Migration: ref(s) fetched by previously refspec(s) are now stale
+        try:
+            self.__prune_refs()
+            if pruned:
+                self.backend.run('config', '--unset-all', pruned_key)
+            for refspec in self.refspecs:
+                self.backend.run('config', '--add', pruned_key, refspec)
+        except git.GitCommandError as error:
+            # Not fatal: it will be retried on next start
+            logger.error(f'Failed to prune ref(s) no longer tracked: {error}.')
+    
+    
+    def __prune_refs(self):
+        """Delete remote-tracking ref(s) which are not fetched anymore by self.refspecs"""
+        
+        logger = logging.getLogger(f'{self.logger_name}prune_refs::')
+        
+        prefix = f'refs/remotes/{self.remote}/'
+        # Destination side of refspec(s) (git glob '*' match '/' as fnmatch does)
+        keep = [ refspec.split(':', 1)[1] for refspec in self.refspecs
+                 if refspec.split(':', 1)[1].startswith(prefix) ]
+        names = [ ]
+        for line in self.backend.run('for-each-ref', '--format=%(refname) %(symref)', prefix).splitlines():
+            name, symref = line.split(' ', 1)
+            # Keep symbolic ref(s) (ex: 'origin/HEAD'), git manage them
+            if not symref:
+                names.append(name)
+        stale = [ name for name in names if not any(fnmatch.fnmatchcase(name, glob) for glob in keep) ]
+        if stale:
+            # One transaction (and packed-refs is rewritten only once)
+            self.backend.run('update-ref', '--no-deref', '--stdin',
+                             input=''.join(f'delete {name}\n' for name in stale))
+        logger.info(f'Pruned {len(stale)} remote-tracking ref(s) no longer fetched'
+                    + f' ({len(names) - len(stale)} kept).')
+        logger.debug('Pruned: {0}.'.format(', '.join(stale) if stale else 'nothing'))
        
     
-    def _compare_multidirect(self, old_list, new_list, msg):
-        """Compare lists multidirectionally"""
+    def _track_change(self, option, old_list, new_list, msg):
+        """
+        Diff old and new version lists, log and keep the delta for consumers
+        (see self.changes) then return it (evaluate to False if nothing change).
+        """
         
-        logger = logging.getLogger(f'{self.logger_name}compare_multidirect::')
+        logger = logging.getLogger(f'{self.logger_name}track_change::')
         
-        logger.debug('Tracking change multidirectionally:')
-        ischange = False
-        origin = old_list[-1]
-        tocompare = {
-            'first pass'    :   [ old_list, new_list, 'previously and current update list', 'previously'],
-            'second pass'   :   [ new_list, old_list, 'current and previously update list', 'current' ]
-            }
-        current_version = '0.0.0'
-        
-        for value in tocompare.values():
-            logger.debug('Between {0}.'.format(value[2]))
-            #logger.debug(f'Current version: {current_version}.')
-            for upper_version in value[0]:
-                isfound = False
-                #logger.debug(f'Current version: {current_version}.')
-                for lower_version in value[1]:
-                    #logger.debug(f'Current version: {current_version}.')
-                    if StrictVersion(upper_version) == StrictVersion(lower_version):
-                        logger.debug(f'Keeping version: {upper_version}')
-                        isfound = True
-                        break
-                if not isfound:
-                    ischange = True
-                    logger.debug(f'Version: {upper_version}, not found in {value[3]} list.')
-                    # First pass then this version is obsolete 
-                    if value[3] == 'previously':
-                        # we not adding anything but we just print this version is old one ...
-                        logger.debug(f'Removing obsolete version: {upper_version}.')
-                        # Don't log if version == '0.0.0' or '0.0'
-                        if not StrictVersion(upper_version) == StrictVersion('0.0.0') \
-                           or not StrictVersion(upper_version) == StrictVersion('0.0'):
-                            logger.info('{0} version \'{1}\' have been removed.'.format(msg.capitalize(),
-                                                                                   upper_version))
-                    # Second pass then this version is 'new' (but not neccessary greater)
-                    elif value[3] == 'current':
-                        # ... and this version is new one.
-                        # Any way we will replace all the list if lists are different
-                        logger.debug(f'Adding new version: {upper_version}')
-                        # Try to be more verbose for logger.info
-                        # same here 
-                        if not StrictVersion(upper_version) == StrictVersion('0.0.0') \
-                           or not StrictVersion(upper_version) == StrictVersion('0.0'):
-                            logger.info(f'Found new {msg} version: {upper_version}')
-                        current_version = upper_version
-        # Ok now if nothing change
-        if not ischange:
-            logger.debug('Finally, didn\'t found any change, previously data have been kept.')
-            return False
-        else:
-            return True
+        delta = diff_versions(old_list, new_list)
+        if not delta:
+            logger.debug(f'No change found for {msg} ({delta.unchanged} unchanged),'
+                         + ' previously data have been kept.')
+            return delta
         
+        for version in delta.removed:
+            logger.info(f'{msg.capitalize()} version \'{version}\' have been removed.')
+        for version in delta.added:
+            logger.info(f'Found new {msg} version: {version}')
+        logger.debug(f'Tracking change for {msg}: {len(delta.added)} added, '
+                     + f'{len(delta.removed)} removed, {delta.unchanged} unchanged.')
+        # Keep last delta, key is the state file option
+        self.changes[option] = delta
+        return delta
+
+
+
+# Classified watcher event passed to the consumer:
+# kind is 'pull_started', 'pull' (finished), 'local', 'remote', 'kernel' (see lib/gitevents.py) or 'mod'
+# created / deleted are '/lib/modules/' entries (only for 'mod')
+# rescan is True if events have been lost (full '/lib/modules/' rescan needed)
+WatchEvent = namedtuple('WatchEvent', ['kind', 'created', 'deleted', 'rescan'])
+# rescan default to False (namedtuple 'defaults=' need python >= 3.7)
+WatchEvent.__new__.__defaults__ = (False, )
 
 
 class GitWatcher(threading.Thread):
-    """Monitor specific git folder and file using inotify"""
-    def __init__(self, pathdir, *args, **kwargs):
+    """
+    Monitor specific git folder and file using inotify.
+    Block on inotify fds (and a wakeup pipe) until something happen, then
+    hand classified event(s) (WatchEvent) to the consumer callback.
+    Git repository event(s) are debounced: a burst is sent when nothing
+    happened for 'quiet' seconds or at most 'maxdelay' seconds after it started.
+    """
+    def __init__(self, pathdir, consumer, *args, debounce=(0.5, 5), fetch_only=False, **kwargs):
         super().__init__(*args, **kwargs)
         self.pathdir = pathdir
         self.repo_git = self.pathdir['repo'] + '.git/'
+        # Called from watcher thread for each WatchEvent (ex: RequestChannel.put())
+        self.consumer = consumer
         # Init logger
-        self.logger_name = f'::{__name__}::GitWatcher::'
+        self.logger_name = f'::{__name__}::GitWatcher::' + (f"{self.pathdir['name']}::" 
+                                                            if self.pathdir.get('name') else '')
         logger = logging.getLogger(f'{self.logger_name}init::')
-        self.tasks = { 
-            'repo'  : {
-                    'requests'   : {
-                        'pending'       :   [ ],
-                        'completed'      :   False
-                        }
-                    },
-            'pull'  : {
-                    'inprogress'    :   False,
-                    'requests'   : {
-                        'pending'       :   [ ],
-                        'completed'      :   False
-                        }
-                    },
-            'mod'   : {
-                    'created'   :   [ ],
-                    'deleted'   :   [ ],
-                    'requests'   : {
-                        'pending'       :   [ ],
-                        'completed'      :   False
-                        }                    
-                    }
-                }
+        self.running = True
+        # Debounce
+        self.quiet, self.maxdelay = debounce
+        self.burst = None
+        # 'git fetch' never write ORIG_HEAD: FETCH_HEAD closed means finished
+        self.fetch_only = fetch_only
+        # Statistics (exposed over dbus)
+        self.stats = {
+            'events'        :   0,  # git repository inotify event(s) received
+            'ignored'       :   0,  # irrelevant event(s) (index, HEAD, lock file(s)...)
+            'bursts'        :   0,  # debounced burst(s)
+            'refreshes'     :   0   # refresh request(s) sent
+            }
         # Init Inotify
         self.inotify_repo = inotify_simple.INotify()
         self.inotify_mod = inotify_simple.INotify()
         self.watch_flags = inotify_simple.flags.CLOSE_WRITE | inotify_simple.flags.CREATE | \
                            inotify_simple.flags.DELETE
+        # git write '<ref>.lock' then rename it to '<ref>'
+        self.repo_flags = self.watch_flags | inotify_simple.flags.MOVED_TO
+        # key: watch descriptor, value: directory relative to '.git/' ('' is '.git/')
+        self.repo_wds = { }
         try:
-            #self.repo_wd = 
-            self.inotify_repo.add_watch(self.repo_git, self.watch_flags)
-            #self.mod_wd = 
-            self.inotify_mod.add_watch('/lib/modules/', self.watch_flags)
+            self.repo_wds[self.inotify_repo.add_watch(self.repo_git, self.repo_flags)] = ''
+            # To catch refs subtree(s) creation
+            self.repo_wds[self.inotify_repo.add_watch(self.repo_git + 'refs', self.repo_flags)] = 'refs'
+            for subtree in watched_refs:
+                self.__add_tree(subtree)
+            self.__add_mod_watch()
         except OSError as error:
             logger.error('Git watcher daemon crash:')
             logger.error('Using {0} and /lib/modules/'.format(self.repo_git))
             logger.error(f'{error}')
             logger.error('Exiting with status 1.')
             sys.exit(1)
-        
+        # Wakeup pipe: written from other thread(s) to interrupt select()
+        self.wakeup_read, self.wakeup_write = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        # epoll on linux
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.inotify_repo.fileno(), selectors.EVENT_READ, self.__read_repo)
+        self.selector.register(self.inotify_mod.fileno(), selectors.EVENT_READ, self.__read_mod)
+        self.selector.register(self.wakeup_read, selectors.EVENT_READ, self.__read_wakeup)
+    
+    
+    def wakeup(self):
+        """Interrupt watcher select() (thread safe)"""
+        try:
+            os.write(self.wakeup_write, b'\0')
+        except BlockingIOError:
+            # Pipe full: already woken up
+            pass
+    
+    
+    def stop(self):
+        """Ask watcher thread to exit"""
+        self.running = False
+        self.wakeup()
+    
+    
     def run(self):
         logger = logging.getLogger(f'{self.logger_name}run::')
         logger.debug('Git watcher daemon started ' 
                         + '(monitoring {0} and /lib/modules/).'.format(self.repo_git))
-        found_fetch_head = False
-        found_orig_head_lock = False
-        while True:
-            self.repo_read = self.inotify_repo.read(timeout=0)
-            self.mod_read = self.inotify_mod.read(timeout=0)
-            # First git repo
-            if self.repo_read:
-                # Reset each time
-                found_fetch_head = False
-                found_orig_head_lock = False
-                logger.debug('State changed for: {0} ({1}).'.format(self.repo_git, self.repo_read))
-                # TEST Try to catch git pull command
-                # pull will first touch the FETCH_HEAD file 
-                # At the end : ORIG_HEAD.lock
-                for event in self.repo_read:
-                    if event.name == 'FETCH_HEAD':
-                        found_fetch_head = True
-                    if event.name == 'ORIG_HEAD.lock':
-                        found_orig_head_lock = True
-                # Starting pull when only FETCH_HEAD is found
-                if found_fetch_head and not found_orig_head_lock:
-                    self.tasks['pull']['inprogress'] = True
-                    # TODO logger.info :p
-                    logger.debug('Git pull is in progress.')
-                # Finished pull: more TEST-ing needed
-                elif found_fetch_head and found_orig_head_lock:
-                    self.tasks['pull']['inprogress'] = False
-                    # Each request have it's own id (8 characters)
-                    pull_id = uuid.uuid4().hex[:8]
-                    self.tasks['pull']['requests']['pending'].append(pull_id)
-                    # TODO logger.info :p
-                    logger.debug('Git pull have been run.')
-                    # Every thing have to be refreshed
-                    repo_id = uuid.uuid4().hex[:8]
-                    self.tasks['repo']['requests']['pending'].append(repo_id)
-                    logger.debug(f'Sending request for git repo (id={repo_id}) '
-                                      + f'and git pull (id={pull_id}) informations refresh.')
+        while self.running:
+            # No timeout: sleep until there is something to read (or burst deadline)
+            for key, mask in self.selector.select(self.burst_timeout()):
+                key.data()
+            self.flush_due()
+        self.selector.close()
+        for fd in self.wakeup_read, self.wakeup_write:
+            os.close(fd)
+        self.inotify_repo.close()
+        self.inotify_mod.close()
+        logger.debug('Git watcher daemon stopped.')
+    
+    
+    def sources(self):
+        """
+        Return list of (fd, handler) for inotify fds: call handler() when fd is readable.
+        Used to drive the watcher from another loop (instead of start())
+        """
+        return [ (self.inotify_repo.fileno(), self.__read_repo), (self.inotify_mod.fileno(), self.__read_mod) ]
+    
+    
+    def burst_timeout(self):
+        """Return seconds until current burst should be sent (None if no burst)"""
+        if not self.burst:
+            return None
+        return max(0, min(self.burst['last'] + self.quiet, 
+                          self.burst['start'] + self.maxdelay) - time.monotonic())
+    
+    
+    def flush_due(self):
+        """Send current burst if its deadline is reached"""
+        if self.burst and not self.burst_timeout():
+            self.__flush_burst()
+    
+    
+    def __send(self, kind, created=(), deleted=(), rescan=False):
+        """Hand event to the consumer"""
+        self.consumer(WatchEvent(kind, list(created), list(deleted), rescan))
+    
+    
+    def get_stats(self):
+        """Return statistics with coalescing ratio (event(s) per refresh)"""
+        stats = dict(self.stats)
+        stats['ratio'] = stats['events'] / stats['refreshes'] if stats['refreshes'] else 0.0
+        return stats
+    
+    
+    def __add_tree(self, subtree):
+        """Recursively watch directory 'subtree' (relative to '.git/')"""
+        logger = logging.getLogger(f'{self.logger_name}__add_tree::')
+        
+        for dirpath, dirnames, filenames in os.walk(self.repo_git + subtree):
+            relative = os.path.relpath(dirpath, self.repo_git)
+            try:
+                self.repo_wds[self.inotify_repo.add_watch(dirpath, self.repo_flags)] = relative
+            except FileNotFoundError:
+                # Removed in between
+                continue
+            logger.debug(f'Watching: {relative}.')
+    
+    
+    def __read_repo(self):
+        """Add relevant git repository event(s) to the current burst"""
+        logger = logging.getLogger(f'{self.logger_name}__read_repo::')
+        
+        repo_read = self.inotify_repo.read(timeout=0)
+        if not repo_read:
+            return
+        self.stats['events'] += len(repo_read)
+        found = set()
+        fetch_head = False
+        fetch_done = False
+        orig_head_lock = False
+        for event in repo_read:
+            if event.mask & inotify_simple.flags.Q_OVERFLOW:
+                # Event(s) lost: refresh everything
+                logger.warning('Inotify queue overflow for {0}.'.format(self.repo_git))
+                found.update(targets)
+                continue
+            if event.mask & inotify_simple.flags.IGNORED:
+                # Watched directory removed
+                self.repo_wds.pop(event.wd, None)
+                continue
+            if not event.wd in self.repo_wds:
+                continue
+            path = os.path.join(self.repo_wds[event.wd], event.name)
+            # TEST Try to catch git pull command
+            # pull will first touch the FETCH_HEAD file 
+            # At the end : ORIG_HEAD.lock
+            if path == 'FETCH_HEAD':
+                if self.fetch_only and event.mask & inotify_simple.flags.CLOSE_WRITE:
+                    fetch_done = True
                 else:
-                    repo_id = uuid.uuid4().hex[:8]
-                    self.tasks['repo']['requests']['pending'].append(repo_id)
-                    logger.debug(f'Sending request (id={repo_id}) for git repo informations refresh.')
-            # Then for /lib/modules/
-            if self.mod_read:
-                logger.debug('State changed for: {0} ({1}).'.format('/lib/modules/', self.mod_read))
-                for event in self.mod_read:
-                    # Create
-                    if event.mask == 1073742080:
-                        self.tasks['mod']['created'].append(event.name)
-                        # Ad unique id
-                        mod_id = uuid.uuid4().hex[:8]
-                        self.tasks['mod']['requests']['pending'].append(mod_id)
-                        logger.debug(f'Found created: {event.name} (id={mod_id}).')
-                    # Delete
-                    if event.mask == 1073742336:
-                        self.tasks['mod']['deleted'].append(event.name)
-                        # Ad unique id
-                        mod_id = uuid.uuid4().hex[:8]
-                        self.tasks['mod']['requests']['pending'].append(mod_id)
-                        logger.debug(f'Found deleted: {event.name} (id={mod_id}).')
-                if self.tasks['mod']['requests']['pending']:
-                    msg = ''
-                    if len(self.tasks['mod']['requests']['pending']) > 1:
-                        msg = 's'
-                    logger.debug(f'Sending request{msg}' 
-                            + ' (id{0}={1})'.format(msg, '|'.join(self.tasks['mod']['requests']['pending']))
-                            + ' for modules informations refresh.')
-            
-            # wait for request reply
-            for switch in 'repo', 'pull', 'mod':
-                if self.tasks[switch]['requests']['completed']:
-                    if switch == 'mod':
-                        reader = 'mod_read'
-                        msg = 'modules'
-                        # Reset list here
-                        self.tasks[switch]['created'] = [ ]
-                        self.tasks[switch]['deleted'] = [ ]
-                    else:
-                        reader = 'repo_read'
-                        msg = f'git {switch}'
-                    logger.debug(f'Got reply id for {msg} requests: '
-                                      + '{0}'.format(self.tasks[switch]['requests']['completed']))
-                    logger.debug('{0}'.format(msg.capitalize()) 
-                                      + ' pending id list:' 
-                                      + ' {0}'.format(', '.join(self.tasks[switch]['requests']['pending'])))                        
-                    # Finished is the id of the last request proceed by main
-                    # So we need to erase range from this id index to the first element in the list
-                    id_index = self.tasks[switch]['requests']['pending'].index(
-                        self.tasks[switch]['requests']['completed'])
-                    plurial_msg = ''
-                    if id_index > 0:
-                        plurial_msg = 's'
-                    # Make sure to remove also pointed index (so index+1)
-                    to_remove = self.tasks[switch]['requests']['pending'][0:id_index+1]
-                    del self.tasks[switch]['requests']['pending'][0:id_index+1]
-                    logger.debug('{0} request{1}'.format(msg.capitalize(), plurial_msg)
-                                + ' (id{0}={1})'.format(plurial_msg, '|'.join(to_remove))
-                                + ' have been refreshed.')
-                    self.tasks[switch]['requests']['completed'] = False
-                    # Nothing left to read, nothing pending, waiting :p
-                    if not getattr(self, reader) and not self.tasks[switch]['requests']['pending']:
-                        logger.debug(f'All {msg} requests have been refreshed, sleeping...')
-            time.sleep(1)
-               
+                    fetch_head = True
+                continue
+            if path == 'ORIG_HEAD.lock':
+                orig_head_lock = True
+                continue
+            if event.mask & inotify_simple.flags.ISDIR:
+                # New directory inside a watched refs subtree (ex: refs/heads/5.6/)
+                # or refs subtree itself (ex: refs/tags/)
+                if not path.startswith(watched_refs):
+                    continue
+                if event.mask & (inotify_simple.flags.CREATE | inotify_simple.flags.MOVED_TO):
+                    self.__add_tree(path)
+            found.update(classify(path))
+        
+        # Irrelevant event(s) cost nothing: no burst, no request
+        if not found and not fetch_head and not fetch_done and not orig_head_lock:
+            self.stats['ignored'] += len(repo_read)
+            return
+        logger.debug('State changed for: {0} ({1}).'.format(self.repo_git, repo_read))
+        now = time.monotonic()
+        if not self.burst:
+            self.burst = {
+                'start'             :   now,
+                'last'              :   now,
+                'events'            :   0,
+                'targets'           :   set(),
+                'fetch_head'        :   False,
+                'fetch_done'        :   False,  # fetch only mode
+                'orig_head_lock'    :   False,
+                'started'           :   False   # 'pull_started' already sent
+                }
+        self.burst['last'] = now
+        self.burst['events'] += len(repo_read)
+        self.burst['targets'].update(found)
+        self.burst['fetch_head'] |= fetch_head
+        self.burst['fetch_done'] |= fetch_done
+        self.burst['orig_head_lock'] |= orig_head_lock
+        # Starting pull when only FETCH_HEAD is found: don't wait for the burst end
+        if self.burst['fetch_head'] and not self.burst['orig_head_lock'] \
+           and not self.burst['fetch_done'] and not self.burst['started']:
+            # TODO logger.info :p
+            logger.debug('Git pull is in progress.')
+            self.burst['started'] = True
+            self.__send('pull_started')
+    
+    
+    def __flush_burst(self):
+        """Classify current burst and send request(s)"""
+        logger = logging.getLogger(f'{self.logger_name}__flush_burst::')
+        
+        burst, self.burst = self.burst, None
+        self.stats['bursts'] += 1
+        logger.debug('Burst of {0} event(s) over {1:.2f}s.'.format(burst['events'], 
+                                                                  burst['last'] - burst['start']))
+        # Finished pull: more TEST-ing needed
+        if burst['fetch_head'] and burst['orig_head_lock']:
+            # TODO logger.info :p
+            logger.debug('Git pull have been run.')
+            self.__send('pull')
+        elif burst['fetch_done']:
+            logger.debug('Git fetch have been run.')
+            self.__send('pull')
+        elif burst['fetch_head'] and not burst['targets']:
+            # Pull still in progress (already sent)
+            return
+        if not burst['targets']:
+            return
+        # Same order as targets
+        kinds = [ kind for kind in targets if kind in burst['targets'] ]
+        logger.debug('Sending request for {0} informations refresh.'.format(', '.join(kinds)))
+        for kind in kinds:
+            self.__send(kind)
+        self.stats['refreshes'] += 1
+    
+    
+    def __add_mod_watch(self):
+        """Watch '/lib/modules/' (raise OSError)"""
+        # Package manager(s) rename (MOVED_*), SELF / UNMOUNT to detect watch lost
+        self.mod_wd = self.inotify_mod.add_watch('/lib/modules/', self.watch_flags 
+                                                 | inotify_simple.flags.MOVED_FROM
+                                                 | inotify_simple.flags.MOVED_TO
+                                                 | inotify_simple.flags.DELETE_SELF 
+                                                 | inotify_simple.flags.MOVE_SELF)
+    
+    
+    def __read_mod(self):
+        """
+        Classify '/lib/modules/' event(s): decode mask bitwise, pair renames by cookie
+        and ask for a full rescan only if event(s) have been lost.
+        """
+        logger = logging.getLogger(f'{self.logger_name}__read_mod::')
+        flags = inotify_simple.flags
+        
+        mod_read = self.inotify_mod.read(timeout=0)
+        if not mod_read:
+            return
+        logger.debug('State changed for: {0} ({1}).'.format('/lib/modules/', mod_read))
+        # dict used as ordered set
+        created = { }
+        deleted = { }
+        # key: cookie, value: name (moved from)
+        moved = { }
+        rescan = False
+        for event in mod_read:
+            if event.mask & flags.Q_OVERFLOW:
+                logger.warning('Inotify queue overflow for /lib/modules/.')
+                rescan = True
+                continue
+            if event.mask & (flags.UNMOUNT | flags.IGNORED | flags.DELETE_SELF | flags.MOVE_SELF):
+                if event.mask & flags.IGNORED:
+                    logger.warning('Lost watch on /lib/modules/, trying to restore it.')
+                    try:
+                        self.__add_mod_watch()
+                    except OSError as error:
+                        logger.error(f'While restoring watch on /lib/modules/: {error}.')
+                rescan = True
+                continue
+            # Only directories
+            if not event.mask & flags.ISDIR:
+                continue
+            if event.mask & flags.MOVED_FROM:
+                moved[event.cookie] = event.name
+            elif event.mask & flags.MOVED_TO and event.cookie in moved:
+                old = moved.pop(event.cookie)
+                logger.debug(f'Found renamed: {old} -> {event.name}.')
+                created.pop(old, None)
+                deleted[old] = None
+                deleted.pop(event.name, None)
+                created[event.name] = None
+            elif event.mask & (flags.CREATE | flags.MOVED_TO):
+                logger.debug(f'Found created: {event.name}.')
+                deleted.pop(event.name, None)
+                created[event.name] = None
+            elif event.mask & flags.DELETE:
+                logger.debug(f'Found deleted: {event.name}.')
+                created.pop(event.name, None)
+                deleted[event.name] = None
+        # Moved out of '/lib/modules/' (no pair)
+        for name in moved.values():
+            logger.debug(f'Found moved out: {name}.')
+            created.pop(name, None)
+            deleted[name] = None
+        if rescan:
+            logger.debug('Sending request for modules full rescan.')
+            self.__send('mod', rescan=True)
+        elif created or deleted:
+            logger.debug('Sending request for modules informations refresh.')
+            self.__send('mod', created, deleted)
+    
+    
+    def __read_wakeup(self):
+        """Drain wakeup pipe"""
+        try:
+            while os.read(self.wakeup_read, 512):
+                pass
+        except BlockingIOError:
+            pass
+        
         
 
 def check_git_dir(directory):
@@ -1104,7 +1590,8 @@ def check_git_dir(directory):
     if not os.access(directory, os.R_OK):
         return (False, 'read')
     try:
-        git.Repo(directory)
+        # Discover the repository only once: the backend is reused by GitHandler
+        get_backend(directory).repo
     except _InvalidGitRepositoryError:
         return (False, 'git')
     return (True, '')
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+import threading
+import logging
+
+from collections import namedtuple
+
+
+# Returned by RequestChannel.take():
+# sequence: dict with key: kind and value: latest pending sequence number (0 = nothing pending)
+# created / deleted: '/lib/modules/' entries, overflow: True if names have been dropped
+# or watcher lost event(s) (so a full rescan is needed), running: True if a git pull is in progress
+Requests = namedtuple('Requests', ['sequence', 'created', 'deleted', 'overflow', 'running'])
+
+
+class RequestChannel:
+    """
+    Coalescing request channel from GitWatcher (producer) to MainDaemon (consumer).
+    Each request get a monotonically increasing sequence number and requests of the
+    same kind are merged: only the latest sequence number is kept per kind.
+    Consumer acknowledge 'everything up to N' with ack().
+    """
+    kinds = ('pull_started', 'pull', 'local', 'remote', 'kernel', 'mod')
+
+    def __init__(self, maxsize=1024, timeout=5, notify=None):
+        self.logger_name = f'::{__name__}::RequestChannel::'
+        self.lock = threading.Lock()
+        self.not_full = threading.Condition(self.lock)
+        self.counter = 0
+        # Latest posted / acknowledged sequence number per kind
+        self.posted = { kind : 0 for kind in self.kinds }
+        self.acked = { kind : 0 for kind in self.kinds }
+        # Module name(s) not yet taken: dict used as ordered set
+        self.created = { }
+        self.deleted = { }
+        self.overflow = False
+        # Backpressure: producer wait up to 'timeout' sec when 'maxsize' name(s) are pending,
+        # then name(s) are dropped in favor of a full rescan
+        self.maxsize = maxsize
+        self.timeout = timeout
+        # Called (without lock) after each put() to wake up consumer
+        self.notify = notify
+
+
+    def put(self, event):
+        """Post WatchEvent (from gitmanager), return its sequence number"""
+        logger = logging.getLogger(f'{self.logger_name}put::')
+
+        with self.not_full:
+            names = len(event.created) + len(event.deleted)
+            if event.rescan:
+                # Watcher lost event(s): pending name(s) are useless
+                self.overflow = True
+                self.created.clear()
+                self.deleted.clear()
+            elif self.overflow:
+                # Already rescanning
+                pass
+            elif names and not self.not_full.wait_for(lambda: self.__room(names), timeout=self.timeout):
+                logger.warning('Too many pending modules request(s), falling back to full rescan.')
+                self.overflow = True
+                self.created.clear()
+                self.deleted.clear()
+            elif names:
+                # Last event win: created then deleted is deleted (and vice versa)
+                for name in event.created:
+                    self.deleted.pop(name, None)
+                    self.created[name] = None
+                for name in event.deleted:
+                    self.created.pop(name, None)
+                    self.deleted[name] = None
+            self.counter += 1
+            self.posted[event.kind] = self.counter
+            sequence = self.counter
+        logger.debug(f'Request \'{event.kind}\' posted (sequence: {sequence}).')
+        if self.notify:
+            self.notify()
+        return sequence
+
+
+    def take(self):
+        """Return pending Requests, module name(s) are moved out of the channel"""
+        with self.not_full:
+            requests = Requests(sequence={ kind : (self.posted[kind] if self.posted[kind] > self.acked[kind] else 0)
+                                           for kind in self.kinds },
+                                created=list(self.created),
+                                deleted=list(self.deleted),
+                                overflow=self.overflow,
+                                running=self.posted['pull_started'] > self.posted['pull'])
+            self.created = { }
+            self.deleted = { }
+            self.overflow = False
+            self.not_full.notify_all()
+        return requests
+
+
+    def ack(self, kind, sequence):
+        """Acknowledge all 'kind' request(s) up to 'sequence'"""
+        logger = logging.getLogger(f'{self.logger_name}ack::')
+
+        with self.lock:
+            if sequence > self.acked[kind]:
+                self.acked[kind] = sequence
+            pending = self.posted[kind] > self.acked[kind]
+        logger.debug(f'Request(s) \'{kind}\' acknowledged up to {sequence}'
+                     + ' ({0}).'.format('still pending' if pending else 'nothing pending'))
+
+
+    def __room(self, names):
+        return len(self.created) + len(self.deleted) + names <= self.maxsize
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+
+# What have to be refreshed:
+# 'local'  -> local branch list (refs/heads/)
+# 'remote' -> remote branch list (refs/remotes/)
+# 'kernel' -> kernel version list (refs/tags/)
+targets = ('local', 'remote', 'kernel')
+
+# Subtrees (relative to '.git/') watched recursively
+watched_refs = ('refs/heads', 'refs/remotes', 'refs/tags')
+
+# key: path (relative to '.git/') or prefix (ending with '/'), value: target(s)
+_rules = {
+    # packed-refs can hold any reference
+    'packed-refs'       :   frozenset(targets),
+    'refs/heads/'       :   frozenset(('local', )),
+    'refs/remotes/'     :   frozenset(('remote', )),
+    'refs/tags/'        :   frozenset(('kernel', ))
+    }
+_nothing = frozenset()
+
+
+def classify(path):
+    """
+    Return the smallest set of target(s) to refresh when 'path' (relative to '.git/')
+    changed. Lock file(s), index, HEAD, objects... return an empty set.
+    """
+    # git always write a '<name>.lock' then rename it to '<name>'
+    if path.endswith('.lock'):
+        return _nothing
+    if path in _rules:
+        return _rules[path]
+    head, sep, tail = path.partition('/')
+    if head == 'refs':
+        prefix, sep, tail = tail.partition('/')
+        return _rules.get(f'refs/{prefix}/', _nothing)
+    return _nothing
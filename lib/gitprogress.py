@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+import re
+
+
+# git --progress line(s) (stderr), ex:
+# 'remote: Counting objects: 100% (20/20), done.'
+# 'Receiving objects:  45% (9/20), 1.20 MiB | 1.00 MiB/s'
+# 'Resolving deltas: 100% (5/5), done.'
+# 'remote: Enumerating objects: 1234, done.'
+_progress_re = re.compile(r'^(?:remote: )?(?P<phase>[A-Z][a-z]+(?: [a-z]+)*):\s+'
+                          r'(?:(?P<percent>\d+)% \((?P<current>\d+)/(?P<total>\d+)\)|(?P<count>\d+))'
+                          r'(?:, (?P<bytes>[\d.]+ [KMGT]?i?B))?'
+                          r'(?: \| (?P<throughput>[\d.]+ [KMGT]?i?B/s))?'
+                          r'(?P<done>, done\.)?')
+
+
+def parse_progress(line):
+    """
+    Parse one git progress line and return a dict with key: phase, percent, objects,
+    total, bytes, throughput and done (all str, '' if unknown), None if not a progress line.
+    """
+    match = _progress_re.match(line)
+    if not match:
+        return None
+    return {
+        'phase'         :   match.group('phase').lower(),
+        'percent'       :   match.group('percent') or ('100' if match.group('done') else ''),
+        'objects'       :   match.group('current') or match.group('count') or '',
+        'total'         :   match.group('total') or '',
+        'bytes'         :   match.group('bytes') or '',
+        'throughput'    :   match.group('throughput') or '',
+        'done'          :   'yes' if match.group('done') else 'no'
+        }
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+import os
+import re
+import mmap
+import logging
+
+
+class RefStore:
+    """
+    Read git references directly from the repository (.git/packed-refs and loose refs)
+    without forking any git process.
+    """
+
+    # Only these subtrees are read
+    namespaces = ('tags', 'heads', 'remotes')
+
+    def __init__(self, gitdir, patterns):
+        """
+        gitdir: path to the '.git/' directory.
+        patterns: dict with key: kind and value: regex matching a reference name
+        relative to 'refs/' (ex: 'tags/v([\\d\\.]+)-zen.*'). Each regex must have
+        exactly one capturing group which is the extracted version.
+        """
+        self.logger_name = f'::{__name__}::RefStore::'
+        self.gitdir = gitdir
+        self.packed_refs = os.path.join(gitdir, 'packed-refs')
+        self.kinds = tuple(patterns)
+
+        # Build only one regex for all the patterns: each pattern get one group,
+        # so match.lastindex tell us which kind matched (no need to re-match).
+        self.group_kind = { }
+        for index, (kind, pattern) in enumerate(patterns.items(), start=1):
+            if not re.compile(pattern).groups == 1:
+                raise ValueError(f'Pattern for \'{kind}\' should have exactly one group: \'{pattern}\'')
+            self.group_kind[index] = kind
+        source = '|'.join(f'(?:{pattern})' for pattern in patterns.values())
+        # For loose refs: the name is already extracted from the path
+        self.name_re = re.compile(source)
+        # For packed-refs: '<sha> refs/<name>' one per line, peeled lines ('^<sha>') never match
+        self.packed_re = re.compile(rb'^[0-9a-f]+ refs/(?:' + source.encode() + rb')$', re.MULTILINE)
+        # Same but keep sha and name (see snapshot())
+        self.packed_sha_re = re.compile(rb'^([0-9a-f]+) refs/((?:' + source.encode() + rb'))$', re.MULTILINE)
+
+
+    def scan(self):
+        """
+        Scan packed-refs and loose refs in one pass and return a dict
+        with key: kind and value: list of extracted version(s) (without duplicate).
+        Raise OSError if the repository cannot be read.
+        """
+        logger = logging.getLogger(f'{self.logger_name}scan::')
+
+        found = { kind : { } for kind in self.kinds }
+
+        # First packed-refs (could be missing if never packed)
+        try:
+            with open(self.packed_refs, 'rb') as packed:
+                # mmap() doesn't support empty file
+                if os.fstat(packed.fileno()).st_size:
+                    with mmap.mmap(packed.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        for match in self.packed_re.finditer(mapped):
+                            found[self.group_kind[match.lastindex]][match.group(match.lastindex).decode()] = None
+        except FileNotFoundError:
+            logger.debug(f'No packed-refs found: \'{self.packed_refs}\'.')
+
+        # Then loose refs which override packed-refs (but here only names matter)
+        for namespace in self.namespaces:
+            for name in self.__walk(os.path.join(self.gitdir, 'refs', namespace), namespace):
+                match = self.name_re.fullmatch(name)
+                if match:
+                    found[self.group_kind[match.lastindex]][match.group(match.lastindex)] = None
+
+        logger.debug('Found: {0}.'.format(', '.join(f'{kind}={len(versions)}'
+                                                    for kind, versions in found.items())))
+        return { kind : list(versions) for kind, versions in found.items() }
+
+
+    def snapshot(self):
+        """
+        Return a dict with key: reference name relative to 'refs/' and value: sha
+        for every reference matching the patterns (symbolic ref(s) are skipped).
+        Raise OSError if the repository cannot be read.
+        """
+        refs = { }
+        try:
+            with open(self.packed_refs, 'rb') as packed:
+                if os.fstat(packed.fileno()).st_size:
+                    with mmap.mmap(packed.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        for match in self.packed_sha_re.finditer(mapped):
+                            refs[match.group(2).decode()] = match.group(1).decode()
+        except FileNotFoundError:
+            pass
+        # Loose refs override packed-refs
+        for namespace in self.namespaces:
+            for name in self.__walk(os.path.join(self.gitdir, 'refs', namespace), namespace):
+                if not self.name_re.fullmatch(name):
+                    continue
+                try:
+                    with open(os.path.join(self.gitdir, 'refs', name), 'r') as loose:
+                        content = loose.read().strip()
+                except FileNotFoundError:
+                    # Deleted meanwhile
+                    continue
+                if not content.startswith('ref:'):
+                    refs[name] = content
+        return refs
+
+
+    def match(self, name):
+        """Return (kind, version) for reference 'name' relative to 'refs/', None if nothing match"""
+        match = self.name_re.fullmatch(name)
+        if match:
+            return self.group_kind[match.lastindex], match.group(match.lastindex)
+        return None
+
+
+    def __walk(self, path, prefix):
+        """Yield loose reference name(s) relative to 'refs/'"""
+        try:
+            with os.scandir(path) as listdir:
+                entries = list(listdir)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            name = f'{prefix}/{entry.name}'
+            if entry.is_dir(follow_symlinks=False):
+                yield from self.__walk(entry.path, name)
+            # Skip lock file(s) from in progress git command(s)
+            elif not entry.name.endswith('.lock'):
+                yield name
+
+
+
+def refspecs(globs, remote='origin'):
+    """
+    Return fetch refspec(s) for remote ref glob(s) relative to 'refs/' (one '*' each,
+    ex: 'heads/*/master', 'tags/v*'): branches are stored under 'refs/remotes/<remote>/',
+    tags are kept as is. Raise ValueError for other namespace(s).
+    """
+    specs = [ ]
+    for glob in globs:
+        namespace, sep, name = glob.partition('/')
+        if namespace == 'heads':
+            specs.append(f'+refs/heads/{name}:refs/remotes/{remote}/{name}')
+        elif namespace == 'tags':
+            specs.append(f'+refs/tags/{name}:refs/tags/{name}')
+        else:
+            raise ValueError(f'Cannot fetch \'{glob}\': only \'heads/\' and \'tags/\' are supported')
+    return specs
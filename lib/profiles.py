@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+import re
+import json
+
+
+# Version source profiles, each regex must have exactly one group (the version):
+# 'tag'       : tag name (relative to 'refs/tags/')
+# 'branch'    : branch name (relative to 'refs/heads/' or 'refs/remotes/<remote>/'),
+#               None if the tree has no version branch
+# 'installed' : '/lib/modules/' folder name (searched)
+# 'normalize' : optional [ regex, replacement ] applied to each extracted version
+profiles = {
+    # Default: any '/lib/modules/' folder is an installed kernel
+    'zen'       :   {
+        'tag'       :   r'v([\d\.]+)-zen.*',
+        'branch'    :   r'(\d+\.\d+)/master',
+        'installed' :   r'([\d\.]+)',
+        'normalize' :   None
+        },
+    # Same as 'zen' but only '-zen' module folder(s) are installed kernel(s)
+    'zen-strict':   {
+        'tag'       :   r'v([\d\.]+)-zen.*',
+        'branch'    :   r'(\d+\.\d+)/master',
+        'installed' :   r'^(\d+\.\d+(?:\.\d+)?)-zen',
+        'normalize' :   None
+        },
+    # torvalds/linux: release tags only (no -rc), no version branch
+    'mainline'  :   {
+        'tag'       :   r'v(\d+\.\d+(?:\.\d+)?)',
+        'branch'    :   None,
+        'installed' :   r'^(\d+\.\d+(?:\.\d+)?)',
+        'normalize' :   None
+        },
+    # stable/linux: 'v5.6.1' tags and 'linux-5.6.y' branches
+    'stable'    :   {
+        'tag'       :   r'v(\d+\.\d+(?:\.\d+)?)',
+        'branch'    :   r'linux-(\d+\.\d+)\.y',
+        'installed' :   r'^(\d+\.\d+(?:\.\d+)?)',
+        'normalize' :   None
+        }
+    }
+
+# Regex metacharacter(s): a glob is derived from the literal prefix / suffix
+_meta = set('\\.^$*+?{}[]|()')
+
+
+def regex_glob(regex):
+    """
+    Return the git glob (one '*') matching at least every name matched by 'regex'
+    (ex: 'v([\\d\\.]+)-zen.*' -> 'v*', '(\\d+\\.\\d+)/master' -> '*/master').
+    """
+    prefix = ''
+    for char in regex:
+        if char in _meta:
+            break
+        prefix += char
+    else:
+        # No metacharacter at all
+        return regex
+    suffix = ''
+    for index in range(len(regex) - 1, len(prefix) - 1, -1):
+        # Escaped char (ex: '\.') is not literal here
+        if regex[index] in _meta or regex[index - 1] == '\\':
+            break
+        suffix = regex[index] + suffix
+    return f'{prefix}*{suffix}'
+
+
+def load_profiles(path):
+    """
+    Return built-in profiles updated with profiles declared in JSON file 'path':
+    { 'name' : { 'tag' : regex, 'branch' : regex or null, 'installed' : regex, 'normalize' : [ regex, repl ] } }
+    Missing key(s) are taken from 'zen' profile. Raise OSError or ValueError.
+    """
+    with open(path, 'r') as myfile:
+        declared = json.load(myfile)
+    if not isinstance(declared, dict):
+        raise ValueError('profiles file should contain an object')
+    loaded = dict(profiles)
+    for name, profile in declared.items():
+        if not isinstance(profile, dict):
+            raise ValueError(f'profile \'{name}\' should be an object')
+        unknown = set(profile) - set(profiles['zen'])
+        if unknown:
+            raise ValueError('profile \'{0}\': unknown key(s): {1}'.format(name, ', '.join(sorted(unknown))))
+        loaded[name] = dict(profiles['zen'], **profile)
+    return loaded
+
+
+
+class Profile:
+    """
+    Compiled version source profile: RefStore patterns, fetch globs and
+    installed kernel mapping. Raise ValueError if a regex is invalid.
+    """
+    def __init__(self, name, tag, branch=None, installed=r'([\d\.]+)', normalize=None):
+        self.name = name
+        for key, regex in ('tag', tag), ('branch', branch), ('installed', installed):
+            if regex is None:
+                continue
+            try:
+                groups = re.compile(regex).groups
+            except re.error as error:
+                raise ValueError(f'profile \'{name}\': invalid {key} regex \'{regex}\': {error}')
+            if not groups == 1:
+                raise ValueError(f'profile \'{name}\': {key} regex should have exactly one group: \'{regex}\'')
+        self.branch = branch
+        # key: kind, value: regex relative to 'refs/' (see RefStore)
+        self.patterns = { 'kernel' : f'tags/{tag}' }
+        # Remote ref(s) to fetch, relative to 'refs/' (see lib.gitrefs.refspecs())
+        self.globs = [ 'heads/' + regex_glob(branch) ] if branch else [ ]
+        self.globs.append('tags/' + regex_glob(tag))
+        if branch:
+            self.patterns['local'] = f'heads/{branch}'
+            self.patterns['remote'] = rf'remotes/\w+/{branch}'
+        self.installed_re = re.compile(installed)
+        self.normalize_re = None
+        if normalize:
+            try:
+                self.normalize_re = (re.compile(normalize[0]), normalize[1])
+            except (re.error, IndexError, TypeError) as error:
+                raise ValueError(f'profile \'{name}\': invalid normalize \'{normalize}\': {error}')
+
+    @classmethod
+    def from_name(cls, name, available=profiles):
+        """Return compiled Profile 'name' from 'available' profiles, raise KeyError or ValueError"""
+        return cls(name, **available[name])
+
+    def normalize(self, version):
+        """Return normalized extracted version"""
+        if self.normalize_re is None:
+            return version
+        return self.normalize_re[0].sub(self.normalize_re[1], version)
+
+    def installed(self, folder):
+        """Return version for '/lib/modules/' folder name, None if it doesn't belong to this profile"""
+        match = self.installed_re.search(folder)
+        if match:
+            return self.normalize(match.group(1))
+        return None
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+import time
+import heapq
+import itertools
+import threading
+import logging
+
+
+# CLOCK_BOOTTIME keep counting during suspend (linux only), so a deadline
+# which expired during suspend is due right after resume.
+if hasattr(time, 'CLOCK_BOOTTIME'):
+    def clock():
+        return time.clock_gettime(time.CLOCK_BOOTTIME)
+else:
+    clock = time.monotonic
+
+
+class Scheduler:
+    """
+    Keep a heap of absolute deadlines for named job(s) (ex: 'pull', 'retry', 'refresh').
+    wait() sleep until the next deadline or until notify() is called.
+    To drive it from another loop: set 'waker' (called on change, from any thread)
+    then use pop_due() and next_timeout().
+    """
+    def __init__(self, resolution=60):
+        self.logger_name = f'::{__name__}::Scheduler::'
+        self.condition = threading.Condition()
+        # (deadline, sequence, name), entry is stale if sequence mismatch self.jobs
+        self.heap = [ ]
+        # name: [deadline, since, sequence, pending], kept after being due (so remain() is negative)
+        self.jobs = { }
+        self.sequence = itertools.count()
+        self.notified = False
+        # Condition.wait() use CLOCK_MONOTONIC which stop during suspend:
+        # never sleep more than 'resolution' seconds so resume is detected
+        self.resolution = resolution
+        self.offset = clock() - time.monotonic()
+        self.waker = None
+
+
+    def schedule(self, name, delay, elapsed=0):
+        """
+        (Re)schedule job 'name' in 'delay' seconds (replace previous deadline),
+        'elapsed' is the time already elapsed since the reference (see elapsed()).
+        """
+        logger = logging.getLogger(f'{self.logger_name}schedule::')
+        with self.condition:
+            now = clock()
+            sequence = next(self.sequence)
+            self.jobs[name] = [ now + delay, now - elapsed, sequence, True ]
+            heapq.heappush(self.heap, (now + delay, sequence, name))
+            logger.debug(f'Job \'{name}\' scheduled in {round(delay)}s.')
+            # Next deadline could be sooner
+            self.condition.notify_all()
+        if self.waker:
+            self.waker()
+
+
+    def cancel(self, name):
+        """Remove job 'name' (heap entry become stale)"""
+        with self.condition:
+            self.jobs.pop(name, None)
+
+
+    def scheduled(self, name):
+        """Return True if job 'name' is waiting for its deadline"""
+        with self.condition:
+            job = self.jobs.get(name)
+            return job is not None and job[3]
+
+
+    def remain(self, name):
+        """Return seconds until job 'name' deadline (negative if overdue), None if unknown"""
+        with self.condition:
+            if not name in self.jobs:
+                return None
+            return self.jobs[name][0] - clock()
+
+
+    def elapsed(self, name):
+        """Return seconds elapsed since job 'name' reference, None if unknown"""
+        with self.condition:
+            if not name in self.jobs:
+                return None
+            return clock() - self.jobs[name][1]
+
+
+    def notify(self):
+        """Wake up wait() (external event)"""
+        with self.condition:
+            self.notified = True
+            self.condition.notify_all()
+        if self.waker:
+            self.waker()
+
+
+    def wait(self):
+        """
+        Block until at least one job is due or notify() is called.
+        Return list of due job name(s) (could be empty if notified).
+        """
+        logger = logging.getLogger(f'{self.logger_name}wait::')
+        with self.condition:
+            while True:
+                due = self.__pop_due()
+                if due or self.notified:
+                    self.notified = False
+                    return due
+                timeout = self.resolution
+                if self.heap:
+                    timeout = min(timeout, max(0, self.heap[0][0] - clock()))
+                self.condition.wait(timeout)
+                # Detect suspend / resume: boottime moved but not monotonic
+                offset = clock() - time.monotonic()
+                if offset - self.offset > 1:
+                    logger.debug(f'Resumed after {round(offset - self.offset)}s of suspend.')
+                self.offset = offset
+
+
+    def pop_due(self):
+        """Return list of due job name(s) without blocking"""
+        with self.condition:
+            self.notified = False
+            return self.__pop_due()
+
+
+    def next_timeout(self):
+        """Return seconds until next deadline (at most 'resolution')"""
+        with self.condition:
+            if self.heap:
+                return max(0, min(self.resolution, self.heap[0][0] - clock()))
+            return self.resolution
+
+
+    def __pop_due(self):
+        """Pop due job(s) from heap (skip stale entries)"""
+        due = [ ]
+        now = clock()
+        while self.heap and self.heap[0][0] <= now:
+            deadline, sequence, name = heapq.heappop(self.heap)
+            job = self.jobs.get(name)
+            if job is not None and job[2] == sequence:
+                job[3] = False
+                due.append(name)
+        return due
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+import os
+import re
+import json
+import pathlib
+import sqlite3
+
+
+# Bump this when stored layout change (and add a migration to _migrations)
+SCHEMA_VERSION = 1
+
+# Canonical integer only (ex: not '007') so str(int(value)) == value
+_int_re = re.compile(r'-?(?:0|[1-9][0-9]*)')
+
+
+def native(value):
+    """
+    Return str option value as JSON native type: 'True' / 'False' as bool,
+    canonical integer as int, otherwise unchanged (str() give back 'value').
+    """
+    if value in ('True', 'False'):
+        return value == 'True'
+    if _int_re.fullmatch(value):
+        return int(value)
+    return value
+
+
+def atomic_write(path, data):
+    """
+    Atomically replace file 'path' with 'data' (str): write a temporary file,
+    fsync it then rename over 'path'. Raise OSError.
+    """
+    path = pathlib.Path(path)
+    tmp = path.with_name(f'.{path.name}.tmp')
+    with tmp.open(mode='w') as myfile:
+        myfile.write(data)
+        myfile.flush()
+        os.fsync(myfile.fileno())
+    os.replace(tmp, path)
+    # Make the rename itself durable
+    dirfd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dirfd)
+    finally:
+        os.close(dirfd)
+
+
+class JsonBackend:
+    """
+    Store options as one JSON document:
+    { 'schema' : SCHEMA_VERSION, 'options' : { option : value } }
+    Version lists are stored as JSON arrays, booleans and integers as JSON
+    native types (see native()), anything else as string.
+    """
+    suffix = '.json'
+
+    def __init__(self, path, listopts=()):
+        self.logger_name = f'::{__name__}::JsonBackend::'
+        self.path = pathlib.Path(path)
+        self.listopts = set(listopts)
+
+    def exists(self):
+        return self.path.is_file()
+
+    def read(self):
+        """Return (schema, dict of option: value as str), raise OSError or ValueError"""
+        with self.path.open(mode='r') as myfile:
+            document = json.load(myfile)
+        options = { }
+        for option, value in document.get('options', { }).items():
+            options[option] = ' '.join(value) if isinstance(value, list) else str(value)
+        return document.get('schema', 0), options
+
+    def write(self, options, changed=None):
+        """Write all options (dict of option: value as str), raise OSError"""
+        document = {
+            'schema'    :   SCHEMA_VERSION,
+            'options'   :   { option : self.__native(option, value) for option, value in options.items() }
+            }
+        atomic_write(self.path, json.dumps(document, indent=4) + '\n')
+
+    def close(self):
+        pass
+
+    def __native(self, option, value):
+        if option in self.listopts:
+            return value.split()
+        return native(value)
+
+
+
+class SqliteBackend:
+    """
+    Store options in a SQLite database, one row per option:
+    changing one value is a single row UPDATE.
+    Each value is JSON encoded like JsonBackend.
+    """
+    suffix = '.db'
+
+    def __init__(self, path, listopts=()):
+        self.logger_name = f'::{__name__}::SqliteBackend::'
+        self.path = pathlib.Path(path)
+        self.listopts = set(listopts)
+        self.connection = None
+
+    def exists(self):
+        return self.path.is_file()
+
+    def read(self):
+        """Return (schema, dict of option: value as str), raise sqlite3.Error"""
+        connection = self.__connect()
+        row = connection.execute('SELECT value FROM meta WHERE key = ?', ('schema', )).fetchone()
+        schema = int(row[0]) if row else 0
+        options = { }
+        for option, value in connection.execute('SELECT option, value FROM options'):
+            value = json.loads(value)
+            options[option] = ' '.join(value) if isinstance(value, list) else str(value)
+        return schema, options
+
+    def write(self, options, changed=None):
+        """
+        Write option(s) (dict of option: value as str), only 'changed' option(s)
+        if specified, raise sqlite3.Error
+        """
+        connection = self.__connect()
+        if changed is None:
+            changed = options
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                               ('schema', str(SCHEMA_VERSION)))
+            connection.executemany('INSERT INTO options (option, value) VALUES (?, ?)'
+                                   + ' ON CONFLICT(option) DO UPDATE SET value = excluded.value',
+                                   [ (option, self.__native(option, options[option])) for option in changed ])
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __connect(self):
+        if self.connection is None:
+            # Used from write-behind thread as well (StateInfo serialize access)
+            self.connection = sqlite3.connect(str(self.path), check_same_thread=False)
+            with self.connection:
+                self.connection.execute('CREATE TABLE IF NOT EXISTS meta'
+                                        + ' (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+                self.connection.execute('CREATE TABLE IF NOT EXISTS options'
+                                        + ' (option TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        return self.connection
+
+    def __native(self, option, value):
+        if option in self.listopts:
+            return json.dumps(value.split())
+        return json.dumps(native(value))
+
+
+
+# Available backend(s), 'text' is the line oriented state file (see StateInfo)
+backends = {
+    'json'      :   JsonBackend,
+    'sqlite'    :   SqliteBackend
+    }
+
+
+def migrate(schema, options):
+    """
+    Migrate options (dict) from schema version 'schema' to SCHEMA_VERSION.
+    Raise ValueError if schema is unknown.
+    """
+    while schema < SCHEMA_VERSION:
+        if not schema in _migrations:
+            raise ValueError(f'no migration from schema version {schema}')
+        options = _migrations[schema](options)
+        schema += 1
+    if schema > SCHEMA_VERSION:
+        raise ValueError(f'schema version {schema} is newer than supported {SCHEMA_VERSION}')
+    return options
+
+
+# key: from schema version, value: function(options) -> options (schema version + 1)
+# Schema 0 is a document without 'schema' field: same layout.
+_migrations = {
+    0   :   lambda options: options
+    }
@@ -6,17 +6,23 @@
 import os
 import pathlib
 import re
-import errno
+import hashlib
 import sys
 import time
 import signal
+import threading
 import gettext
 import locale
 import logging
+import sqlite3
 
-from distutils.version import StrictVersion
-from distutils.util import strtobool
+from collections import namedtuple
 from ctypes import cdll
+from lib.version import parse_version
+from lib.statebackend import atomic_write
+from lib.statebackend import backends
+from lib.statebackend import migrate
+from lib.statebackend import SCHEMA_VERSION
 
 try:
     from babel.dates import format_datetime
@@ -39,6 +45,10 @@ _ = lang_translations.gettext
 
 
 
+# Cost report returned by StateInfo.save()
+SaveCost = namedtuple('SaveCost', [ 'changed', 'skipped', 'written', 'elapsed' ])
+
+
 class StateInfo:
     """
     Write, edit or get info to and from state file
@@ -52,16 +62,49 @@ class StateInfo:
         self.stateopts = kwargs['stateopts']
         # For dry run
         self.dryrun = kwargs.get('dryrun', False)
+        # Write-behind: save() only update the in-memory model and a background
+        # flusher write it at once after 'delay' seconds (0 = write now)
+        self.delay = kwargs.get('delay', 0)
+        self.dirty = False
+        # Option(s) changed since last write
+        self.changed = set()
+        self.timer = None
+        self.lock = threading.RLock()
+        # In-memory model, loaded once by __check_config():
+        # lines: list of [option, value (str)] in statefile order
+        # index: key: option and value: line index
+        # values: key: option and value: converted value (see __convert())
+        self.lines = [ ]
+        self.index = { }
+        self.values = { }
+        # Cumulative cost of save() call(s)
+        self.stats = {
+            'save'      :   0,
+            'changed'   :   0,
+            'skipped'   :   0,
+            'write'     :   0
+            }
         # Re(s) for search over option
         # so normal_opt match everything except line starting with '#'
         self.normal_opt = re.compile(r'^(?!#)(.*):\s(.*)$')
         self.hashtag_opt = re.compile(r'^(#.*)$')
-        # TEST try to wait before exiting if SIGTERM is receive 
-        # and if we are processing something to 'save' (ie write to statefile)
-        # This is not as bad as we think if program exit when we are writing something:
-        # We will only lost theses write but any way this class can rewrite / extract good
-        # opts and remove wrong ones (but we don't know if it could recover from a corrupt file ...)
-        self.saving = False
+        # Checksum header (first line of 'text' statefile): schema is a hash of
+        # the option names (so adding / removing / moving an option invalidate it)
+        # and sha1 is the hash of the rest of the file. If both match on startup
+        # then the file is exactly what we wrote: skip the repair passes.
+        self.header_opt = re.compile(r'^#@\sschema=([0-9a-f]+)\ssha1=([0-9a-f]+)$')
+        self.schema = hashlib.sha1('\n'.join(self.stateopts).encode()).hexdigest()[:16]
+        # Storage backend: 'text' is the line oriented statefile, otherwise
+        # see lib/statebackend.py ('listopts' are option(s) holding version lists)
+        self.backend = kwargs.get('backend', 'text')
+        self.store = None
+        if not self.backend == 'text':
+            path = pathlib.Path(self.pathdir['statelog'])
+            self.store = backends[self.backend](path.with_suffix(backends[self.backend].suffix),
+                                                kwargs.get('listopts', ()))
+        # Statefile is always replaced atomically (temporary file, fsync then rename)
+        # so exiting while writing can't corrupt it. On exit call flush() to write
+        # pending change(s).
         # Detected newfile
         # True if newfile have been create so default opts have been 
         # written, then don't need to load with calling self.load() just load 
@@ -71,12 +114,17 @@ class StateInfo:
         if self.dryrun:
             logger.debug('Dryrun is enable, skip checking/creating statefile.')
             return
-        self.__check_config()
+        if self.store is not None:
+            self.__load_store()
+        else:
+            self.__check_config()
     
     
     def save(self, *args):
         """
-        save specific(s) information(s) to already create statefile
+        save specific(s) information(s) to already create statefile.
+        Each arg is a [option, value] pair, statefile is only written if a value change.
+        Return the cost of the call (SaveCost).
         """
         
         logger = logging.getLogger(f'{self.logger_name}save::') 
@@ -89,63 +137,188 @@ class StateInfo:
                          + f' {call}')
             return
         
-        # This will protect all the process even we could write nothing
-        self.saving = True
-        logger.debug('Setting saving flag to True.')
-        with self.__open('r+') as mystatefile:
-            statefile = mystatefile.readlines()   # Pull the file contents to a list
-            changed = False
+        start = time.perf_counter()
+        changed = 0
+        skipped = 0
+        written = False
+        with self.lock:
             for item in args:
                 option = str(item[0])
                 value = str(item[1])
-                found = False
-                skip = False
-                for index, line in enumerate(statefile):
-                    if re.match(r'^' + option + r':.*$', line):
-                        # make sure save request option != current line option
-                        current_value = re.match(r'^' + option + r':\s*(.*)$', line).group(1)
-                        if current_value == value:
-                            logger.debug(f'Reject requested operation on save for option' 
-                                              + f' \'{option}\', using value: \'{value}\':'
-                                              + f' loaded value is equal ({current_value}).')
-                            # Any way we found it, but we skip
-                            found = True
-                            skip = True
-                            break
-                        logger.debug(f'\'{option}: {value}\'.')
-                        # Change line 
-                        statefile[index] = f'{option}: {value}\n'
-                        found = True
-                        changed = True
-                        break
-                    # We have a problem !
-                if not found and not skip:
-                    logger.debug(f'Match failed for option: {option}: {value} !')
+                index = self.index.get(option)
+                if index is None:
                     logger.error(f'Failed to write \'{option}: {value}\''
                                         + ' to statefile: {0}'.format(self.pathdir['statelog'])
                                         + ' (please report this !)')
-            # So now erase / rewrite only if something change
-            # but it should !!
+                    continue
+                if self.lines[index][1] == value:
+                    # Nothing to do
+                    skipped += 1
+                    continue
+                logger.debug(f'\'{option}: {value}\'.')
+                self.lines[index][1] = value
+                self.values[option] = self.__convert(value)
+                self.changed.add(option)
+                changed += 1
             if changed:
-                #So we are writing to statefile
-                #self.saving = True
-                # Erase the file
-                mystatefile.seek(0)
-                mystatefile.truncate()
-                    
-                for line in statefile:
-                    mystatefile.write(line)
-                # End write
-                #self.saving = False
+                self.dirty = True
+                if not self.delay:
+                    written = self.__flush()
+                elif self.timer is None:
+                    self.__arm()
+            self.stats['save'] += 1
+            self.stats['changed'] += changed
+            self.stats['skipped'] += skipped
+        cost = SaveCost(changed, skipped, written, time.perf_counter() - start)
+        logger.debug(f'Cost: {changed} changed, {skipped} skipped, '
+                     + 'disk write: {0}, {1:.1f}µs.'.format('yes' if written else 'no', cost.elapsed * 1e6))
+        return cost
+    
+    
+    def flush(self):
+        """
+        Write now pending change(s) to statefile (call on exit)
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.__flush()
+    
+    
+    def __arm(self):
+        """Schedule background write in 'delay' seconds (lock held)"""
+        logger = logging.getLogger(f'{self.logger_name}__arm::') 
+        logger.debug(f'Scheduling write to statefile in {self.delay}s.')
+        self.timer = threading.Timer(self.delay, self.__flush_timer)
+        self.timer.daemon = True
+        self.timer.start()
+    
+    
+    def __flush_timer(self):
+        """Background write, retry after 'delay' seconds if it failed"""
+        logger = logging.getLogger(f'{self.logger_name}__flush_timer::') 
+        with self.lock:
+            self.timer = None
+            if not self.__flush() and self.dirty:
+                logger.error(f'Failed to write statefile, retrying in {self.delay}s.')
+                self.__arm()
+    
+    
+    def __flush(self):
+        """
+        Write the in-memory model to statefile (only if something change)
+        """
+        
+        logger = logging.getLogger(f'{self.logger_name}__flush::') 
+        
+        if not self.dirty:
+            logger.debug('Hum... Nothing to write... Ciao...')
+            return False
+        if self.store is not None:
+            try:
+                # Only changed option(s) for sqlite (row update)
+                self.store.write(self.__options(), self.changed)
+            except (OSError, sqlite3.Error) as error:
+                logger.error(f'While writing \'{self.store.path}\' state file: {error}.')
+                return False
+        elif not self.__replace(self.__format(self.lines)):
+            # Stay dirty so next flush will retry
+            return False
+        self.dirty = False
+        self.changed.clear()
+        self.stats['write'] += 1
+        return True
+    
+    
+    def __format(self, statefile):
+        """Return statefile lines from list of [option, value]"""
+        lines = [ ]
+        for option, value in statefile:
+            # Work around for hashtag
+            value = f': {value}' if not value == '' else ''
+            lines.append(f'{option}{value}\n')
+        return lines
+    
+    
+    def __options(self):
+        """Return dict of option: value (str) without hashtag option(s)"""
+        return { option : value for option, value in self.lines if not self.hashtag_opt.match(option) }
+    
+    
+    def __load_store(self):
+        """
+        Load the in-memory model from json / sqlite backend, migrate from older schema
+        or from 'text' statefile if needed. No repair pass: options are stored by name.
+        """
+        
+        logger = logging.getLogger(f'{self.logger_name}__load_store::') 
+        
+        rewrite = True
+        options = { }
+        if self.store.exists():
+            try:
+                schema, options = self.store.read()
+                options = migrate(schema, options)
+            except (OSError, ValueError, sqlite3.Error) as error:
+                logger.error(f'While reading \'{self.store.path}\' state file: {error}.')
+                logger.error('Loading default options (please report this).')
+                options = { }
             else:
-                logger.debug('Hum... Nothing to write... Ciao...')
-        self.saving = False
-        logger.debug('Resetting saving flag to False.') 
+                logger.debug(f'Loaded \'{self.store.path}\' (schema version: {schema}).')
+                rewrite = not schema == SCHEMA_VERSION
+        elif pathlib.Path(self.pathdir['statelog']).is_file():
+            logger.info('Migrating state file \'{0}\''.format(self.pathdir['statelog'])
+                        + f' to \'{self.store.path}\'.')
+            # Repair and load 'text' statefile
+            self.__check_config()
+            options = self.__options()
+        else:
+            self.newfile = True
+            logger.debug(f'Creating state file: {self.store.path}')
+        
+        # Factory order, missing or obsolete option(s) are dropped / set to default
+        self.__build([ option, options.get(option, value) ] for option, value in self.stateopts.items())
+        if rewrite:
+            try:
+                self.store.write(self.__options())
+            except (OSError, sqlite3.Error) as error:
+                logger.critical(f'While writing \'{self.store.path}\' state file: {error}.')
+                logger.critical('Exiting with status \'1\'.')
+                sys.exit(1)
+    
+    
+    def __build(self, statefile):
+        """Build the in-memory model from list of [option, value]"""
+        self.lines = [ [ option, str(value) ] for option, value in statefile ]
+        self.index = { option : index for index, (option, value) in enumerate(self.lines) }
+        self.values = { option : self.__convert(value) for option, value in self.lines 
+                                                       if not self.hashtag_opt.match(option) }
+    
+    
+    def __replace(self, statefile):
+        """
+        Atomically replace statefile with list of line(s): write a temporary file,
+        fsync it then rename over statefile. Return True on success.
+        """
+        
+        logger = logging.getLogger(f'{self.logger_name}__replace::') 
+        
+        path = self.pathdir['statelog']
+        content = ''.join(statefile)
+        header = '#@ schema={0} sha1={1}\n'.format(self.schema, hashlib.sha1(content.encode()).hexdigest())
+        try:
+            atomic_write(path, header + content)
+        except OSError as error:
+            logger.error(f'While writing \'{path}\' state file: {error}.')
+            return False
+        logger.debug(f'Successfully wrote statefile: {path}.')
+        return True
                 
 
     def load(self, *args):
         """
-        Read all opts line (line starting with '#' is ignored)
+        Get all opts from the in-memory model (line starting with '#' is ignored)
         and return as dict with key: option and value: value from line 'option: value'.
         Return all if no args or only specific from args.
         Args should be valid option(s) or it will be rejected.
@@ -162,53 +335,22 @@ class StateInfo:
                            + ' (please report this).')
             return
         
-        logger.debug('Extracting options from statefile: {0}'.format(self.pathdir['statelog']))
-        
-        with self.__open('r') as mystatefile:
-            statefile = [ line.rstrip('\n') for line in mystatefile ]
-        # Ok so we load all strip line from statefile at once
-        # Any way, construct all the dict, then return all if no args, or only specified by args
-        stateopts_load = { }
-        for line in statefile:
-            key = False
-            value = False
-            if self.normal_opt.match(line):
-                key = self.normal_opt.match(line).group(1)
-                # So try to convert value
-                value = self.normal_opt.match(line).group(2)
-                value = self.__convert(value)
-                logger.debug(f'Add key: \'{key}\' and value: \'{value}\' to load list.')
-                stateopts_load[key] = value
-            else:
-                logger.debug(f'Reject line: \'{line}\'.')
-        # Ok so now we have construct dict then return all if full=True or key specified by to_load
-        if not stateopts_load:
-            logger.debug('Failed to parse options: nothing have been add to load list...')
-            logger.error('Failed to parse options for statefile:' 
-                              + ' {0}'.format(self.pathdir['statelog']))
-            # So load default values from self.stateopts
-            for key, value in self.stateopts.items():
-                if not re.match(r'^#.*$', key):
-                    # Don't need to convert because self.stateopts have already good type
-                    logger.debug(f'Add default key: \'{key}\' and default' 
-                                      + f' value: \'{value}\' to load list.')
-                    stateopts_load[key] = value
-            logger.error('Loaded default options for statefile (please report this).')
-        
+        # Already loaded and converted by __check_config(): O(k)
         if not args:
             logger.debug('Returning all load list.')
-            return stateopts_load
+            with self.lock:
+                return dict(self.values)
         
         partial_stateopts_load = { }
         for item in args:
             try:
-                partial_stateopts_load[item] = stateopts_load[item]
+                partial_stateopts_load[item] = self.values[item]
             except KeyError as error:
                 logger.debug(f'Reject wrong load request: \'{item}\'')
                 continue
             else:
                 logger.debug(f'Returning requested \'{item}\':' 
-                                  + f' \'{stateopts_load[item]}\'.')
+                                  + f' \'{self.values[item]}\'.')
         return partial_stateopts_load if partial_stateopts_load else False
         
 
@@ -218,19 +360,12 @@ class StateInfo:
         """
         logger = logging.getLogger(f'{self.logger_name}__open::') 
         msg = 'writing' if request_mode == 'r+' else 'reading'
-        #msg = 'reading'
-        #if request_mode == 'r+':
-            #msg = 'writing'
-            #self.saving = True
-            #logger.debug('Setting saving flag to True')
         try:
             if pathlib.Path(self.pathdir['statelog']).is_file():
                 logger.debug(f"Opening \'{self.pathdir['statelog']}\' for {msg}.")
                 return pathlib.Path(self.pathdir['statelog']).open(mode=request_mode)
             else:
                 msg = 'creating'
-                #self.saving = True
-                #logger.debug('Setting saving flag to True')
                 logger.debug(f"Creating state file: {self.pathdir['statelog']}")
                 return pathlib.Path(self.pathdir['statelog']).open(mode='w')
         except (OSError, IOError) as error:
@@ -238,22 +373,18 @@ class StateInfo:
                             + f' state file: {error}.')
             logger.critical('Exiting with status \'1\'.')
             sys.exit(1)
-        #finally:
-            #Reset saving to False
-            #self.saving = False
-            #logger.debug('Resetting saving flag to False')
     
     
     def __convert(self, opt):
         """
         Try to convert opt from str() to int() or bool()
-        if failed return original opt (so str()), StrictVersion need str()
+        if failed return original opt (so str()), parse_version() need str()
         """
         logger = logging.getLogger(f'{self.logger_name}__convert::') 
         from_type = type(opt)
         converters = {
             'int'   :   int,
-            'bool'  :   [ bool, strtobool ]
+            'bool'  :   [ bool, _strtobool ]
             }
         for key, convert in converters.items():
             try:
@@ -272,7 +403,7 @@ class StateInfo:
     
     def __compare(self, *opts, **kwargs):
         """
-        compare vars using type int() or type StrictVersion() and return greatest if possible
+        compare vars using type int() or version key (parse_version()) and return greatest if possible
         """
         logger = logging.getLogger(f'{self.logger_name}__compare::') 
         
@@ -283,21 +414,19 @@ class StateInfo:
                           + ' \'{0}\'.'.format(', '.join(str(x) for x in opts)))
         # Do we need to compare ?
         if len(opts) == 1:
-            # we don't really know what we return: mean it could type != StrictVersion()/int()
+            # we don't really know what we return: mean it could type != version/int()
             return opts[0]
         # Ok then compare
         ref_type = {
             'int'           :   int,
-            'StrictVersion' :   StrictVersion
+            'version'       :   parse_version
             }
         validate = [ ]
         greatest = False
         for key, comparator in ref_type.items():
             for value in opts:
                 try:
-                    # fixbug: AttributeError: 'StrictVersion' object has no attribute 'version'
-                    # convert to str() because 'False' will match with filter StrictVersion (?!?) 
-                    # then throw AttributeError at the second loop (validate)...
+                    # convert to str() because parse_version() only accept str()
                     comparator(str(value))
                 except ValueError as error:
                     logger.debug(f'Reject \'{value}\' mismatch filter {key}(): {error}')
@@ -307,11 +436,11 @@ class StateInfo:
             if validate:
                 greatest = validate[0]
                 for value in validate:
-                    # OK try to fix same bug ...
+                    # Same here
                     try:
-                        if comparator(value) > comparator(greatest):
+                        if comparator(str(value)) > comparator(str(greatest)):
                             greatest = value
-                    except AttributeError as error:
+                    except ValueError as error:
                         logger.debug(f'Reject \'{value}\' mismatch filter {key}(): {error}')
                         greatest = False
                         break
@@ -320,6 +449,24 @@ class StateInfo:
         return greatest
                 
                 
+    def __verify(self, content):
+        """Return True if checksum header (first line) match schema and content"""
+        
+        logger = logging.getLogger(f'{self.logger_name}__verify::') 
+        
+        match = self.header_opt.match(content[0].rstrip('\n')) if content else None
+        if not match:
+            logger.debug('No checksum header found.')
+            return False
+        if not match.group(1) == self.schema:
+            logger.debug(f'Schema mismatch: current: \'{self.schema}\', found: \'{match.group(1)}\'.')
+            return False
+        if not hashlib.sha1(''.join(content[1:]).encode()).hexdigest() == match.group(2):
+            logger.debug('Content checksum mismatch.')
+            return False
+        return True
+    
+    
     def __check_config(self):
         """
         Check state file and its options, eventually create and add default options.
@@ -328,218 +475,217 @@ class StateInfo:
         
         logger = logging.getLogger(f'{self.logger_name}__check_config::') 
         
-        self.saving = True
-        logger.debug('Setting saving flag to True.')
-        with self.__open('r+') as mystatefile:
-            if mystatefile.mode == 'w':
-                self.newfile = True
-                # Same here we are writig to statefile
-                #self.saving = True
-                for option, value in self.stateopts.items():
-                    value = f': {value}' if not value == '' else ''
-                    logger.debug(f'Adding default option: \'{option}{value}\'')
-                    mystatefile.write(f'{option}{value}\n')
-                # End writing
-                #self.saving = False
-            else:
-                logger.debug('Inspecting state file: {0}'.format(self.pathdir['statelog']))
-                
-                # Ok so we have to reconstruct statefile list 
-                # and remove all bad, wrong option 
-                # move to right place good one (first pass)
-                # Second pass, add missing option (at the end)
-                # Third pass : merge duplicate / select greatest if possible
-                # extract key (option) / value form dict and make lists to access from index
-                default_option = list(self.stateopts)
-                default_value = list(self.stateopts.values())
-                changed = False
-                statefile = [ ]
-                tomerge = { }
-                nline = 1
-                index = 0
-                # First pass
-                for line in mystatefile:
-                    # Remove '\n'
-                    line = line.rstrip('\n')
-                    found = False
-                    ref = False
-                    option = False
-                    value = False
-                    ## For bad option
-                    # And also extract option / value from current line
-                    if self.hashtag_opt.match(line):
-                        ref = 'hashtag_opt'
-                        option = self.hashtag_opt.match(line).group(1)
-                        value = ''
-                    elif self.normal_opt.match(line):
-                        ref = 'normal_opt'
-                        option = self.normal_opt.match(line).group(1)
-                        value = self.normal_opt.match(line).group(2)
-                    else:
-                        changed = True
-                        if len(self.stateopts) < index+1:
-                            logger.debug(f'Reject out of range line {nline}, mismatch any filters: \'{line}\'.')
-                            nline += 1
-                            continue
-                        else:
-                            logger.debug(f'Reject line {nline}, mismatch any filters: \'{line}\'.')
-                            # Then add default option
-                            statefile.append([ default_option[index], default_value[index] ])
-                            msg = ''
-                            if not default_value[index] == '':
-                                msg = f': {default_value[index]}'
-                            logger.debug(f'Adding default option to line {nline}:'
-                                            + ' \'{0}{1}\'.'.format(default_option[index], msg))
-                            nline += 1
-                            index += 1
-                            continue
-                    # line match regular expressions
-                    ## For wrong option
-                    if not option in self.stateopts:
-                        changed = True
-                        if len(self.stateopts) < index+1:
-                            logger.debug(f'Reject out of range line {nline},' 
-                                              + f' wrong or obsolete option: \'{line}\'.')
-                            nline += 1
-                            continue
-                        else:
-                            logger.debug(f'Reject line {nline}, wrong or obsolete option: \'{line}\'.')
-                            # Then add default option
-                            statefile.append([ default_option[index], default_value[index] ])
-                            msg = ''
-                            if not default_value[index] == '':
-                                msg = f': {default_value[index]}'
-                            # index+1 over nline
-                            logger.debug('Adding default option to line {0}:'.format(index+1)
-                                            + ' \'{0}{1}\'.'.format(default_option[index], msg))
-                            nline += 1
-                            index += 1
-                            continue
-                    ## Now at this point: line is validate, it's a valid option
-                    ## For right place option
-                    # First: if index is out of range then add to tomerge list (only if not hashtag)
+        if not pathlib.Path(self.pathdir['statelog']).is_file():
+            self.newfile = True
+            logger.debug(f"Creating state file: {self.pathdir['statelog']}")
+            for option, value in self.stateopts.items():
+                logger.debug(f'Adding default option: \'{option}\' with value: \'{value}\'')
+            self.__build(self.stateopts.items())
+            if not self.__replace(self.__format(self.lines)):
+                logger.critical('Failed to create state file, exiting with status \'1\'.')
+                sys.exit(1)
+        else:
+            with self.__open('r') as mystatefile:
+                content = mystatefile.readlines()
+            
+            # Fast path: checksum header match, load directly
+            if self.__verify(content):
+                logger.debug('Checksum header match, loading state file: {0}'.format(self.pathdir['statelog']))
+                self.__build([ self.normal_opt.match(line).groups() if self.normal_opt.match(line) 
+                               else (line, '') for line in (line.rstrip('\n') for line in content[1:]) ])
+                return
+            # Header is never an option (and could be missing: older version / edited by hand)
+            if content and self.header_opt.match(content[0].rstrip('\n')):
+                content = content[1:]
+            logger.debug('Inspecting state file: {0}'.format(self.pathdir['statelog']))
+            
+            # Ok so we have to reconstruct statefile list 
+            # and remove all bad, wrong option 
+            # move to right place good one (first pass)
+            # Second pass, add missing option (at the end)
+            # Third pass : merge duplicate / select greatest if possible
+            # extract key (option) / value form dict and make lists to access from index
+            default_option = list(self.stateopts)
+            default_value = list(self.stateopts.values())
+            changed = False
+            statefile = [ ]
+            tomerge = { }
+            nline = 1
+            index = 0
+            # First pass
+            for line in content:
+                # Remove '\n'
+                line = line.rstrip('\n')
+                found = False
+                ref = False
+                option = False
+                value = False
+                ## For bad option
+                # And also extract option / value from current line
+                if self.hashtag_opt.match(line):
+                    ref = 'hashtag_opt'
+                    option = self.hashtag_opt.match(line).group(1)
+                    value = ''
+                elif self.normal_opt.match(line):
+                    ref = 'normal_opt'
+                    option = self.normal_opt.match(line).group(1)
+                    value = self.normal_opt.match(line).group(2)
+                else:
+                    changed = True
                     if len(self.stateopts) < index+1:
-                        logger.debug(f'Found out of range option at line {nline}: \'{line}\'.')
-                        changed = True
-                        # append tomerge list only normal_opt
-                        if ref == 'hashtag_opt':
-                            logger.debug(f'Unselect line {nline}, hashtag option merging is useless: \'{line}\'.')
-                            continue
-                        # the key will be the option and list will be value
-                        if not option in tomerge:
-                            tomerge[option] = [ ]
-                        tomerge[option].append(value)
+                        logger.debug(f'Reject out of range line {nline}, mismatch any filters: \'{line}\'.')
+                        nline += 1
                         continue
-                        # Nothing to had because self.stateopts is IndexError (out of range)
-                    # Second check if it's in good place
-                    if not default_option[index] == option:
-                        logger.debug(f'Found unexcepted option at line {nline}: \'{line}\'.')
-                        changed = True
-                        # append tomerge list only normal_opt
-                        if ref == 'hashtag_opt':
-                            logger.debug(f'Unselect line {nline}, hashtag option merging is useless: \'{line}\'.')
-                            continue
-                        # the key will be the option and list will be value
-                        if not option in tomerge:
-                            tomerge[option] = [ ]
-                        tomerge[option].append(value)
+                    else:
+                        logger.debug(f'Reject line {nline}, mismatch any filters: \'{line}\'.')
                         # Then add default option
                         statefile.append([ default_option[index], default_value[index] ])
                         msg = ''
                         if not default_value[index] == '':
                             msg = f': {default_value[index]}'
-                        logger.debug('Adding default option to line {0}:'.format(index+1)
+                        logger.debug(f'Adding default option to line {nline}:'
                                         + ' \'{0}{1}\'.'.format(default_option[index], msg))
-                        # We add something so increment vars
-                        index += 1
                         nline += 1
-                        # Then jump to the next item
+                        index += 1
                         continue
-                    ## All are validate
-                    # Write to statefile list of list the validate line
-                    logger.debug(f'Option Validate on line {nline}: \'{line}\'')
-                    statefile.append([option, value ])
-                    # increment vars
-                    index += 1
-                    nline += 1
-               
-                # Second pass: check missing option (at the end)
-                nline = index + 1
-                if len(statefile) < len(self.stateopts):
+                # line match regular expressions
+                ## For wrong option
+                if not option in self.stateopts:
                     changed = True
-                    for index in range(index, len(self.stateopts)):
+                    if len(self.stateopts) < index+1:
+                        logger.debug(f'Reject out of range line {nline},' 
+                                          + f' wrong or obsolete option: \'{line}\'.')
+                        nline += 1
+                        continue
+                    else:
+                        logger.debug(f'Reject line {nline}, wrong or obsolete option: \'{line}\'.')
+                        # Then add default option
                         statefile.append([ default_option[index], default_value[index] ])
                         msg = ''
                         if not default_value[index] == '':
                             msg = f': {default_value[index]}'
-                        logger.debug(f'Adding default option to line {nline}:'
-                                          + ' \'{0}{1}\'.'.format(default_option[index], msg))
+                        # index+1 over nline
+                        logger.debug('Adding default option to line {0}:'.format(index+1)
+                                        + ' \'{0}{1}\'.'.format(default_option[index], msg))
                         nline += 1
-                
-                # Third pass: duplicate value / default value to greater
-                # So here there is only normal_opt which will be merged
-                if tomerge:
-                    for item in statefile:
-                        # If duplicate exits
-                        if item[0] in tomerge:
-                            # Try to compare using int() then StrictVersion()
-                            greatest = self.__compare(*tomerge[item[0]], item[1], option=item[0])
-                            logger.name = f'{self.logger_name}config::'
-                            if greatest:        
-                                logger.debug(f'Merging value for option \'{item[0]}\':'
-                                                    + f' current: \'{item[1]}\', newer: \'{greatest}\'.')
-                                item[1] = greatest
-                                continue
-                            logger.debug('All filters failed, data cannot be' 
-                                            + f' compared/merged for option \'{item[0]}\':'
-                                            + ' \'{0}\'.'.format('|'.join(tomerge[item[0]])))
-                            # First test if current value != default_value then keep it
-                            # make self.stateopts str() because extracted value is/are str()
-                            if not item[1] == str(self.stateopts[item[0]]):
-                                logger.debug(f'Keeping value \'{item[1]}\'' 
-                                                + f' (over: default_value=\'{self.stateopts[item[0]]}\' and' 
+                        index += 1
+                        continue
+                ## Now at this point: line is validate, it's a valid option
+                ## For right place option
+                # First: if index is out of range then add to tomerge list (only if not hashtag)
+                if len(self.stateopts) < index+1:
+                    logger.debug(f'Found out of range option at line {nline}: \'{line}\'.')
+                    changed = True
+                    # append tomerge list only normal_opt
+                    if ref == 'hashtag_opt':
+                        logger.debug(f'Unselect line {nline}, hashtag option merging is useless: \'{line}\'.')
+                        continue
+                    # the key will be the option and list will be value
+                    if not option in tomerge:
+                        tomerge[option] = [ ]
+                    tomerge[option].append(value)
+                    continue
+                    # Nothing to had because self.stateopts is IndexError (out of range)
+                # Second check if it's in good place
+                if not default_option[index] == option:
+                    logger.debug(f'Found unexcepted option at line {nline}: \'{line}\'.')
+                    changed = True
+                    # append tomerge list only normal_opt
+                    if ref == 'hashtag_opt':
+                        logger.debug(f'Unselect line {nline}, hashtag option merging is useless: \'{line}\'.')
+                        continue
+                    # the key will be the option and list will be value
+                    if not option in tomerge:
+                        tomerge[option] = [ ]
+                    tomerge[option].append(value)
+                    # Then add default option
+                    statefile.append([ default_option[index], default_value[index] ])
+                    msg = ''
+                    if not default_value[index] == '':
+                        msg = f': {default_value[index]}'
+                    logger.debug('Adding default option to line {0}:'.format(index+1)
+                                    + ' \'{0}{1}\'.'.format(default_option[index], msg))
+                    # We add something so increment vars
+                    index += 1
+                    nline += 1
+                    # Then jump to the next item
+                    continue
+                ## All are validate
+                # Write to statefile list of list the validate line
+                logger.debug(f'Option Validate on line {nline}: \'{line}\'')
+                statefile.append([option, value ])
+                # increment vars
+                index += 1
+                nline += 1
+           
+            # Second pass: check missing option (at the end)
+            nline = index + 1
+            if len(statefile) < len(self.stateopts):
+                changed = True
+                for index in range(index, len(self.stateopts)):
+                    statefile.append([ default_option[index], default_value[index] ])
+                    msg = ''
+                    if not default_value[index] == '':
+                        msg = f': {default_value[index]}'
+                    logger.debug(f'Adding default option to line {nline}:'
+                                      + ' \'{0}{1}\'.'.format(default_option[index], msg))
+                    nline += 1
+            
+            # Third pass: duplicate value / default value to greater
+            # So here there is only normal_opt which will be merged
+            if tomerge:
+                for item in statefile:
+                    # If duplicate exits
+                    if item[0] in tomerge:
+                        # Try to compare using int() then parse_version()
+                        greatest = self.__compare(*tomerge[item[0]], item[1], option=item[0])
+                        logger.name = f'{self.logger_name}config::'
+                        if greatest:        
+                            logger.debug(f'Merging value for option \'{item[0]}\':'
+                                                + f' current: \'{item[1]}\', newer: \'{greatest}\'.')
+                            item[1] = greatest
+                            continue
+                        logger.debug('All filters failed, data cannot be' 
+                                        + f' compared/merged for option \'{item[0]}\':'
+                                        + ' \'{0}\'.'.format('|'.join(tomerge[item[0]])))
+                        # First test if current value != default_value then keep it
+                        # make self.stateopts str() because extracted value is/are str()
+                        if not item[1] == str(self.stateopts[item[0]]):
+                            logger.debug(f'Keeping value \'{item[1]}\'' 
+                                            + f' (over: default_value=\'{self.stateopts[item[0]]}\' and' 
+                                            + ' list=\'{0}\')'.format('|'.join(tomerge[item[0]]))
+                                            + f' for option: \'{item[0]}\'.')
+                        else:
+                            # Pick the first value in the list 
+                            # which is != default_value
+                            found = False
+                            for value in tomerge[item[0]]:
+                                # same here: make str() 
+                                if not value == str(self.stateopts[item[0]]):
+                                    logger.debug(f'Selecting arbitrarily: \'{value}\'' 
+                                            + f' (over: default_value=\'{self.stateopts[item[0]]}\' and' 
+                                            + ' list=\'{0}\')'.format('|'.join(tomerge[item[0]]))
+                                            + f' for option: \'{option}\'.')
+                                    item[1] = value
+                                    found = True
+                                    break
+                            if not found:
+                                # Ok so take default_value...
+                                logger.debug(f'Selecting default value: \'{self.stateopts[item[0]]}\'' 
+                                                + f' (over: current=\'{item[1]}\' and' 
                                                 + ' list=\'{0}\')'.format('|'.join(tomerge[item[0]]))
                                                 + f' for option: \'{item[0]}\'.')
-                            else:
-                                # Pick the first value in the list 
-                                # which is != default_value
-                                found = False
-                                for value in tomerge[item[0]]:
-                                    # same here: make str() 
-                                    if not value == str(self.stateopts[item[0]]):
-                                        logger.debug(f'Selecting arbitrarily: \'{value}\'' 
-                                                + f' (over: default_value=\'{self.stateopts[item[0]]}\' and' 
-                                                + ' list=\'{0}\')'.format('|'.join(tomerge[item[0]]))
-                                                + f' for option: \'{option}\'.')
-                                        item[1] = value
-                                        found = True
-                                        break
-                                if not found:
-                                    # Ok so take default_value...
-                                    logger.debug(f'Selecting default value: \'{self.stateopts[item[0]]}\'' 
-                                                    + f' (over: current=\'{item[1]}\' and' 
-                                                    + ' list=\'{0}\')'.format('|'.join(tomerge[item[0]]))
-                                                    + f' for option: \'{item[0]}\'.')
-                                    item[1] = self.stateopts[item[0]]
-                # End piouff ;p
+                                item[1] = self.stateopts[item[0]]
+            # End piouff ;p
+            # Statefile is loaded only here
+            self.__build(statefile)
+            # Re-stamp header even if nothing changed, so next start use fast path
+            if self.__replace(self.__format(self.lines)):
                 if changed:
-                    # Same here set saving to True wa are writing
-                    #self.saving = True
-                    # Erase file
-                    mystatefile.seek(0)
-                    mystatefile.truncate()
-                    for option in statefile:
-                        # Work around for hashtag
-                        value = f': {option[1]}' if not option[1] == '' else ''
-                        line = f'{option[0]}{value}\n'
-                        mystatefile.write(line)
-                    # End writing
-                    #self.saving = False
                     logger.debug('Write changes to statefile: Success.')
                 else:
-                    logger.debug('All good, keeping previously state file untouched.')
-        self.saving = False
-        logger.debug('Resetting saving flag to False.')
+                    logger.debug('All good, only checksum header have been updated.')
+
 
 
 
@@ -863,6 +1009,18 @@ class FormatTimestamp:
 
 
 
+def _strtobool(value):
+    """
+    Convert a string representation of truth to 1 or 0 (same as distutils.util.strtobool)
+    """
+    value = value.lower()
+    if value in ('y', 'yes', 't', 'true', 'on', '1'):
+        return 1
+    elif value in ('n', 'no', 'f', 'false', 'off', '0'):
+        return 0
+    raise ValueError(f'invalid truth value \'{value}\'')
+
+
 # TODO Should we need logger ???
 # Taken from https://gist.github.com/evansd/2346614
 def on_parent_exit(signame='SIGTERM'):
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+import re
+
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+from functools import lru_cache
+
+
+# Same as distutils StrictVersion (without pre-release tag): 'x.y' or 'x.y.z'
+# (used with fullmatch(): '$' would accept a trailing newline)
+_version_re = re.compile(r'(\d+)\.(\d+)(?:\.(\d+))?')
+# Packed version: 21 bits per number (major, minor, patch) + 1 bit
+# to remember short form ('5.6' vs '5.6.0') = 64 bits
+_bits = 21
+_mask = (1 << _bits) - 1
+
+
+class Version(tuple):
+    """
+    Immutable version key: (major, minor, patch) int tuple.
+    Compare like StrictVersion ('5.6' == '5.6.0') but at tuple speed.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return '.'.join(str(number) for number in self)
+
+    def __repr__(self):
+        return f'Version(\'{self}\')'
+
+
+@lru_cache(maxsize=16384)
+def parse_version(version):
+    """
+    Return the Version key for string 'version', each string is parsed only once.
+    Raise ValueError if version is invalid (like StrictVersion).
+    """
+    match = _version_re.fullmatch(version)
+    if not match:
+        raise ValueError(f'invalid version number \'{version}\'')
+    return Version((int(match.group(1)), int(match.group(2)), int(match.group(3) or 0)))
+
+
+class VersionDelta:
+    """What changed between two version lists (see diff_versions())"""
+    __slots__ = ('added', 'removed', 'unchanged', 'changed')
+
+    def __init__(self, added=(), removed=(), unchanged=0, changed=False):
+        # Factory version ('0.0') is never listed in added / removed
+        self.added = list(added)
+        self.removed = list(removed)
+        self.unchanged = unchanged
+        # True even if only factory version changed
+        self.changed = changed
+
+    def __bool__(self):
+        return self.changed
+
+    def __repr__(self):
+        return (f'VersionDelta(added={self.added}, removed={self.removed},'
+                f' unchanged={self.unchanged})')
+
+
+def diff_versions(old, new):
+    """
+    Compare two version lists using sets (O(n + m)) and return a VersionDelta.
+    """
+    factory = parse_version('0.0')
+    if isinstance(old, VersionSet) and isinstance(new, VersionSet):
+        return old.diff(new)
+    old_keys = { parse_version(version) for version in old }
+    new_keys = { parse_version(version) for version in new }
+    added = [ version for version in new if not parse_version(version) in old_keys ]
+    removed = [ version for version in old if not parse_version(version) in new_keys ]
+    return VersionDelta(added=[ version for version in added if not parse_version(version) == factory ],
+                        removed=[ version for version in removed if not parse_version(version) == factory ],
+                        unchanged=len(new_keys) - len(added),
+                        changed=bool(added or removed))
+
+
+@lru_cache(maxsize=16384)
+def pack_version(version):
+    """
+    Return version string packed into a 64 bits unsigned integer,
+    integer order is the same as version order.
+    """
+    key = parse_version(version)
+    if any(number > _mask for number in key):
+        raise ValueError(f'version number too large to be packed \'{version}\'')
+    short = 1 if version.count('.') == 1 else 0
+    return (((key[0] << (2 * _bits)) | (key[1] << _bits) | key[2]) << 1) | short
+
+
+def unpack_version(packed):
+    """Return version string from packed integer (see pack_version())"""
+    value = packed >> 1
+    major, minor, patch = value >> (2 * _bits), (value >> _bits) & _mask, value & _mask
+    if packed & 1:
+        return f'{major}.{minor}'
+    return f'{major}.{minor}.{patch}'
+
+
+class VersionSet:
+    """
+    Compact sorted set of versions: each version is packed into a
+    fixed width integer (see pack_version()) and stored in an array('Q').
+    Iterate / index like a sorted list of version strings.
+    """
+    __slots__ = ('_array', '_string')
+
+    def __init__(self, versions=()):
+        if isinstance(versions, VersionSet):
+            self._array = array('Q', versions._array)
+        else:
+            # Remove duplicate ('5.6' and '5.6.0' are the same): first one win
+            packed = { }
+            for version in versions:
+                value = pack_version(version)
+                packed.setdefault(value >> 1, value)
+            self._array = array('Q', sorted(packed.values()))
+        # Serialization cache (see __str__())
+        self._string = None
+
+    @classmethod
+    def from_string(cls, string):
+        """Return VersionSet from space separated version string (state file format)"""
+        return cls(str(string).split())
+
+    @classmethod
+    def frombytes(cls, data):
+        """Return VersionSet from tobytes() output"""
+        versionset = cls()
+        versionset._array.frombytes(data)
+        return versionset
+
+    def tobytes(self):
+        """Return packed array as bytes"""
+        return self._array.tobytes()
+
+    def __str__(self):
+        if self._string is None:
+            self._string = ' '.join(self)
+        return self._string
+
+    def __repr__(self):
+        return f'VersionSet(\'{self}\')'
+
+    def __len__(self):
+        return len(self._array)
+
+    def __iter__(self):
+        return (unpack_version(packed) for packed in self._array)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            versionset = VersionSet()
+            versionset._array = self._array[index]
+            return versionset
+        return unpack_version(self._array[index])
+
+    def __contains__(self, version):
+        return self.__find(pack_version(version)) is not None
+
+    def __eq__(self, other):
+        if isinstance(other, VersionSet):
+            # Compare without short form bit
+            return len(self) == len(other) and all((mine >> 1) == (their >> 1) 
+                                                   for mine, their in zip(self._array, other._array))
+        return NotImplemented
+
+    def copy(self):
+        return VersionSet(self)
+
+    def clear(self):
+        del self._array[:]
+        self._string = None
+
+    def add(self, version):
+        """Sorted insert of version (nothing if already in)"""
+        packed = pack_version(version)
+        if self.__find(packed) is None:
+            self._array.insert(bisect_left(self._array, packed & ~1), packed)
+            self._string = None
+
+    def discard(self, version):
+        """Remove version if present"""
+        index = self.__find(pack_version(version))
+        if index is not None:
+            del self._array[index]
+            self._string = None
+
+    def update(self, other):
+        """Merge other VersionSet (sorted merge, O(n + m))"""
+        merged = array('Q')
+        mine, their = self._array, VersionSet(other)._array
+        i = j = 0
+        while i < len(mine) and j < len(their):
+            if (mine[i] >> 1) < (their[j] >> 1):
+                merged.append(mine[i])
+                i += 1
+            elif (mine[i] >> 1) > (their[j] >> 1):
+                merged.append(their[j])
+                j += 1
+            else:
+                merged.append(mine[i])
+                i += 1
+                j += 1
+        merged.extend(mine[i:])
+        merged.extend(their[j:])
+        self._array = merged
+        self._string = None
+
+    def difference(self, other):
+        """Return a new VersionSet with versions which are not in other"""
+        keys = { packed >> 1 for packed in VersionSet(other)._array }
+        versionset = VersionSet()
+        versionset._array = array('Q', (packed for packed in self._array if not (packed >> 1) in keys))
+        return versionset
+
+    def diff(self, new):
+        """Return VersionDelta between self (old) and new VersionSet"""
+        factory = pack_version('0.0') >> 1
+        added = new.difference(self)
+        removed = self.difference(new)
+        return VersionDelta(added=(unpack_version(packed) for packed in added._array if not (packed >> 1) == factory),
+                            removed=(unpack_version(packed) for packed in removed._array 
+                                     if not (packed >> 1) == factory),
+                            unchanged=len(new) - len(added),
+                            changed=bool(added or removed))
+
+    def greater_than(self, version):
+        """Return VersionSet (slice) of version(s) greater than 'version' - O(log n)"""
+        return self[self.__upper(version):]
+
+    def count_newer(self, version):
+        """Return how many version(s) are greater than 'version' - O(log n)"""
+        return len(self._array) - self.__upper(version)
+
+    def latest(self):
+        """Return the greatest version (None if empty)"""
+        return unpack_version(self._array[-1]) if self._array else None
+
+    def __upper(self, version):
+        """Index of the first version greater than 'version'"""
+        return bisect_right(self._array, pack_version(version) | 1)
+
+    def __find(self, packed):
+        """Index of packed version (whatever the short form bit) or None"""
+        index = bisect_left(self._array, packed & ~1)
+        if index < len(self._array) and (self._array[index] >> 1) == (packed >> 1):
+            return index
+        return None
@@ -67,13 +67,19 @@ import pathlib
 import time
 import re
 import errno
-import asyncio
+import math
+import signal
 import threading
 
+from concurrent.futures import ThreadPoolExecutor
+
 from gitdbus import GitDbus
 from gitmanager import check_git_dir
 from gitmanager import GitWatcher
+from maindaemon import MainDaemon
 from argsparser import DaemonParserHandler
+from lib.scheduler import Scheduler
+from lib.channel import RequestChannel
 
 try:
     from gi.repository import GLib
@@ -85,142 +91,113 @@ except Exception as exc:
 
 
 
-class MainDaemon(threading.Thread):
-    def __init__(self, mygit, *args, **kwargs):
-        self.logger_name = f'::{__name__}::MainDaemonThread::'
-        logger = logging.getLogger(f'{self.logger_name}init::')
-        super().__init__(*args, **kwargs)
-        self.mygit = mygit
-        # Init asyncio loop
-        self.scheduler = asyncio.new_event_loop()
-        # TEST Change te log level of asyncio 
-        # to be the same as RootLogger
-        currentlevel = logger.getEffectiveLevel()
-        logger.debug(f'Setting log level for asyncio to: {currentlevel}')
-        logging.getLogger('asyncio').setLevel(currentlevel)
+class SingleLoop:
+    """
+    Drive GitWatcher, Scheduler and MainDaemon from the GLib main loop (--single-loop):
+    inotify fds are GLib io watches, deadlines are GLib timeouts and everything
+    run in the loop thread: only git itself run in the pull worker, which queue
+    state change(s) back to the loop (see GitHandler.dispatch()).
+    """
+    def __init__(self, daemon, watcher):
+        self.logger_name = f'::{__name__}::SingleLoop::'
+        self.daemon = daemon
+        self.watcher = watcher
+        self.scheduler = daemon.scheduler
+        # GLib source id(s)
+        self.deadline_id = None
+        self.burst_id = None
+        # Dispatch already queued
+        self.queued = False
     
-    def run(self):
-        logger = logging.getLogger(f'{self.logger_name}run::')
-        logger.info('Start up completed.')
-        while True:
-            # TEST workaround but it have more latency 
-            if self.mygit['watcher'].tasks['pull']['inprogress']:
-                self.mygit['manager'].pull_state = True
-            else:
-                self.mygit['manager'].pull_state = True
-            ### End workaround
-            # TEST now watcher will handle update call depending on condition 
-            # TEST Only update every 30s 
-            if self.mygit['manager'].update:
-                # pull have been run, request refresh 
-                if self.mygit['watcher'].tasks['pull']['requests']['pending'] \
-                    and not self.mygit['manager'].pull['status'] \
-                    and not self.mygit['watcher'].tasks['pull']['inprogress'] \
-                    and not self.mygit['watcher'].repo_read:
-                    # Wait until there is nothing more to read (so pack all the request together)
-                    # TODO we could wait 10s before processing ? (so make sure every thing is packed)
-                    # Any way this have to be more TEST-ed
-                    # Ok enumerate request(s) on pull and save latest
-                    # This will 'block' to the latest know request (know in main)
-                    pull_requests = self.mygit['watcher'].tasks['pull']['requests']['pending'].copy()
-                    msg = ''
-                    if len(pull_requests) > 1:
-                        msg = 's'
-                    logger.debug(f'Got refresh request{msg}'
-                                    + ' (id{0}={1})'.format(msg, '|'.join(pull_requests)) 
-                                    + ' for git pull informations.')
-                    # Immediatly send back latest request proceed so watcher can remove all the already proceed
-                    # requests
-                    self.mygit['watcher'].tasks['pull']['requests']['completed'] = pull_requests[-1]
-                    # TEST Don't recompute here
-                    self.mygit['manager'].pull['recompute'] = False
-                    self.mygit['manager'].check_pull()
-                    self.mygit['manager'].get_all_kernel()
-                    self.mygit['manager'].get_branch('remote')
-                    self.mygit['manager'].update = False
-                # Other git repo related request(s)
-                if self.mygit['watcher'].tasks['repo']['requests']['pending'] \
-                    and not self.mygit['watcher'].repo_read:
-                    # Same here as well
-                    repo_requests = self.mygit['watcher'].tasks['repo']['requests']['pending'].copy()
-                    msg = ''
-                    if len(repo_requests) > 1:
-                        msg = 's'
-                    logger.debug(f'Got refresh request{msg}'
-                                    + ' (id{0}={1})'.format(msg, '|'.join(repo_requests)) 
-                                    + ' for git repo informations.')
-                    # Same here send back latest request id (know here)
-                    self.mygit['watcher'].tasks['repo']['requests']['completed'] = repo_requests[-1]
-                    self.mygit['manager'].get_branch('local')
-                    self.mygit['manager'].get_available_update('branch')
-                    # Other wise let's modules related handle this
-                    # by using update_installed_kernel()
-                    if not self.mygit['watcher'].tasks['mod']['requests']['pending']:
-                        self.mygit['manager'].get_available_update('kernel')
-                    self.mygit['manager'].update = False
-                # For '/lib/modules/' related request (installed kernel)
-                if self.mygit['watcher'].tasks['mod']['requests']['pending'] \
-                    and not self.mygit['watcher'].mod_read:
-                    # Also here
-                    mod_requests = self.mygit['watcher'].tasks['mod']['requests']['pending'].copy()
-                    msg = ''
-                    if len(mod_requests) > 1:
-                        msg = 's'
-                    logger.debug(f'Got refresh request{msg}'
-                                    + ' (id{0}={1})'.format(msg, '|'.join(mod_requests)) 
-                                    + ' for modules informations.')
-                    if self.mygit['watcher'].tasks['mod']['created']:
-                        logger.debug('Found created: {0}'.format(' '.join(
-                                                            self.mygit['watcher'].tasks['mod']['created'])))
-                    if self.mygit['watcher'].tasks['mod']['deleted']:
-                        logger.debug('Found deleted: {0}'.format(' '.join(
-                                                            self.mygit['watcher'].tasks['mod']['deleted'])))
-                    # Any way pass every thing to update_installed_kernel()
-                    self.mygit['manager'].update_installed_kernel(
-                                                deleted=self.mygit['watcher'].tasks['mod']['deleted'],
-                                                added=self.mygit['watcher'].tasks['mod']['created'])
-                    # Wait until update_installed_kernel() otherwise watcher will erase 'deleted' and
-                    # 'created'...
-                    self.mygit['watcher'].tasks['mod']['requests']['completed'] = mod_requests[-1]
-                    self.mygit['manager'].get_available_update('kernel')
-                    self.mygit['manager'].update = False
-            else:
-                if self.mygit['manager'].remain <= 0:
-                    # TODO : lower  this to have more sensibility ?
-                    self.mygit['manager'].remain = 30
-                    self.mygit['manager'].update = True
-                self.mygit['manager'].remain -= 1
-            # pull
-            if self.mygit['manager'].pull['remain'] <= 0 and not self.mygit['manager'].pull['status'] \
-                and not self.mygit['watcher'].tasks['pull']['inprogress']:
-                # TEST recompute here
-                self.mygit['manager'].pull['recompute'] = True
-                # Is an external git command in progress ? / recompute remain / bypass if network problem
-                if self.mygit['manager'].check_pull():
-                    # Pull async and non blocking 
-                    self.scheduler.run_in_executor(None, self.mygit['manager'].dopull, ) # -> ', )' = same here
-            self.mygit['manager'].pull['remain'] -= 1
-            self.mygit['manager'].pull['elapsed'] += 1
-            
-            time.sleep(1)
+    def start(self):
+        logger = logging.getLogger(f'{self.logger_name}start::')
+        for fd, handler in self.watcher.sources():
+            GLib.io_add_watch(fd, GLib.PRIORITY_DEFAULT, GLib.IO_IN, self.__on_readable, handler)
+        # Called on schedule() / notify(), could be from worker thread (idle_add() is thread safe)
+        self.scheduler.waker = self.wakeup
+        self.wakeup()
+        logger.info('Start up completed (single loop).')
+    
+    def wakeup(self):
+        if not self.queued:
+            self.queued = True
+            GLib.idle_add(self.__dispatch)
+    
+    def __on_readable(self, fd, condition, handler):
+        handler()
+        self.__arm_burst()
+        return True
+    
+    def __arm_burst(self):
+        """(Re)arm watcher burst timeout"""
+        if self.burst_id is not None:
+            GLib.source_remove(self.burst_id)
+            self.burst_id = None
+        timeout = self.watcher.burst_timeout()
+        if timeout is not None:
+            self.burst_id = GLib.timeout_add(math.ceil(timeout * 1000), self.__on_burst)
+    
+    def __on_burst(self):
+        self.burst_id = None
+        self.watcher.flush_due()
+        self.__arm_burst()
+        return False
+    
+    def __dispatch(self):
+        self.queued = False
+        self.daemon.handle(self.scheduler.pop_due())
+        # Re-arm next deadline
+        if self.deadline_id is not None:
+            GLib.source_remove(self.deadline_id)
+        self.deadline_id = GLib.timeout_add(math.ceil(self.scheduler.next_timeout() * 1000), 
+                                            self.__on_deadline)
+        return False
+    
+    def __on_deadline(self):
+        self.deadline_id = None
+        self.__dispatch()
+        return False
 
 
 
 
-def main():
-    """
-    Main init
-    """
+def repo_pathdir(name, repo):
+    """Return pathdir for repository 'repo': state file and git log are per repository (if named)"""
+    mypathdir = dict(pathdir, repo=repo, name=name)
+    if name:
+        mypathdir['statelog'] = '{0}/state-{1}.info'.format(pathdir['basedir'], name)
+        mypathdir['gitlog'] = '{0}/git-{1}.log'.format(pathdir['logdir'], name)
+    return mypathdir
+
+
+def repo_object_path(name):
+    """Return dbus object path for repository 'name' (unnamed one keep the historical path)"""
+    if name:
+        return f'/net/gikeud/Manager/Git/{name}'
+    return '/net/gikeud/Manager/Git'
+
+
+def init_repo(name, repo, executor):
+    """Init watcher, manager and main daemon for one repository and return mygit dict"""
     
-    # Init dbus service
-    dbusloop = GLib.MainLoop()
-    dbus_session = SystemBus()
-                   
+    mypathdir = repo_pathdir(name, repo)
     # Init git watcher first so we can get pull (external) running status
-    mygitwatcher = GitWatcher(pathdir, name='Git Watcher Daemon', daemon=True)
+    # Watcher thread put request(s) here and wake up main daemon thread
+    # which sleep on scheduler (shared with manager for pull deadlines)
+    scheduler = Scheduler()
+    # Producer and consumer are the same thread in single loop mode: never wait for room
+    channel = RequestChannel(notify=scheduler.notify, timeout=0 if args.single_loop else 5)
+    suffix = f' ({name})' if name else ''
+    mygitwatcher = GitWatcher(mypathdir, channel.put, name=f'Git Watcher Daemon{suffix}', daemon=True,
+                              debounce=args.debounce, fetch_only=args.fetch_only)
     
     # Init gitmanager object through GitDbus class
-    mygitmanager = GitDbus(interval=args.pull, pathdir=pathdir)
+    # Pull(s) run in the executor shared by all repositories
+    mygitmanager = GitDbus(interval=args.pull, pathdir=mypathdir, state_delay=args.state_delay,
+                           state_backend=args.state_backend, scheduler=scheduler,
+                           watcher=mygitwatcher, pull_timeout=args.pull_timeout,
+                           fetch_only=args.fetch_only, probe=args.probe, executor=executor,
+                           profile=args.profile[name])
             
     # Get running kernel
     mygitmanager.get_running_kernel()
@@ -237,22 +214,54 @@ def main():
         
     # Adding objects to manager
     mygit = { }
+    mygit['name'] = name
     mygit['manager'] = mygitmanager
     mygit['watcher'] = mygitwatcher
+    mygit['daemon'] = MainDaemon(mygit, channel, name=f'Main Daemon Thread{suffix}', daemon=True)
+    return mygit
+
+
+def main():
+    """
+    Main init
+    """
+    
+    # Init dbus service
+    dbusloop = GLib.MainLoop()
+    dbus_session = SystemBus()
+    
+    # Bound concurrent git pull(s) across all repositories
+    executor = ThreadPoolExecutor(max_workers=args.pull_jobs, thread_name_prefix='git-pull')
+    repos = [ init_repo(name, repo, executor) for name, repo in args.repo ]
         
-    # Adding dbus publisher
-    dbus_session.publish('net.gikeud.Manager.Git', mygitmanager)
-        
-    # Init thread
-    daemon_thread = MainDaemon(mygit, name='Main Daemon Thread', daemon=True)
+    # Adding dbus publisher: one object path per repository
+    dbus_session.publish('net.gikeud.Manager.Git', *[ (repo_object_path(mygit['name']), mygit['manager'])
+                                                      for mygit in repos ])
     
-    # Start all threads and dbus thread
-    mygit['watcher'].start()
-    daemon_thread.start()
-    dbusloop.run()
+    # Exit gracefully on SIGTERM: stop loop then flush pending state file write(s)
+    def on_sigterm():
+        logger = logging.getLogger(f'::{__name__}::main::on_sigterm::')
+        logger.info('Got SIGTERM, exiting.')
+        dbusloop.quit()
+        return False
+    GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGTERM, on_sigterm)
     
-    daemon_thread.join()
-    mygit['watcher'].join()
+    # Start all threads and dbus thread
+    for mygit in repos:
+        if args.single_loop:
+            # Watcher and main daemon run inside dbus loop (threads are not started)
+            SingleLoop(mygit['daemon'], mygit['watcher']).start()
+        else:
+            mygit['watcher'].start()
+            mygit['daemon'].start()
+    try:
+        dbusloop.run()
+    finally:
+        # Threads are daemon: they stop with the main thread
+        for mygit in repos:
+            mygit['manager'].stateinfo.flush()
+            # Stop persistent git process
+            mygit['manager'].backend.close()
        
     
 if __name__ == '__main__':
@@ -261,9 +270,6 @@ if __name__ == '__main__':
     myargsparser = DaemonParserHandler(pathdir, __version__)
     args = myargsparser.parsing()
     
-    # Add repo to pathdid
-    pathdir['repo'] = args.repo
-    
     # Check or create basedir and logdir directories
     # Print to stderr as we have a redirect for init run 
     for directory in 'basedir', 'logdir':
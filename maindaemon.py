@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+import threading
+import logging
+
+
+class MainDaemon(threading.Thread):
+    def __init__(self, mygit, channel, *args, **kwargs):
+        self.logger_name = f'::{__name__}::MainDaemonThread::' + (f"{mygit['name']}::" 
+                                                                   if mygit['name'] else '')
+        logger = logging.getLogger(f'{self.logger_name}init::')
+        super().__init__(*args, **kwargs)
+        self.mygit = mygit
+        # Request(s) from GitWatcher
+        self.channel = channel
+        # Deadlines for 'pull', 'retry', 'probe' and 'refresh' jobs
+        self.scheduler = self.mygit['manager'].scheduler
+    
+    def run(self):
+        logger = logging.getLogger(f'{self.logger_name}run::')
+        logger.info('Start up completed.')
+        while True:
+            # Sleep until next deadline or watcher event
+            self.handle(self.scheduler.wait())
+    
+    def handle(self, due):
+        """
+        Process pending request(s) and due job(s) (list of name).
+        Called from run() or from the GLib loop (see SingleLoop).
+        """
+        logger = logging.getLogger(f'{self.logger_name}handle::')
+        # Pull state change(s) queued by the pull worker (see GitHandler.dispatch())
+        self.mygit['manager'].run_pending()
+        # Request(s) are already packed together by the channel
+        self.__process(self.channel.take())
+        running = self.mygit['manager'].pull['status'] or self.mygit['manager'].pull_state
+        if 'probe' in due:
+            self.scheduler.schedule('probe', self.mygit['manager'].pull['probe'])
+            # Cheap: only ref(s) advertisement, pull only if something changed
+            if not running:
+                self.mygit['manager'].jobs.submit('probe')
+        if not 'pull' in due and not 'retry' in due:
+            return
+        logger.debug('Due job(s): {0}.'.format(', '.join(due)))
+        # pull
+        if running:
+            # Running (internal or external): finished pull will reschedule
+            logger.debug('Git pull already in progress, postponing.')
+            self.scheduler.schedule('pull', 60)
+            return
+        if self.mygit['manager'].pull['state'] == 'Failed' and not self.mygit['manager'].pull['network_error']:
+            # dopull() would skip it anyway: wait until error is reset (see reset_pull_error())
+            logger.debug('Git pull state is Failed (not a network error), postponing.')
+            self.scheduler.schedule('pull', self.mygit['manager'].pull['interval'])
+            return
+        # TEST recompute here
+        self.mygit['manager'].pull['recompute'] = True
+        # Is an external git command in progress ? / recompute remain / bypass if network problem
+        # (only when 'retry' is due: otherwise retry backoff would be ignored)
+        if self.mygit['manager'].check_pull(retry='retry' in due):
+            # Pull async and non blocking (job manager notify the scheduler when finished)
+            self.mygit['manager'].jobs.submit('schedule')
+            # Deadline is overdue: move it forward (finished pull will reschedule)
+            # otherwise it would be due again right away while job is queued / running
+            self.scheduler.schedule('pull', self.mygit['manager'].pull['interval'])
+        elif not self.scheduler.scheduled('pull'):
+            # Couldn't get last pull (repository problem ?): try again later
+            self.scheduler.schedule('pull', 60)
+    
+    def __process(self, requests):
+        """Refresh informations for pending request(s)"""
+        logger = logging.getLogger(f'{self.logger_name}__process::')
+        # External (or internal) git pull is running
+        self.mygit['manager'].pull_state = requests.running
+        if requests.sequence['pull_started']:
+            self.channel.ack('pull_started', requests.sequence['pull_started'])
+        # Only what changed is refreshed (see lib/gitevents.py)
+        refresh = { kind for kind in ('local', 'remote', 'kernel') if requests.sequence[kind] }
+        # pull have been run, request refresh (wait until internal pull finished)
+        if requests.sequence['pull'] and (self.mygit['manager'].pull['status'] 
+                                          or self.mygit['manager'].pull_state):
+            # Come back when it's finished (not acknowledged: still pending)
+            self.scheduler.schedule('refresh', 1)
+        elif requests.sequence['pull']:
+            logger.debug('Got refresh request for git pull informations.')
+            # TEST Don't recompute here
+            self.mygit['manager'].pull['recompute'] = False
+            self.mygit['manager'].check_pull()
+            # Only ref(s) added or removed since last pull (tag(s) / branch(es) event(s) from the same pull are covered)
+            refreshed = self.mygit['manager'].refresh_from_fetch()
+            if refreshed is None:
+                # Make sure everything pulled is known
+                refresh.update(('remote', 'kernel'))
+            else:
+                refresh.difference_update(('remote', 'kernel'))
+                if 'kernel' in refreshed and not requests.sequence['mod']:
+                    self.mygit['manager'].get_available_update('kernel')
+                if 'remote' in refreshed and not 'local' in refresh:
+                    self.mygit['manager'].get_available_update('branch')
+            self.channel.ack('pull', requests.sequence['pull'])
+        # Other git repo related request(s)
+        if refresh:
+            logger.debug('Got refresh request for git {0} informations.'.format(', '.join(sorted(refresh))))
+        if 'kernel' in refresh:
+            self.mygit['manager'].get_all_kernel()
+            # Other wise let's modules related handle this
+            # by using update_installed_kernel()
+            if not requests.sequence['mod']:
+                self.mygit['manager'].get_available_update('kernel')
+        if 'local' in refresh and 'remote' in refresh:
+            self.mygit['manager'].get_branch('all')
+        elif 'local' in refresh:
+            self.mygit['manager'].get_branch('local')
+        elif 'remote' in refresh:
+            self.mygit['manager'].get_branch('remote')
+        if 'local' in refresh or 'remote' in refresh:
+            self.mygit['manager'].get_available_update('branch')
+        for kind in 'local', 'remote', 'kernel':
+            if requests.sequence[kind]:
+                self.channel.ack(kind, requests.sequence[kind])
+        # For '/lib/modules/' related request (installed kernel)
+        if requests.sequence['mod']:
+            logger.debug('Got refresh request for modules informations.')
+            if requests.overflow:
+                # Names have been dropped: rescan everything
+                self.mygit['manager'].get_installed_kernel()
+            else:
+                if requests.created:
+                    logger.debug('Found created: {0}'.format(' '.join(requests.created)))
+                if requests.deleted:
+                    logger.debug('Found deleted: {0}'.format(' '.join(requests.deleted)))
+                # Any way pass every thing to update_installed_kernel()
+                self.mygit['manager'].update_installed_kernel(deleted=requests.deleted,
+                                                              added=requests.created)
+            self.mygit['manager'].get_available_update('kernel')
+            self.channel.ack('mod', requests.sequence['mod'])
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+import time
+import threading
+import itertools
+import logging
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from gitbackend import GitBackend
+
+
+class PullJob:
+    """One git pull request"""
+    def __init__(self, job_id, trigger):
+        self.id = job_id
+        # 'schedule', 'dbus' or 'probe'
+        self.trigger = trigger
+        # 'queued', 'running', 'cancelled', 'unchanged' (probe found nothing new)
+        # or dopull() result ('success', 'network', 'timeout', 'failed', 'skipped')
+        self.state = 'queued'
+        # Probe remote first: pull only if something changed (False as soon as
+        # another trigger is merged)
+        self.probe = trigger == 'probe'
+        self.created = time.time()
+        self.started = 0
+        self.finished = 0
+        self.future = None
+        self.process = None
+        # Number of trigger(s) merged into this job
+        self.triggers = 1
+
+    @property
+    def active(self):
+        return self.state in ('queued', 'running')
+
+    def attach(self, process):
+        """Called from GitBackend.run() when git is started"""
+        self.process = process
+
+    def to_dict(self):
+        return {
+            'id'        :   self.id,
+            'trigger'   :   self.trigger,
+            'state'     :   self.state,
+            'triggers'  :   str(self.triggers),
+            'created'   :   str(round(self.created)),
+            'started'   :   str(round(self.started)),
+            'finished'  :   str(round(self.finished))
+            }
+
+
+
+class PullJobManager:
+    """
+    Run git pull job(s) one at a time in a dedicated (or shared) executor.
+    A new trigger while a job is queued or running is merged into it,
+    git is killed after 'timeout' seconds.
+    """
+    def __init__(self, dopull, timeout=None, history=16, notify=None, probe=None, executor=None):
+        """
+        dopull: callable(timeout=, on_start=, cancelled=) returning the result (see PullJob.state),
+        cancelled() return True once the job have been cancelled (git killed on purpose).
+        notify: called (from worker thread) when a job finished.
+        probe: callable(timeout=, on_start=) returning 'changed', 'unchanged' or 'failed',
+        run first for 'probe' trigger.
+        executor: shared by several repositories (bound the number of concurrent pull).
+        """
+        self.logger_name = f'::{__name__}::PullJobManager::'
+        self.dopull = dopull
+        self.probe = probe
+        self.timeout = timeout
+        self.notify = notify
+        self.lock = threading.Lock()
+        # Only one pull at a time per repository (see submit()), so only one worker by default
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='git-pull')
+        self.counter = itertools.count(1)
+        # Latest job(s), oldest are forgotten
+        self.jobs = OrderedDict()
+        self.history = history
+        self.current = None
+
+
+    def submit(self, trigger):
+        """Return new PullJob, or the already queued / running one"""
+        logger = logging.getLogger(f'{self.logger_name}submit::')
+
+        with self.lock:
+            if self.current is not None and self.current.active:
+                self.current.triggers += 1
+                # Any other trigger want a real pull
+                self.current.probe = self.current.probe and trigger == 'probe'
+                logger.debug(f'Merging \'{trigger}\' trigger into job {self.current.id}'
+                             + f' ({self.current.state}).')
+                return self.current
+            job = PullJob(f'{next(self.counter)}', trigger)
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.history:
+                self.jobs.popitem(last=False)
+            self.current = job
+            job.future = self.executor.submit(self.__run, job)
+        logger.debug(f'Job {job.id} queued (trigger: {trigger}).')
+        return job
+
+
+    def get(self, job_id):
+        """Return PullJob or None if unknown"""
+        with self.lock:
+            return self.jobs.get(job_id)
+
+
+    def cancel(self, job_id):
+        """Cancel queued job or kill running git process, return True on success"""
+        logger = logging.getLogger(f'{self.logger_name}cancel::')
+
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or not job.active:
+                return False
+            if job.future.cancel():
+                job.state = 'cancelled'
+                job.finished = time.time()
+            elif job.process is not None and job.process.poll() is None:
+                # dopull() will report it as cancelled (see cancelled())
+                job.state = 'cancelled'
+                GitBackend.kill(job.process)
+            else:
+                return False
+        logger.warning(f'Job {job_id} cancelled.')
+        return True
+
+
+    @property
+    def running(self):
+        with self.lock:
+            return self.current is not None and self.current.state == 'running'
+
+
+    def __run(self, job):
+        logger = logging.getLogger(f'{self.logger_name}__run::')
+
+        with self.lock:
+            job.state = 'running'
+            job.started = time.time()
+        result = None
+        try:
+            if job.probe and self.probe is not None:
+                result = self.probe(timeout=self.timeout, on_start=job.attach)
+            with self.lock:
+                # Pull if something changed or if another trigger have been merged meanwhile
+                skip = job.state == 'cancelled' or (result in ('unchanged', 'failed') and job.probe)
+            if not skip:
+                result = self.dopull(timeout=self.timeout, on_start=job.attach,
+                                     cancelled=lambda: job.state == 'cancelled')
+        except Exception as exc:
+            logger.error(f'Got unexcept error while running job {job.id}: {exc}.')
+            result = 'failed'
+        with self.lock:
+            if not job.state == 'cancelled':
+                job.state = result
+            job.finished = time.time()
+            job.process = None
+        logger.debug(f'Job {job.id} finished: {job.state}.')
+        if self.notify:
+            self.notify()
+        return job.state
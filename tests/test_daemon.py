@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from gitmanager import GitHandler
+from maindaemon import MainDaemon
+from lib.channel import RequestChannel
+from tests.test_probe import git
+from tests.test_probe import _env
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git not found')
+class HandleTest(unittest.TestCase):
+    """MainDaemon.handle() with an overdue 'pull' deadline"""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='gikeud-test-')
+        self.remote = os.path.join(self.tmpdir, 'remote.git')
+        self.clone = os.path.join(self.tmpdir, 'clone')
+        git(self.tmpdir, 'init', '-q', '--bare', self.remote)
+        git(self.tmpdir, 'clone', '-q', f'file://{self.remote}', self.clone)
+        git(self.clone, 'commit', '-q', '--allow-empty', '-m', 'init')
+        git(self.clone, 'push', '-q', 'origin', 'HEAD:refs/heads/5.6/master')
+        git(self.clone, 'fetch', '-q')
+        # Last pull one day ago, interval is one hour: pull is overdue
+        fetch_head = os.path.join(self.clone, '.git', 'FETCH_HEAD')
+        past = time.time() - 86400
+        os.utime(fetch_head, (past, past))
+        self.saved_env = dict(os.environ)
+        os.environ.update(_env)
+        self.handler = GitHandler(interval=3600, pathdir={
+            'repo'          :   self.clone + '/',
+            'statelog'      :   os.path.join(self.tmpdir, 'state.info'),
+            'gitlog'        :   os.path.join(self.tmpdir, 'git.log'),
+            'prog_name'     :   'gikeud',
+            'prog_version'  :   'test'
+            })
+        # Record submitted trigger(s), nothing is run
+        self.submitted = [ ]
+        self.handler.jobs.submit = self.submitted.append
+        self.daemon = MainDaemon({ 'name' : '', 'manager' : self.handler }, RequestChannel())
+
+    def tearDown(self):
+        self.handler.backend.close()
+        self.handler.stateinfo.flush()
+        os.environ.clear()
+        os.environ.update(self.saved_env)
+        shutil.rmtree(self.tmpdir)
+
+    def drive(self, seconds=0.5):
+        """Call handle() like the daemon loop for 'seconds' (without sleeping)"""
+        scheduler = self.daemon.scheduler
+        scheduler.schedule('pull', 0)
+        calls = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            due = scheduler.pop_due()
+            if due:
+                self.daemon.handle(due)
+                calls += 1
+        return calls
+
+    def test_overdue_submit_once(self):
+        self.assertEqual(self.drive(), 1)
+        self.assertEqual(self.submitted, [ 'schedule' ])
+        self.assertGreater(self.daemon.scheduler.remain('pull'), 0)
+
+    def test_network_error_wait_retry(self):
+        self.handler.pull['state'] = 'Failed'
+        self.handler.pull['network_error'] = '1'
+        self.handler.pull['retry'] = 1
+        self.assertEqual(self.drive(), 1)
+        self.assertEqual(self.submitted, [ 'schedule' ])
+        # Remain is bypassed only when 'retry' is due
+        self.daemon.scheduler.schedule('pull', 10)
+        self.assertFalse(self.handler.check_pull())
+        self.assertTrue(self.handler.check_pull(retry=True))
+
+    def test_failed_never_submit(self):
+        # Not a network error: wait until error is reset
+        self.handler.pull['state'] = 'Failed'
+        self.handler.pull['network_error'] = 0
+        self.assertEqual(self.drive(), 1)
+        self.assertEqual(self.submitted, [ ])
+        self.assertGreater(self.daemon.scheduler.remain('pull'), 0)
+
+    def test_skipped_pull_reschedule(self):
+        self.handler.pull['state'] = 'Failed'
+        self.handler.pull['network_error'] = 0
+        self.daemon.scheduler.schedule('pull', 0)
+        self.assertEqual(self.handler.dopull(), 'skipped')
+        self.assertGreater(self.daemon.scheduler.remain('pull'), 3000)
+
+    def test_pull_job_owner_thread(self):
+        # Worker only run git: state is changed once run_pending() is called
+        # (clone has no upstream branch)
+        self.handler.pull['fetch_only'] = True
+        self.assertEqual(self.handler.pull_job(), 'success')
+        self.assertEqual(self.handler.pull['count'], 0)
+        self.assertFalse(self.handler.pull['status'])
+        self.handler.run_pending()
+        self.assertEqual(self.handler.pull['count'], 1)
+        self.assertEqual(self.handler.pull['state'], 'Success')
+        self.assertGreater(self.daemon.scheduler.remain('pull'), 3000)
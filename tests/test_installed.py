@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from gitmanager import GitHandler
+from lib.version import VersionSet
+from tests.test_probe import git
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git not found')
+class InstalledKernelTest(unittest.TestCase):
+    """GitHandler.update_installed_kernel(): several '/lib/modules/' folder(s) per version"""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='gikeud-test-')
+        self.repo = os.path.join(self.tmpdir, 'repo')
+        git(self.tmpdir, 'init', '-q', self.repo)
+        git(self.repo, 'remote', 'add', 'origin', f'file://{self.tmpdir}/remote.git')
+        self.handler = GitHandler(interval=3600, pathdir={
+            'repo'          :   self.repo + '/',
+            'statelog'      :   os.path.join(self.tmpdir, 'state.info'),
+            'gitlog'        :   os.path.join(self.tmpdir, 'git.log'),
+            'prog_name'     :   'gikeud',
+            'prog_version'  :   'test'
+            })
+        # Same as get_installed_kernel() scanning these folder(s)
+        self.handler.installed_folders = {
+            '5.6.1-zen1'    :   '5.6.1',
+            '5.6.1-zen2'    :   '5.6.1',
+            '5.7.2-zen1'    :   '5.7.2'
+            }
+        self.handler.kernel['installed']['all'] = VersionSet([ '5.6.1', '5.7.2' ])
+
+    def tearDown(self):
+        self.handler.backend.close()
+        self.handler.stateinfo.flush()
+        shutil.rmtree(self.tmpdir)
+
+    def installed(self):
+        return str(self.handler.kernel['installed']['all'])
+
+    def test_keep_version_still_installed(self):
+        self.handler.update_installed_kernel(deleted=[ '5.6.1-zen1' ])
+        self.assertEqual(self.installed(), '5.6.1 5.7.2')
+        self.handler.update_installed_kernel(deleted=[ '5.6.1-zen2' ])
+        self.assertEqual(self.installed(), '5.7.2')
+
+    def test_add_then_delete(self):
+        self.handler.update_installed_kernel(added=[ '5.8.0-zen1' ])
+        self.assertEqual(self.installed(), '5.6.1 5.7.2 5.8.0')
+        self.handler.update_installed_kernel(deleted=[ '5.8.0-zen1', '5.7.2-zen1' ])
+        self.assertEqual(self.installed(), '5.6.1')
+
+    def test_last_folder_deleted(self):
+        self.handler.update_installed_kernel(deleted=[ '5.6.1-zen1', '5.6.1-zen2', '5.7.2-zen1' ])
+        self.assertEqual(self.installed(), '0.0')
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+# Copyright © 2019,2020: Venturi Jérôme : jerome dot Venturi at gmail dot com
+# Distributed under the terms of the GNU General Public License v3
+
+import os
+import shutil
+import tempfile
+import threading
+import subprocess
+import unittest
+
+from gitmanager import GitHandler
+from pulljob import PullJobManager
+
+
+_env = dict(os.environ, GIT_AUTHOR_NAME='gikeud', GIT_AUTHOR_EMAIL='gikeud@localhost',
+            GIT_COMMITTER_NAME='gikeud', GIT_COMMITTER_EMAIL='gikeud@localhost',
+            GIT_CONFIG_NOSYSTEM='1', HOME=tempfile.gettempdir())
+
+
+def git(cwd, *args):
+    return subprocess.run(['git', *args], cwd=cwd, env=_env, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True).stdout
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git not found')
+class ProbeTest(unittest.TestCase):
+    """GitHandler.probe() against a local 'file://' bare remote"""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='gikeud-test-')
+        self.remote = os.path.join(self.tmpdir, 'remote.git')
+        self.work = os.path.join(self.tmpdir, 'work')
+        self.clone = os.path.join(self.tmpdir, 'clone')
+        git(self.tmpdir, 'init', '-q', '--bare', self.remote)
+        git(self.tmpdir, 'init', '-q', self.work)
+        git(self.work, 'commit', '-q', '--allow-empty', '-m', 'init')
+        git(self.work, 'tag', 'v5.6.1-zen1')
+        git(self.work, 'push', '-q', f'file://{self.remote}', 'HEAD:refs/heads/5.6/master', 'v5.6.1-zen1')
+        git(self.tmpdir, 'clone', '-q', '-b', '5.6/master', f'file://{self.remote}', self.clone)
+        # Environment is read by git process(es) spawned from GitHandler
+        self.saved_env = dict(os.environ)
+        os.environ.update(_env)
+        self.handler = GitHandler(interval=86400, pathdir={
+            'repo'          :   self.clone + '/',
+            'statelog'      :   os.path.join(self.tmpdir, 'state.info'),
+            'gitlog'        :   os.path.join(self.tmpdir, 'git.log'),
+            'prog_name'     :   'gikeud',
+            'prog_version'  :   'test'
+            })
+
+    def tearDown(self):
+        self.handler.backend.close()
+        self.handler.stateinfo.flush()
+        os.environ.clear()
+        os.environ.update(self.saved_env)
+        shutil.rmtree(self.tmpdir)
+
+    def push(self, *refs):
+        git(self.work, 'commit', '-q', '--allow-empty', '-m', 'update')
+        git(self.work, 'push', '-q', f'file://{self.remote}', *refs)
+
+    def test_branch_pushed(self):
+        self.assertEqual(self.handler.probe(), 'unchanged')
+        self.push('HEAD:refs/heads/5.7/master')
+        self.assertEqual(self.handler.probe(), 'changed')
+        self.assertEqual(self.handler.dopull(), 'success')
+        self.assertEqual(self.handler.probe(), 'unchanged')
+
+    def test_tag_pushed(self):
+        self.assertEqual(self.handler.probe(), 'unchanged')
+        git(self.work, 'tag', 'v5.6.2-zen1')
+        self.push('v5.6.2-zen1')
+        self.assertEqual(self.handler.probe(), 'changed')
+        self.assertEqual(self.handler.dopull(), 'success')
+        self.assertEqual(self.handler.probe(), 'unchanged')
+
+    def test_untracked_ref_pushed(self):
+        # Not fetched by the managed refspecs: nothing to pull
+        self.push('HEAD:refs/heads/feature')
+        self.assertEqual(self.handler.probe(), 'unchanged')
+
+
+
+class ProbeJobTest(unittest.TestCase):
+    """PullJobManager: 'probe' trigger merged with another trigger"""
+    def setUp(self):
+        self.probing = threading.Event()
+        self.release = threading.Event()
+        self.pulled = [ ]
+
+    def probe(self, timeout=None, on_start=None):
+        self.probing.set()
+        self.release.wait(5)
+        return 'unchanged'
+
+    def dopull(self, timeout=None, on_start=None, cancelled=None):
+        self.pulled.append(True)
+        return 'success'
+
+    def test_merged_dbus_trigger_pull(self):
+        manager = PullJobManager(self.dopull, probe=self.probe)
+        job = manager.submit('probe')
+        self.assertTrue(self.probing.wait(5))
+        self.assertIs(manager.submit('dbus'), job)
+        self.release.set()
+        self.assertEqual(job.future.result(5), 'success')
+        self.assertEqual(self.pulled, [ True ])
+        self.assertEqual(job.triggers, 2)
+
+    def test_probe_unchanged_skip_pull(self):
+        manager = PullJobManager(self.dopull, probe=self.probe)
+        self.release.set()
+        job = manager.submit('probe')
+        self.assertEqual(job.future.result(5), 'unchanged')
+        self.assertEqual(self.pulled, [ ])